@@ -0,0 +1,132 @@
+"""
+Pluggable inference backends.
+
+INFERENCE_BACKEND selects how the serving model is executed by default; a
+version in models.json can override it with its own "backend":
+  keras   - the traced TensorFlow function from inference.py (default)
+  tflite  - a TFLite flatbuffer (float32, float16 or int8) via the TFLite interpreter
+  onnx    - an ONNX graph via ONNX Runtime's CPU execution provider
+
+Exported models are produced by export_model.py next to the H5 file, e.g.
+plant_disease_1.int8.tflite. A version whose "path" is the H5 file serves the
+exporter's float32 <stem>.tflite or <stem>.onnx; to serve another variant, add
+a version whose "path" is that file, e.g.
+    "plant_disease_1_int8": {"path": "plant_disease_1.int8.tflite", "backend": "tflite", "classes": [...]}
+onnxruntime (and tf2onnx, for exporting) are optional installs only needed
+for the onnx backend. Every backend is a callable taking an (N, 256, 256, 3)
+float32 batch and returning (N, num_classes) probabilities.
+"""
+
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "keras").lower()
+BACKEND_NUM_THREADS = int(os.getenv("BACKEND_NUM_THREADS", str(os.cpu_count() or 1)))
+
+BACKENDS = ("keras", "tflite", "onnx")
+BACKEND_EXTENSIONS = {"tflite": ".tflite", "onnx": ".onnx"}
+IMAGE_SIZE = 256
+
+
+def backend_model_path(model_path: str, backend: str) -> str:
+    """Resolve the file a backend should load: the version's own path if it is
+    already an exported file, otherwise the exporter's naming scheme."""
+    extension = BACKEND_EXTENSIONS.get(backend)
+    if extension is None or model_path.lower().endswith(extension):
+        return model_path
+    return os.path.splitext(model_path)[0] + extension
+
+
+class _Backend:
+    num_classes = None
+    path = None
+
+    def warmup(self) -> float:
+        sample = np.zeros((1, IMAGE_SIZE, IMAGE_SIZE, 3), dtype=np.float32)
+        started = time.perf_counter()
+        self(sample)
+        elapsed = time.perf_counter() - started
+        logger.info(f"{type(self).__name__} warmed up in {elapsed:.2f}s")
+        return elapsed
+
+
+class TFLiteModel(_Backend):
+    """TFLite interpreter with a resizable batch dimension."""
+
+    def __init__(self, path: str, num_threads: int = BACKEND_NUM_THREADS):
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        self.path = path
+        self._interpreter = Interpreter(model_path=path, num_threads=num_threads)
+        self._interpreter.allocate_tensors()
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = int(self._input["shape"][0])
+        self.num_classes = int(self._output["shape"][-1])
+        # The interpreter owns mutable tensor buffers and is not thread-safe
+        self._lock = threading.Lock()
+
+    def __call__(self, img_batch: np.ndarray) -> np.ndarray:
+        with self._lock:
+            if img_batch.shape[0] != self._batch_size:
+                self._interpreter.resize_tensor_input(self._input["index"], img_batch.shape)
+                self._interpreter.allocate_tensors()
+                self._input = self._interpreter.get_input_details()[0]
+                self._output = self._interpreter.get_output_details()[0]
+                self._batch_size = img_batch.shape[0]
+
+            scale, zero_point = self._input["quantization"]
+            if self._input["dtype"] != np.float32 and scale:
+                img_batch = np.round(img_batch / scale + zero_point)
+            self._interpreter.set_tensor(self._input["index"], img_batch.astype(self._input["dtype"]))
+            self._interpreter.invoke()
+            output = self._interpreter.get_tensor(self._output["index"])
+
+            scale, zero_point = self._output["quantization"]
+            if self._output["dtype"] != np.float32 and scale:
+                output = (output.astype(np.float32) - zero_point) * scale
+            return output.astype(np.float32, copy=True)
+
+
+class OnnxModel(_Backend):
+    """ONNX Runtime session pinned to the CPU execution provider."""
+
+    def __init__(self, path: str, num_threads: int = BACKEND_NUM_THREADS):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.path = path
+        self._session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        self._input_name = self._session.get_inputs()[0].name
+        self.num_classes = int(self._session.get_outputs()[0].shape[-1])
+
+    def __call__(self, img_batch: np.ndarray) -> np.ndarray:
+        return self._session.run(None, {self._input_name: img_batch.astype(np.float32, copy=False)})[0]
+
+
+def load_backend(model_path: str, backend: str = INFERENCE_BACKEND, warmup: bool = True):
+    """Load the serving model with the configured backend."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown INFERENCE_BACKEND '{backend}', expected one of {', '.join(BACKENDS)}")
+    if backend == "keras":
+        from inference import load_inference_model
+        return load_inference_model(model_path, warmup=warmup)
+
+    path = backend_model_path(model_path, backend)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{backend} model not found at {path}; run export_model.py first")
+    model = TFLiteModel(path) if backend == "tflite" else OnnxModel(path)
+    logger.info(f"Loaded {backend} backend from {path}")
+    if warmup:
+        model.warmup()
+    return model
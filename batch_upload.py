@@ -0,0 +1,104 @@
+"""
+Helpers for /predict/batch: expanding multi-file and archive uploads into images.
+
+Partners upload survey folders either as many multipart files or as one
+zip/tar archive. Each image becomes a BatchItem; anything unreadable is kept
+as an item with an error so one bad file never fails the whole job.
+"""
+
+import os
+import tarfile
+import zipfile
+from dataclasses import dataclass
+from typing import Optional
+
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+# Whole multipart body of one /predict/batch request, archives included
+BATCH_MAX_UPLOAD_BYTES = int(os.getenv("BATCH_MAX_UPLOAD_BYTES", str(512 * 1024 * 1024)))
+# Decompressed image bytes one archive may expand to; the item cap alone would allow 500 x 10 MB in memory
+BATCH_MAX_EXPANDED_BYTES = int(os.getenv("BATCH_MAX_EXPANDED_BYTES", str(256 * 1024 * 1024)))
+BATCH_PREDICT_SIZE = int(os.getenv("BATCH_PREDICT_SIZE", "32"))
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp", ".tif", ".tiff")
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+@dataclass
+class BatchItem:
+    filename: str
+    data: Optional[bytes] = None
+    error: Optional[str] = None
+
+
+def is_archive(filename: str, content_type: str = None) -> bool:
+    name = (filename or "").lower()
+    if name.endswith(ARCHIVE_EXTENSIONS):
+        return True
+    return content_type in ("application/zip", "application/x-zip-compressed", "application/x-tar", "application/gzip")
+
+
+def _image_member(name: str) -> bool:
+    base = os.path.basename(name)
+    # Skip directories, macOS resource forks and other hidden files
+    return bool(base) and not base.startswith(".") and base.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def _too_large(items: list, name: str, size: int, expanded: int, max_bytes: int) -> bool:
+    """Record an error item if this member breaks the per-image or per-archive cap."""
+    if size > MAX_IMAGE_BYTES:
+        items.append(BatchItem(name, error="File size must be less than 10MB"))
+        return True
+    if expanded + size > max_bytes:
+        items.append(BatchItem(name, error=f"Archive expands to more than {max_bytes // (1024 * 1024)}MB of images"))
+        return True
+    return False
+
+
+def expand_archive(filename: str, fileobj, max_items: int = BATCH_MAX_ITEMS,
+                   max_bytes: int = BATCH_MAX_EXPANDED_BYTES) -> list:
+    """List the images inside a zip or tar archive read from a seekable file.
+
+    Sizes come from the archive's headers, so both caps are enforced before a
+    member is decompressed; once the archive's total is reached, the remaining
+    images are reported as errors instead of being read.
+    """
+    items, expanded = [], 0
+    fileobj.seek(0)
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not _image_member(info.filename):
+                    continue
+                if len(items) >= max_items:
+                    break
+                # Reads stop at the header's file_size, so it bounds what decompression can produce
+                if _too_large(items, info.filename, info.file_size, expanded, max_bytes):
+                    continue
+                expanded += info.file_size
+                try:
+                    items.append(BatchItem(info.filename, data=archive.read(info)))
+                except Exception as e:
+                    items.append(BatchItem(info.filename, error=f"Could not extract file: {e}"))
+        return items
+
+    fileobj.seek(0)
+    try:
+        archive = tarfile.open(fileobj=fileobj, mode="r:*")
+    except tarfile.TarError:
+        return [BatchItem(filename, error="Unsupported or corrupt archive")]
+    with archive:
+        for member in archive:
+            if not member.isfile() or not _image_member(member.name):
+                continue
+            if len(items) >= max_items:
+                break
+            if _too_large(items, member.name, member.size, expanded, max_bytes):
+                continue
+            expanded += member.size
+            try:
+                items.append(BatchItem(member.name, data=archive.extractfile(member).read()))
+            except Exception as e:
+                items.append(BatchItem(member.name, error=f"Could not extract file: {e}"))
+    return items
@@ -0,0 +1,176 @@
+"""
+Dynamic micro-batching for model inference.
+
+Concurrent /predict calls submit single preprocessed images; a background
+worker gathers them into one batch (bounded by BATCH_MAX_SIZE and
+BATCH_MAX_WAIT_MS), runs a single forward pass and hands each caller its
+own row of the result.
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+import numpy as np
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "16"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+BATCH_MAX_QUEUE = int(os.getenv("BATCH_MAX_QUEUE", "256"))
+
+
+class QueueFullError(Exception):
+    """Raised when a request cannot be queued because the batcher is saturated."""
+
+
+class BatcherClosedError(Exception):
+    """Raised to callers whose request was queued or batched when the batcher stopped."""
+
+
+class MicroBatcher:
+    """Collects single-image requests into batches for one forward pass each."""
+
+    def __init__(self, predict_fn, max_batch_size=BATCH_MAX_SIZE,
+                 max_wait_ms=BATCH_MAX_WAIT_MS, max_queue=BATCH_MAX_QUEUE, runner=None):
+        # predict_fn takes an (N, H, W, C) array and returns (N, num_classes)
+        self.predict_fn = predict_fn
+        # runner(fn, images) is awaited to execute the forward pass off the event loop
+        self.runner = runner or self._run_in_default_executor
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_queue = max(1, int(max_queue))
+
+        self._queue = None
+        self._worker = None
+        self._collected = []  # the batch the worker is gathering or running
+
+        # Counters
+        self.requests_total = 0
+        self.rejected_total = 0
+        self.batches_total = 0
+        self.batched_items_total = 0
+        self.largest_batch = 0
+        self.wait_seconds_total = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _ensure_started(self):
+        if self._worker is not None and not self._worker.done():
+            return
+        loop = asyncio.get_running_loop()
+        if self._worker is not None:
+            if not self._worker.cancelled() and self._worker.exception() is not None:
+                logger.error(f"Batch worker died, restarting: {self._worker.exception()}")
+            self._fail(self._collected, BatcherClosedError("Batch worker stopped before running this request"))
+        # Requests already queued must reach the new worker; only a new event loop needs a new queue
+        if self._queue is None or self._worker is None or self._worker.get_loop() is not loop:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._worker = loop.create_task(self._run())
+
+    async def submit(self, image: np.ndarray) -> np.ndarray:
+        """Queue one preprocessed image and wait for its probability vector."""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((image, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.rejected_total += 1
+            raise QueueFullError("Inference queue is full")
+        self.requests_total += 1
+        return await future
+
+    @staticmethod
+    async def _run_in_default_executor(fn, images):
+        return await asyncio.get_running_loop().run_in_executor(None, fn, images)
+
+    async def _collect(self):
+        """Wait for the first item, then gather more until the batch is full or the wait expires."""
+        batch = self._collected = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Callers that went away (client disconnect) don't need a forward pass
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                waited = started - enqueued
+                self.wait_seconds_total += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            self.batches_total += 1
+            self.batched_items_total += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            metrics.BATCH_SIZE.observe(len(batch))
+
+            try:
+                images = np.stack([image for image, _, _ in batch])
+                predictions = await self.runner(self.predict_fn, images)
+                if len(predictions) != len(batch):
+                    # Rows can't be matched to callers if the model dropped or added any
+                    raise ValueError(f"Model returned {len(predictions)} rows for a batch of {len(batch)}")
+            except Exception as e:
+                logger.error(f"Batched prediction failed for {len(batch)} request(s): {e}")
+                self._fail(batch, e)
+                continue
+
+            for row, (_, future, _) in zip(predictions, batch):
+                if not future.done():
+                    future.set_result(row)
+
+    @staticmethod
+    def _fail(items, error: Exception):
+        for _, future, _ in items:
+            if not future.done():
+                future.set_exception(error)
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        # Nothing will run these any more; don't leave their callers waiting
+        error = BatcherClosedError("Inference batcher is shutting down")
+        self._fail(self._collected, error)
+        self._collected = []
+        while self._queue is not None and not self._queue.empty():
+            self._fail([self._queue.get_nowait()], error)
+
+    def stats(self) -> dict:
+        items = self.batched_items_total
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "max_queue": self.max_queue,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "requests_total": self.requests_total,
+            "rejected_total": self.rejected_total,
+            "batches_total": self.batches_total,
+            "batched_items_total": self.batched_items_total,
+            "largest_batch": self.largest_batch,
+            "avg_batch_size": round(items / self.batches_total, 2) if self.batches_total else 0.0,
+            "avg_wait_ms": round(self.wait_seconds_total / items * 1000.0, 3) if items else 0.0,
+            "max_wait_ms_observed": round(self.max_wait_seconds * 1000.0, 3),
+        }
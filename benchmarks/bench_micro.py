@@ -0,0 +1,97 @@
+"""
+Microbenchmarks for the stages of a /predict request.
+
+Usage: python benchmarks/bench_micro.py [--repeat 20] [--model plant_disease_1.h5]
+                                        [--batch-sizes 1,8,32] [--output micro.json]
+
+Covers read_file_as_image for every synthetic fixture size and format, single
+and batched forward passes, top-3 extraction, the disease lookup, the full
+response build (with and without ?full=1) and response serialization, both
+through FastAPI's jsonable_encoder path and through FastJSONResponse. Timings are median and p95 milliseconds after warmup; inputs
+come from fixed seeds so runs are comparable. --skip-model times only the
+CPU-side stages.
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from benchmarks.fixtures import FORMATS, SIZES, make_leaf_bytes  # noqa: E402
+from benchmarks.report import percentiles, result, time_samples, write_results  # noqa: E402
+
+
+def record(results: dict, name: str, samples: list, per_item: int = 1):
+    stats = percentiles([s / per_item for s in samples], (50, 95))
+    results[f"{name}.p50_ms"] = result(stats[50])
+    results[f"{name}.p95_ms"] = result(stats[95])
+    print(f"{name:<34}{stats[50]:>10.3f}{stats[95]:>10.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--model", default="plant_disease_1.h5")
+    parser.add_argument("--backend", default=None, help="Inference backend (default: INFERENCE_BACKEND)")
+    parser.add_argument("--batch-sizes", default="1,8,32")
+    parser.add_argument("--sizes", default=",".join(SIZES), help="Comma-separated fixture sizes to decode")
+    parser.add_argument("--skip-model", action="store_true", help="Don't load the model or time forward passes")
+    parser.add_argument("--output", help="Write machine-readable results to this JSON file")
+    args = parser.parse_args(argv)
+
+    import plantapi
+    from backends import INFERENCE_BACKEND, load_backend
+
+    results = {}
+    print(f"{'benchmark':<34}{'p50 ms':>10}{'p95 ms':>10}")
+
+    for size_name in args.sizes.split(","):
+        width, height = SIZES[size_name]
+        for fmt in FORMATS:
+            data = make_leaf_bytes(width, height, fmt)
+            record(results, f"decode.{size_name}.{fmt.lower()}",
+                   time_samples(plantapi.read_file_as_image, data, repeat=args.repeat))
+
+    if not args.skip_model:
+        backend = args.backend or INFERENCE_BACKEND
+        model = load_backend(args.model, backend)
+        image = plantapi.read_file_as_image(make_leaf_bytes(*SIZES["medium"]))
+        for batch_size in (int(b) for b in args.batch_sizes.split(",")):
+            batch = np.repeat(image[np.newaxis], batch_size, axis=0)
+            samples = time_samples(model, batch, repeat=args.repeat)
+            record(results, f"forward.{backend}.batch{batch_size}", samples)
+            # Per-image cost is what batching is supposed to reduce
+            record(results, f"forward.{backend}.batch{batch_size}.per_image", samples, per_item=batch_size)
+
+    rng = np.random.default_rng(0)
+    version = plantapi.MODEL_REGISTRY.active
+    probabilities = rng.dirichlet(np.ones(len(version.class_names))).astype(np.float32)
+    predicted_index = int(np.argmax(probabilities))
+    repeat = args.repeat * 50  # sub-millisecond stages need more samples to be stable
+    record(results, "top3", time_samples(lambda p: np.argsort(p)[-3:][::-1], probabilities, repeat=repeat))
+    record(results, "disease_lookup", time_samples(version.knowledge.describe, predicted_index, repeat=repeat))
+    record(results, "build_response", time_samples(plantapi.build_prediction_response, probabilities, version, repeat=repeat))
+    record(results, "build_response.full", time_samples(
+        lambda p: plantapi.build_prediction_response(p, version, full=True), probabilities, repeat=repeat))
+
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from fast_json import FastJSONResponse
+    for label, full in (("", False), (".full", True)):
+        body = plantapi.build_prediction_response(probabilities, version, full=full)
+        # jsonable_encoder can't take the numpy vector, so the default path pays for tolist() as well
+        record(results, f"serialize.jsonable_encoder{label}", time_samples(
+            lambda b: JSONResponse(jsonable_encoder({**b, "probabilities": b["probabilities"].tolist()} if full else b)),
+            body, repeat=repeat))
+        record(results, f"serialize.fast{label}", time_samples(FastJSONResponse, body, repeat=repeat))
+
+    if args.output:
+        write_results(args.output, "micro", results, vars(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+Parity check and benchmark for preprocessing.decode_image against the original decode path.
+
+Usage: python benchmarks/bench_preprocessing.py [--repeat 10] [--model plant_disease_1.h5]
+
+For each synthetic fixture size/format, reports ms per decode for both paths
+and the mean/max absolute pixel difference. With --model, also checks that
+the model's top-1 prediction is unchanged. Exits non-zero if parity fails.
+"""
+
+import argparse
+import os
+import sys
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from benchmarks.fixtures import FORMATS, SIZES, make_leaf_bytes  # noqa: E402
+from preprocessing import decode_image  # noqa: E402
+
+# Mean absolute pixel difference (0-255 scale) allowed between the two paths
+MAX_MEAN_PIXEL_DIFF = 2.0
+
+
+def legacy_read_file_as_image(data) -> np.ndarray:
+    """The decode path plantapi.py used before preprocessing.py."""
+    image = Image.open(BytesIO(data)).convert("RGB")
+    image = image.resize((256, 256))
+    return np.array(image, dtype=np.float32)
+
+
+def time_call(fn, data, repeat: int) -> float:
+    fn(data)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn(data)
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--model", help="Optional model path for a top-1 agreement check")
+    args = parser.parse_args(argv)
+
+    model = None
+    if args.model:
+        from backends import load_backend
+        model = load_backend(args.model, "keras")
+
+    failed = False
+    print(f"{'fixture':<14}{'legacy ms':>11}{'fast ms':>10}{'speedup':>9}{'mean diff':>11}{'max diff':>10}{'top1':>6}")
+    for size_name, (width, height) in SIZES.items():
+        for fmt in FORMATS:
+            data = make_leaf_bytes(width, height, fmt)
+            legacy = legacy_read_file_as_image(data)
+            fast = decode_image(data)
+            diff = np.abs(legacy - fast.astype(np.float32))
+            top1 = "-"
+            if model is not None:
+                same = np.argmax(model(legacy[np.newaxis])) == np.argmax(model(fast[np.newaxis]))
+                top1 = "ok" if same else "DIFF"
+                failed |= not same
+            failed |= diff.mean() > MAX_MEAN_PIXEL_DIFF or fast.dtype != np.uint8 or fast.shape != (256, 256, 3)
+
+            legacy_ms = time_call(legacy_read_file_as_image, data, args.repeat)
+            fast_ms = time_call(decode_image, data, args.repeat)
+            print(f"{size_name + ' ' + fmt.lower():<14}{legacy_ms:>11.2f}{fast_ms:>10.2f}{legacy_ms / fast_ms:>8.1f}x"
+                  f"{diff.mean():>11.3f}{diff.max():>10.1f}{top1:>6}")
+
+    print("parity: " + ("FAILED" if failed else "ok"))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""
+Replay recorded voice-assistant transcripts with and without local retrieval.
+
+Usage: python benchmarks/bench_voice_turns.py [--transcripts benchmarks/transcripts/voice_sessions.jsonl]
+                                              [--llm-ms 1000] [--repeat 20] [--verbose] [--output voice.json]
+
+Each transcript line is one conversation: {"id", "prediction", "turns": [user messages]}.
+"baseline" is the agent before plantsense_voice/retrieval.py: every turn goes to
+the LLM with the long static instructions. "retrieval" routes every turn through
+KnowledgeRouter: answered turns never reach the LLM, grounded turns carry only
+their snippets. Routing time is measured; LLM time is modeled as --llm-ms
+(time to first token) plus --prefill-ms per 1k prompt tokens, since a replay
+can't call the hosted model. Prompt tokens are estimated at 4 characters each,
+and an LLM reply adds --reply-tokens to the conversation history.
+"""
+
+import argparse
+import copy
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "plantsense_voice"))
+
+from benchmarks.report import percentiles, result, time_samples, write_results  # noqa: E402
+from retrieval import ASSISTANT_INSTRUCTIONS, KnowledgeRouter, load_index  # noqa: E402
+
+DEFAULT_TRANSCRIPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "transcripts", "voice_sessions.jsonl")
+
+# The Assistant's instructions before local retrieval, kept verbatim as the baseline prompt
+BASELINE_INSTRUCTIONS = """You are PlantSense Voice Assistant, a specialized AI for plant disease diagnosis and treatment.
+
+            Your capabilities:
+            - Help users identify plant diseases based on their descriptions
+            - Provide detailed treatment advice and remedies
+            - Answer questions about plant health, symptoms, and care
+            - Guide users through the diagnosis process
+
+            Your knowledge includes diseases for:
+            - Corn/Maize (Cercospora leaf spot, Common rust, Northern Leaf Blight)
+            - Potato (Early blight, Late blight)
+            - Tomato (Bacterial spot, Early blight, Late blight, Leaf Mold, Septoria leaf spot, Spider mites, Target Spot, Yellow Leaf Curl Virus, Mosaic virus)
+
+            Communication style:
+            - Be conversational, friendly, and empathetic
+            - Use clear, simple language without technical jargon unless necessary
+            - Keep responses concise and to the point
+            - No emojis, asterisks, or complex formatting in speech
+            - Ask clarifying questions when needed
+
+            When a user describes symptoms:
+            1. Ask about the plant type if not mentioned
+            2. Inquire about specific symptoms (leaf color, spots, wilting, etc.)
+            3. Provide your best diagnosis with confidence level
+            4. Offer treatment recommendations
+            5. Suggest preventive measures
+
+            Always be helpful and encouraging to farmers and plant enthusiasts."""
+
+
+def approx_tokens(text: str) -> int:
+    return max(1, round(len(text) / 4))
+
+
+def load_transcripts(path: str) -> list:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def llm_latency(prompt_tokens: int, args) -> float:
+    return args.llm_ms + prompt_tokens / 1000 * args.prefill_ms
+
+
+def replay_baseline(conversation: dict, args) -> list:
+    """(prompt_tokens, latency_ms) per turn when every turn goes to the LLM."""
+    history, turns = 0, []
+    for message in conversation["turns"]:
+        prompt = approx_tokens(BASELINE_INSTRUCTIONS) + history + approx_tokens(message)
+        turns.append((prompt, llm_latency(prompt, args)))
+        history += approx_tokens(message) + args.reply_tokens
+    return turns
+
+
+def scratch(router: KnowledgeRouter) -> KnowledgeRouter:
+    clone = copy.copy(router)
+    clone._spoken = set(router._spoken)
+    return clone
+
+
+def replay_retrieval(conversation: dict, index, args) -> list:
+    """(action, prompt_tokens, latency_ms, route_ms) per turn with KnowledgeRouter in front of the LLM."""
+    router = KnowledgeRouter(index, conversation.get("prediction"))
+    history, turns = 0, []
+    for message in conversation["turns"]:
+        # Time routing on copies of the conversation's router so repeats don't change its state
+        route_ms = float(np.median(time_samples(lambda: scratch(router).route(message), repeat=args.repeat)))
+        route = router.route(message)
+        if route.action == "answer":
+            turns.append((route.action, 0, route_ms, route_ms))
+            history += approx_tokens(message) + approx_tokens(route.answer)
+        else:
+            context = approx_tokens(route.context) if route.action == "ground" else 0
+            prompt = approx_tokens(ASSISTANT_INSTRUCTIONS) + history + context + approx_tokens(message)
+            turns.append((route.action, prompt, route_ms + llm_latency(prompt, args), route_ms))
+            # Injected snippets only accompany their own turn; they don't stay in the history
+            history += approx_tokens(message) + args.reply_tokens
+        if args.verbose:
+            print(f"  [{route.action:<6}] {route_ms:6.3f} ms  {message[:70]}")
+    return turns
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transcripts", default=DEFAULT_TRANSCRIPTS)
+    parser.add_argument("--llm-ms", type=float, default=1000.0, help="Modeled LLM time to first token")
+    parser.add_argument("--prefill-ms", type=float, default=100.0, help="Modeled LLM prefill time per 1k prompt tokens")
+    parser.add_argument("--reply-tokens", type=int, default=60, help="History added by each LLM reply")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed routing repetitions per turn")
+    parser.add_argument("--verbose", action="store_true", help="Print the route taken for every turn")
+    parser.add_argument("--output", help="Write machine-readable results to this JSON file")
+    args = parser.parse_args(argv)
+
+    conversations = load_transcripts(args.transcripts)
+    index = load_index()
+    baseline, routed = [], []
+    for conversation in conversations:
+        if args.verbose:
+            print(conversation["id"])
+        baseline += replay_baseline(conversation, args)
+        routed += replay_retrieval(conversation, index, args)
+
+    actions = [turn[0] for turn in routed]
+    baseline_latency = percentiles([latency for _, latency in baseline], (50, 95))
+    routed_latency = percentiles([turn[2] for turn in routed], (50, 95))
+    route_ms = percentiles([turn[3] for turn in routed], (50, 95))
+    results = {
+        "baseline.llm_calls": result(len(baseline), "count"),
+        "baseline.prompt_tokens": result(sum(prompt for prompt, _ in baseline), "tokens"),
+        "baseline.turn_mean_ms": result(np.mean([latency for _, latency in baseline])),
+        "baseline.turn_p50_ms": result(baseline_latency[50]),
+        "baseline.turn_p95_ms": result(baseline_latency[95]),
+        "retrieval.llm_calls": result(len(routed) - actions.count("answer"), "count"),
+        "retrieval.prompt_tokens": result(sum(turn[1] for turn in routed), "tokens"),
+        "retrieval.turn_mean_ms": result(np.mean([turn[2] for turn in routed])),
+        "retrieval.turn_p50_ms": result(routed_latency[50]),
+        "retrieval.turn_p95_ms": result(routed_latency[95]),
+        "retrieval.route_p50_ms": result(route_ms[50]),
+        "retrieval.route_p95_ms": result(route_ms[95]),
+        "retrieval.local_answer_ratio": result(actions.count("answer") / len(actions), "ratio", "higher"),
+        "retrieval.grounded_ratio": result(actions.count("ground") / len(actions), "ratio", "higher"),
+    }
+
+    print(f"{len(conversations)} conversations, {len(routed)} turns: "
+          f"{actions.count('answer')} answered locally, {actions.count('ground')} grounded, {actions.count('pass')} passed through")
+    print(f"{'':<12}{'LLM calls':>10}{'tokens':>10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for mode in ("baseline", "retrieval"):
+        row = [results[f"{mode}.{name}"]["value"] for name in ("llm_calls", "prompt_tokens", "turn_mean_ms", "turn_p50_ms", "turn_p95_ms")]
+        print(f"{mode:<12}{row[0]:>10.0f}{row[1]:>10.0f}{row[2]:>10.1f}{row[3]:>10.1f}{row[4]:>10.1f}")
+    print(f"routing: p50 {route_ms[50]:.3f} ms, p95 {route_ms[95]:.3f} ms per turn")
+    if args.output:
+        write_results(args.output, "voice_turns", results, vars(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Compare two benchmark result files and flag regressions.
+
+Usage: python benchmarks/compare.py baseline.json candidate.json [--threshold 10]
+
+Both files must come from the same benchmark (bench_micro.py or loadgen.py
+with --output). A result regresses when it moves in its "worse" direction by
+more than --threshold percent; ratio results such as error_rate use an
+absolute threshold instead, since their baseline is usually 0. Exits 1 if
+anything regressed, so it can gate CI.
+"""
+
+import argparse
+import json
+import sys
+
+# Below this many ms, scheduler noise dominates; such results only regress on an absolute change
+NOISE_FLOOR_MS = 0.05
+
+
+def compare(baseline: dict, candidate: dict, threshold: float, ratio_threshold: float) -> tuple:
+    rows, regressions = [], []
+    for name in sorted(set(baseline["results"]) | set(candidate["results"])):
+        old, new = baseline["results"].get(name), candidate["results"].get(name)
+        if old is None or new is None:
+            rows.append((name, old and old["value"], new and new["value"], None, "added" if old is None else "removed"))
+            continue
+        delta = new["value"] - old["value"]
+        worse = delta < 0 if new.get("better") == "higher" else delta > 0
+        if new.get("unit") == "ratio":
+            change, regressed = None, worse and abs(delta) > ratio_threshold
+        else:
+            change = delta / old["value"] * 100 if old["value"] else None
+            regressed = worse and change is not None and abs(change) > threshold
+            if regressed and new.get("unit") == "ms" and abs(delta) < NOISE_FLOOR_MS:
+                regressed = False
+        status = "REGRESSED" if regressed else ("improved" if not worse and change and abs(change) > threshold else "")
+        rows.append((name, old["value"], new["value"], change, status))
+        if regressed:
+            regressions.append(name)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed change in percent")
+    parser.add_argument("--ratio-threshold", type=float, default=0.01, help="Allowed absolute change for ratios")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    if baseline["benchmark"] != candidate["benchmark"]:
+        print(f"Cannot compare a {baseline['benchmark']} run with a {candidate['benchmark']} run")
+        return 2
+    for label, run in (("baseline", baseline), ("candidate", candidate)):
+        meta = run["meta"]
+        print(f"{label:<10} commit {meta.get('commit') or '?'}  {meta.get('timestamp', '')}  {meta.get('platform', '')}")
+    if baseline["meta"].get("platform") != candidate["meta"].get("platform"):
+        print("warning: runs are from different platforms; differences may not be due to the code")
+
+    rows, regressions = compare(baseline, candidate, args.threshold, args.ratio_threshold)
+    print(f"\n{'result':<44}{'baseline':>12}{'candidate':>12}{'change':>9}")
+    for name, old, new, change, status in rows:
+        old_text = "-" if old is None else f"{old:.3f}"
+        new_text = "-" if new is None else f"{new:.3f}"
+        change_text = "" if change is None else f"{change:+.1f}%"
+        print(f"{name:<44}{old_text:>12}{new_text:>12}{change_text:>9}  {status}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:g}%")
+        return 1
+    print("\nno regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""
+Synthetic leaf images so the benchmarks run offline without the PlantVillage dataset.
+
+The images are smooth green leaf shapes with darker lesion spots and sensor
+noise, which compress and resize much more like real photos than pure noise.
+"""
+
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+# (width, height) of typical uploads: thumbnails, older phones, 12 MP and 20 MP cameras
+SIZES = {
+    "small": (320, 240),
+    "medium": (1280, 960),
+    "12mp": (4032, 3024),
+    "20mp": (5472, 3648),
+}
+FORMATS = ("JPEG", "PNG", "WEBP")
+
+
+def make_leaf_array(width: int, height: int, seed: int = 0) -> np.ndarray:
+    """Render a (height, width, 3) uint8 leaf-on-soil image."""
+    rng = np.random.default_rng(seed)
+    y, x = np.ogrid[:height, :width]
+    cx, cy = width * rng.uniform(0.4, 0.6), height * rng.uniform(0.4, 0.6)
+    rx, ry = width * rng.uniform(0.3, 0.42), height * rng.uniform(0.25, 0.4)
+    leaf = ((x - cx) / rx) ** 2 + ((y - cy) / ry) ** 2 <= 1.0
+
+    image = np.empty((height, width, 3), dtype=np.float32)
+    image[...] = (110, 85, 60)  # soil
+    shade = 0.75 + 0.25 * (x / width)
+    image[..., 0] = np.where(leaf, 60 * shade, image[..., 0])
+    image[..., 1] = np.where(leaf, 150 * shade, image[..., 1])
+    image[..., 2] = np.where(leaf, 50 * shade, image[..., 2])
+
+    for _ in range(rng.integers(5, 15)):
+        sx, sy = rng.uniform(cx - rx / 2, cx + rx / 2), rng.uniform(cy - ry / 2, cy + ry / 2)
+        radius = min(width, height) * rng.uniform(0.01, 0.04)
+        spot = ((x - sx) ** 2 + (y - sy) ** 2 <= radius ** 2) & leaf
+        image[spot] = (95, 70, 35)
+
+    image += rng.normal(0, 6, image.shape).astype(np.float32)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def make_leaf_bytes(width: int, height: int, fmt: str = "JPEG", seed: int = 0, quality: int = 90) -> bytes:
+    """Encode a synthetic leaf image the way a phone or browser upload would arrive."""
+    buffer = BytesIO()
+    options = {"quality": quality} if fmt in ("JPEG", "WEBP") else {}
+    Image.fromarray(make_leaf_array(width, height, seed)).save(buffer, fmt, **options)
+    return buffer.getvalue()
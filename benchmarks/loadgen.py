@@ -0,0 +1,150 @@
+"""
+In-process load generator for /predict.
+
+Usage: python benchmarks/loadgen.py [--concurrency 1,8,32] [--requests 200] [--output load.json]
+
+Drives the ASGI app directly through httpx.ASGITransport (no network, no
+uvicorn), so results reflect the application itself. Each concurrency level
+runs a closed loop: N clients each send their next request as soon as the
+previous one returns. Reports throughput, p50/p95/p99 latency, error rate and
+resident memory per level.
+
+Uploads are synthetic leaf images from fixed seeds. The prediction cache is
+disabled unless --cache is given, so every request pays for decode and
+inference; with --cache, --images bounds how many distinct uploads there are.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from benchmarks.fixtures import SIZES, make_leaf_bytes  # noqa: E402
+from benchmarks.report import peak_rss_mb, percentiles, result, rss_mb, write_results  # noqa: E402
+
+RSS_SAMPLE_INTERVAL = 0.1  # seconds
+
+
+async def _sample_rss(samples: list, stop: asyncio.Event):
+    while not stop.is_set():
+        samples.append(rss_mb())
+        try:
+            await asyncio.wait_for(stop.wait(), RSS_SAMPLE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_level(client, uploads: list, concurrency: int, total: int, content_type: str) -> dict:
+    """Send `total` requests from `concurrency` closed-loop clients; return latency and status stats."""
+    latencies, statuses = [], Counter()
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < total:
+            index = next_index
+            next_index += 1
+            data = uploads[index % len(uploads)]
+            started = time.perf_counter()
+            try:
+                response = await client.post("/predict", files={"file": (f"leaf{index}.{content_type.split('/')[1]}", data, content_type)})
+                statuses[response.status_code] += 1
+            except Exception as e:
+                statuses[type(e).__name__] += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    rss_samples, stop = [], asyncio.Event()
+    sampler = asyncio.create_task(_sample_rss(rss_samples, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await sampler
+
+    return {
+        "elapsed": elapsed,
+        "latencies": latencies,
+        "statuses": statuses,
+        "rss_peak": max(rss_samples, default=rss_mb()),
+        "rss_end": rss_mb(),
+    }
+
+
+async def run(args) -> dict:
+    import httpx
+    import plantapi
+
+    # httpx logs every request at INFO, which would swamp the report
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    width, height = SIZES[args.size]
+    content_type = f"image/{args.format.lower()}"
+    uploads = [make_leaf_bytes(width, height, args.format, seed=seed) for seed in range(args.images)]
+
+    await plantapi.start_model_loading()
+    await plantapi.MODEL_REGISTRY.wait_ready(args.ready_timeout)
+    rss_ready = rss_mb()
+
+    results = {}
+    transport = httpx.ASGITransport(app=plantapi.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadgen", timeout=None) as client:
+            # Warm the executor, batcher and TensorFlow's per-shape caches before measuring
+            await run_level(client, uploads, max(1, min(args.warmup, 8)), args.warmup, content_type)
+
+            print(f"{'concurrency':>11}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}{'rss MB':>9}")
+            for concurrency in (int(c) for c in args.concurrency.split(",")):
+                level = await run_level(client, uploads, concurrency, args.requests, content_type)
+                stats = percentiles(level["latencies"])
+                errors = sum(n for status, n in level["statuses"].items() if status != 200)
+                throughput = len(level["latencies"]) / level["elapsed"]
+                prefix = f"c{concurrency}"
+                results[f"{prefix}.throughput_rps"] = result(throughput, "req/s", "higher")
+                results[f"{prefix}.p50_ms"] = result(stats[50])
+                results[f"{prefix}.p95_ms"] = result(stats[95])
+                results[f"{prefix}.p99_ms"] = result(stats[99])
+                results[f"{prefix}.error_rate"] = result(errors / len(level["latencies"]), "ratio")
+                results[f"{prefix}.rss_peak_mb"] = result(level["rss_peak"], "MB")
+                print(f"{concurrency:>11}{throughput:>9.1f}{stats[50]:>10.1f}{stats[95]:>10.1f}{stats[99]:>10.1f}"
+                      f"{errors:>8}{level['rss_peak']:>9.0f}")
+                if errors:
+                    print(f"{'':>11}statuses: {dict(level['statuses'])}")
+    finally:
+        await plantapi.shutdown_inference()
+
+    results["rss_ready_mb"] = result(rss_ready, "MB")
+    results["rss_growth_mb"] = result(rss_mb() - rss_ready, "MB")
+    results["rss_peak_process_mb"] = result(peak_rss_mb(), "MB")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated client counts, run in order")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=16, help="Unmeasured requests before the first level")
+    parser.add_argument("--size", default="medium", choices=list(SIZES))
+    parser.add_argument("--format", default="JPEG", choices=["JPEG", "PNG", "WEBP"])
+    parser.add_argument("--images", type=int, default=64, help="Distinct synthetic uploads to cycle through")
+    parser.add_argument("--cache", action="store_true", help="Leave the prediction cache enabled")
+    parser.add_argument("--ready-timeout", type=float, default=300.0, help="Seconds to wait for the model to load")
+    parser.add_argument("--output", help="Write machine-readable results to this JSON file")
+    args = parser.parse_args(argv)
+
+    if not args.cache:
+        # Read by prediction_cache at import time, so it must be set before plantapi is imported
+        os.environ["PREDICTION_CACHE_SIZE"] = "0"
+
+    results = asyncio.run(run(args))
+    if args.output:
+        write_results(args.output, "loadgen", results, vars(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+Shared timing and result-file helpers for the benchmark scripts.
+
+Every benchmark writes one JSON document:
+
+    {"benchmark": "micro", "meta": {...}, "results": {name: {"value", "unit", "better"}}}
+
+so benchmarks/compare.py can diff any two runs of the same benchmark. "better"
+is "lower" for latencies and memory, "higher" for throughput.
+"""
+
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+
+def percentiles(samples: list, points=(50, 95, 99)) -> dict:
+    values = np.asarray(samples, dtype=np.float64)
+    return {p: float(np.percentile(values, p)) if len(values) else 0.0 for p in points}
+
+
+def time_samples(fn, *args, repeat: int = 20, warmup: int = 2) -> list:
+    """Call fn(*args) warmup + repeat times and return the timed samples in milliseconds."""
+    for _ in range(warmup):
+        fn(*args)
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def rss_mb() -> float:
+    """Current resident set size; falls back to the peak where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip()
+    except Exception:
+        return ""
+
+
+def environment() -> dict:
+    """What a result depends on besides the code: host, interpreter and library versions."""
+    meta = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+    try:
+        import PIL
+        meta["pillow"] = PIL.__version__
+    except ImportError:
+        pass
+    if "tensorflow" in sys.modules:
+        meta["tensorflow"] = sys.modules["tensorflow"].__version__
+    return meta
+
+
+def result(value: float, unit: str = "ms", better: str = "lower") -> dict:
+    return {"value": round(float(value), 4), "unit": unit, "better": better}
+
+
+def write_results(path: str, benchmark: str, results: dict, config: dict = None):
+    document = {"benchmark": benchmark, "meta": {**environment(), "config": config or {}}, "results": results}
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+    print(f"wrote {len(results)} results to {path}")
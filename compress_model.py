@@ -0,0 +1,346 @@
+"""
+Distill and prune the serving model into smaller drop-in replacements.
+
+Usage:
+    python compress_model.py PlantVillage/ [--teacher plant_disease_1.h5] [--students sep160 sep128 sep128-slim]
+                             [--prune 0.5] [--epochs 15] [--max-accuracy-drop 0.02] [--report compression.json]
+
+The teacher (five full 3x3 convolutions at 256x256, about 1.3 GFLOPs per
+image) labels the training images once. Each student then learns from those
+soft targets, mixed with the folder labels:
+
+  - students are depthwise-separable CNNs that resize their 256x256 input to
+    160 or 128 pixels inside the model. They take the same input and produce
+    the same class probabilities as the teacher, so plantapi.py, model_registry
+    and export_model.py serve them unchanged
+  - --prune removes that fraction of each layer's filters, those with the
+    smallest L1 norm, then fine-tunes the narrower network with the teacher.
+    Zeroing single weights (unstructured pruning) would not make dense CPU
+    kernels any faster, so whole filters go
+  - BatchNorm is folded into the convolutions before saving, leaving
+    conv + bias + relu in the served graph
+
+Every variant is reloaded with inference.load_inference_model, exactly as the API
+loads it, and compared with the teacher on the test split: accuracy, agreement
+with the teacher, FLOPs, batch-1 latency and file size. The fastest variant
+within --max-accuracy-drop of the teacher is added to models.json (not
+active; shadow it before promoting).
+
+Images and splits come from train.py's decode cache, so the test split here
+is the one train.py held out.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import layers, models
+
+from inference import CHANNELS, IMAGE_SIZE, _flatten_layers, load_inference_model
+from train import (
+    DEFAULT_CACHE_DIR, DEFAULT_SPLIT, MODEL_MANIFEST, SPLITS,
+    list_dataset, load_split, make_dataset, register_version, split_of,
+)
+
+# name -> (input resolution inside the model, filters of the stem and each separable block)
+STUDENTS = {
+    "sep160": (160, (24, 48, 96, 128, 160)),
+    "sep128": (128, (24, 48, 96, 128, 160)),
+    "sep128-slim": (128, (16, 32, 64, 96, 128)),
+}
+BN_EPSILON = 1e-3
+
+
+def build_student(num_classes: int, resolution: int, widths, serving: bool = False):
+    """Stem conv plus separable blocks; serving=True is the BatchNorm-free layout weights are folded into."""
+    def conv_block(name, layer):
+        block = [layer]
+        if not serving:
+            block += [layers.BatchNormalization(epsilon=BN_EPSILON, name=f"{name}_bn"), layers.ReLU()]
+        return block
+
+    stack = [tf.keras.Input(shape=(IMAGE_SIZE, IMAGE_SIZE, CHANNELS))]
+    if resolution != IMAGE_SIZE:
+        stack.append(layers.Resizing(resolution, resolution, name="resize"))
+    stack.append(layers.Rescaling(1.0 / 255))
+    activation = "relu" if serving else None
+    # A full convolution first: depthwise filters over three colour channels learn little
+    stack += conv_block("stem", layers.Conv2D(widths[0], 3, strides=2, padding="same", use_bias=serving,
+                                              activation=activation, name="stem"))
+    for i, filters in enumerate(widths[1:]):
+        stack += conv_block(f"block{i}", layers.SeparableConv2D(filters, 3, padding="same", use_bias=serving,
+                                                                 activation=activation, name=f"block{i}"))
+        stack.append(layers.MaxPooling2D(2))
+    stack += [
+        layers.GlobalAveragePooling2D(),
+        layers.Dense(num_classes, activation="softmax", dtype="float32", name="classifier"),
+    ]
+    return models.Sequential(stack, name="plant_disease_student")
+
+
+def _conv_names(widths) -> list:
+    return ["stem"] + [f"block{i}" for i in range(len(widths) - 1)]
+
+
+def folded_weights(model, widths) -> dict:
+    """Per conv layer: (depthwise kernel or None, kernel, bias) with its BatchNorm folded in."""
+    folded = {}
+    for name in _conv_names(widths):
+        gamma, beta, mean, variance = model.get_layer(f"{name}_bn").get_weights()
+        scale = gamma / np.sqrt(variance + BN_EPSILON)
+        weights = model.get_layer(name).get_weights()
+        depthwise, kernel = (None, weights[0]) if name == "stem" else weights
+        folded[name] = (depthwise, kernel * scale, beta - mean * scale)
+    return folded
+
+
+def export_student(model, num_classes: int, resolution: int, widths):
+    serving = build_student(num_classes, resolution, widths, serving=True)
+    for name, (depthwise, kernel, bias) in folded_weights(model, widths).items():
+        serving.get_layer(name).set_weights([kernel, bias] if depthwise is None else [depthwise, kernel, bias])
+    serving.get_layer("classifier").set_weights(model.get_layer("classifier").get_weights())
+    return serving
+
+
+def prune_filters(model, num_classes: int, resolution: int, widths, fraction: float):
+    """A narrower copy of the student without the `fraction` of filters per layer with the smallest folded L1 norm."""
+    folded = folded_weights(model, widths)
+    keep = {}
+    for name, (_, kernel, _) in folded.items():
+        norms = np.abs(kernel).reshape(-1, kernel.shape[-1]).sum(axis=0)
+        count = max(1, int(round(kernel.shape[-1] * (1 - fraction))))
+        keep[name] = np.sort(np.argsort(norms)[-count:])
+    pruned_widths = tuple(len(keep[name]) for name in _conv_names(widths))
+    pruned = build_student(num_classes, resolution, pruned_widths)
+
+    previous = None
+    for name in _conv_names(widths):
+        weights = model.get_layer(name).get_weights()
+        if name == "stem":
+            pruned.get_layer(name).set_weights([weights[0][..., keep[name]]])
+        else:
+            depthwise, pointwise = weights
+            pruned.get_layer(name).set_weights([
+                depthwise[:, :, previous, :], pointwise[:, :, previous, :][..., keep[name]],
+            ])
+        pruned.get_layer(f"{name}_bn").set_weights([w[keep[name]] for w in model.get_layer(f"{name}_bn").get_weights()])
+        previous = keep[name]
+    kernel, bias = model.get_layer("classifier").get_weights()
+    pruned.get_layer("classifier").set_weights([kernel[previous], bias])
+    return pruned, pruned_widths
+
+
+def count_flops(model) -> int:
+    """2 x multiply-adds of the conv and dense layers for one image."""
+    shape, flops = (1, IMAGE_SIZE, IMAGE_SIZE, CHANNELS), 0
+    for layer in _flatten_layers(model.layers):
+        out = tuple(layer.compute_output_shape(shape))
+        if isinstance(layer, layers.SeparableConv2D):
+            kh, kw = layer.kernel_size
+            flops += 2 * out[1] * out[2] * shape[-1] * (kh * kw + out[-1])
+        elif isinstance(layer, layers.DepthwiseConv2D):
+            kh, kw = layer.kernel_size
+            flops += 2 * out[1] * out[2] * out[-1] * kh * kw
+        elif isinstance(layer, layers.Conv2D):
+            kh, kw = layer.kernel_size
+            flops += 2 * out[1] * out[2] * out[-1] * kh * kw * shape[-1]
+        elif isinstance(layer, layers.Dense):
+            flops += 2 * int(np.prod(shape[1:])) * out[-1]
+        shape = out
+    return flops
+
+
+def predict_all(compiled, images: np.ndarray, batch_size: int = 32) -> np.ndarray:
+    return np.concatenate([compiled(images[start:start + batch_size]) for start in range(0, len(images), batch_size)])
+
+
+def batch1_latency_ms(compiled, images: np.ndarray, runs: int = 50) -> float:
+    samples = []
+    for i in range(runs):
+        batch = np.asarray(images[i % len(images)][np.newaxis])
+        started = time.perf_counter()
+        compiled(batch)
+        samples.append((time.perf_counter() - started) * 1000)
+    return float(np.median(samples))
+
+
+def distillation_loss(num_classes: int, temperature: float, alpha: float):
+    """alpha x T^2 x KL(teacher || student) at temperature T, plus (1 - alpha) x cross-entropy on known labels.
+
+    Targets are the teacher's probabilities with the folder label appended (-1 when unknown).
+    Both models end in softmax, so log-probabilities stand in for logits: softmax(log p / T) = softmax(z / T).
+    """
+    def loss(targets, probabilities):
+        teacher, labels = targets[:, :num_classes], tf.cast(targets[:, num_classes], tf.int32)
+        soft_teacher = tf.nn.softmax(tf.math.log(tf.clip_by_value(teacher, 1e-7, 1.0)) / temperature)
+        log_student = tf.math.log(tf.clip_by_value(probabilities, 1e-7, 1.0))
+        kl = tf.reduce_sum(
+            soft_teacher * (tf.math.log(soft_teacher + 1e-7) - tf.nn.log_softmax(log_student / temperature)), axis=-1)
+        hard = tf.where(labels >= 0, -tf.reduce_sum(tf.one_hot(labels, num_classes) * log_student, axis=-1), 0.0)
+        return alpha * temperature ** 2 * kl + (1 - alpha) * hard
+    return loss
+
+
+def agreement_metric(num_classes: int):
+    def agreement(targets, probabilities):
+        return tf.cast(tf.argmax(targets[:, :num_classes], -1) == tf.argmax(probabilities, -1), tf.float32)
+    return agreement
+
+
+def distill(student, data: dict, num_classes: int, epochs: int, args):
+    train_images, train_targets = data["train"]
+    student.compile(
+        optimizer=tf.keras.optimizers.Adam(args.learning_rate),
+        loss=distillation_loss(num_classes, args.temperature, args.alpha),
+        metrics=[agreement_metric(num_classes)],
+    )
+    validation, callbacks = None, []
+    if "val" in data:
+        validation = make_dataset(*data["val"], args.batch_size, training=False)
+        callbacks.append(tf.keras.callbacks.EarlyStopping(monitor="val_loss", patience=args.patience,
+                                                          restore_best_weights=True))
+    started = time.perf_counter()
+    student.fit(make_dataset(train_images, train_targets, args.batch_size, training=True, seed=args.seed),
+                validation_data=validation, epochs=epochs, callbacks=callbacks, shuffle=False, verbose=2)
+    print(f"   trained in {time.perf_counter() - started:.0f}s")
+
+
+def evaluate(path: str, test: tuple, num_classes: int) -> dict:
+    """Load a saved model the way the API does and score it on the test split."""
+    compiled = load_inference_model(path, warmup=False)
+    images, targets = test
+    predicted = np.argmax(predict_all(compiled, images), axis=1)
+    labels = targets[:, num_classes].astype(np.int64)
+    labelled = labels >= 0
+    return {
+        "path": path,
+        "accuracy": float(np.mean(predicted[labelled] == labels[labelled])) if labelled.any() else None,
+        "agreement": float(np.mean(predicted == np.argmax(targets[:, :num_classes], axis=1))),
+        "mflops": count_flops(compiled.keras_model) / 1e6,
+        "params": int(compiled.keras_model.count_params()),
+        "latency_ms": batch1_latency_ms(compiled, images),
+        "size_mb": os.path.getsize(path) / 1024 / 1024,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("data_dir", help="Directory with one sub-directory of images per class (as for train.py)")
+    parser.add_argument("--teacher", default="plant_disease_1.h5")
+    parser.add_argument("--students", nargs="+", choices=sorted(STUDENTS), default=list(STUDENTS))
+    parser.add_argument("--prune", type=float, nargs="*", default=[0.5], help="Filter fractions to prune from each student")
+    parser.add_argument("--epochs", type=int, default=15)
+    parser.add_argument("--fine-tune-epochs", type=int, default=5, help="Distillation epochs after pruning")
+    parser.add_argument("--patience", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--learning-rate", type=float, default=2e-3)
+    parser.add_argument("--temperature", type=float, default=4.0)
+    parser.add_argument("--alpha", type=float, default=0.7, help="Weight of the teacher's soft targets vs. the labels")
+    parser.add_argument("--split", type=float, nargs=3, default=DEFAULT_SPLIT, metavar=("TRAIN", "VAL", "TEST"))
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.02,
+                        help="Accuracy (or teacher agreement, without labels) a variant may lose")
+    parser.add_argument("--output-dir", default=".", help="Where variant .h5 files are written")
+    parser.add_argument("--manifest", default=MODEL_MANIFEST)
+    parser.add_argument("--no-register", action="store_true")
+    parser.add_argument("--report", help="Write the comparison to this JSON file")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.data_dir):
+        print(f"❌ No dataset directory at {args.data_dir}")
+        return 1
+    print(f"\n📂 Loading teacher from '{args.teacher}'...")
+    teacher = load_inference_model(args.teacher, warmup=False)
+    num_classes = teacher.num_classes
+
+    classes, items = list_dataset(args.data_dir)
+    # Folder order is label order, as in the notebook and train.py; labels only mean something if the counts match
+    labelled = len(classes) == num_classes
+    if not labelled:
+        print(f"⚠️  {len(classes)} class folders for a {num_classes}-class teacher: distilling from the teacher alone")
+        args.alpha = 1.0
+    by_split = {split: [] for split in SPLITS}
+    for item in items:
+        by_split[split_of(item[0], args.split)].append(item)
+    if not by_split["train"] or not by_split["test"]:
+        print("❌ Need images in both the train and test splits")
+        return 1
+
+    data = {}
+    started = time.perf_counter()
+    for split in SPLITS:
+        if by_split[split]:
+            images, labels = load_split(args.data_dir, by_split[split], args.cache_dir, split, args.workers)
+            # The teacher runs once per image; every student epoch after that only pays for the student
+            targets = np.concatenate([predict_all(teacher, images), (labels if labelled else np.full_like(labels, -1))
+                                      .astype(np.float32)[:, np.newaxis]], axis=1)
+            data[split] = (images, targets)
+    print(f"🎓 Teacher labelled {sum(len(t) for _, t in data.values())} images in {time.perf_counter() - started:.0f}s")
+
+    results = {"teacher": evaluate(args.teacher, data["test"], num_classes)}
+    os.makedirs(args.output_dir, exist_ok=True)
+    stem = os.path.join(args.output_dir, os.path.splitext(os.path.basename(args.teacher))[0])
+    tf.keras.utils.set_random_seed(args.seed)
+    for name in args.students:
+        resolution, widths = STUDENTS[name]
+        print(f"🌱 Distilling {name} ({resolution}px, filters {widths})")
+        student = build_student(num_classes, resolution, widths)
+        distill(student, data, num_classes, args.epochs, args)
+        path = f"{stem}.{name}.h5"
+        export_student(student, num_classes, resolution, widths).save(path)
+        results[name] = evaluate(path, data["test"], num_classes)
+
+        for fraction in args.prune:
+            variant = f"{name}-pruned{int(round(fraction * 100))}"
+            pruned, pruned_widths = prune_filters(student, num_classes, resolution, widths, fraction)
+            print(f"✂️  {variant}: filters {pruned_widths}")
+            if args.fine_tune_epochs:
+                distill(pruned, data, num_classes, args.fine_tune_epochs, args)
+            path = f"{stem}.{variant}.h5"
+            export_student(pruned, num_classes, resolution, pruned_widths).save(path)
+            results[variant] = evaluate(path, data["test"], num_classes)
+
+    metric = "accuracy" if labelled else "agreement"
+    floor = results["teacher"][metric] - args.max_accuracy_drop
+    print(f"\n{'variant':<22}{'accuracy':>10}{'agreement':>11}{'MFLOPs':>10}{'params':>10}{'ms/img':>9}{'MB':>7}")
+    for variant, r in results.items():
+        accuracy = f"{r['accuracy'] * 100:.2f}%" if r["accuracy"] is not None else "-"
+        mark = "" if variant == "teacher" or r[metric] >= floor else "  (over budget)"
+        print(f"{variant:<22}{accuracy:>10}{r['agreement'] * 100:>10.2f}%{r['mflops']:>10.1f}{r['params']:>10}"
+              f"{r['latency_ms']:>9.2f}{r['size_mb']:>7.2f}{mark}")
+
+    candidates = [v for v in results if v != "teacher" and results[v][metric] >= floor]
+    best = min(candidates, key=lambda v: results[v]["latency_ms"]) if candidates else None
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"results": results, "selected": best, "budget": {metric: floor},
+                       "args": {k: v for k, v in vars(args).items() if k != "data_dir"}}, f, indent=2)
+    if best is None:
+        print(f"\n⚠️  No variant kept {metric} within {args.max_accuracy_drop * 100:.1f} points of the teacher")
+        return 1
+    speedup = results["teacher"]["latency_ms"] / results[best]["latency_ms"]
+    print(f"\n✅ {best}: {speedup:.1f}x faster than the teacher, {metric} "
+          f"{(results[best][metric] - results['teacher'][metric]) * 100:+.2f} points -> {results[best]['path']}")
+
+    if not args.no_register and os.path.exists(args.manifest):
+        with open(args.manifest) as f:
+            versions = json.load(f).get("versions", {})
+        teacher_path = os.path.abspath(args.teacher)
+        source = next((v for v, entry in versions.items() if os.path.abspath(entry["path"]) == teacher_path), None)
+        if source is None:
+            print(f"ℹ️  {args.teacher} is not in {args.manifest}; add {results[best]['path']} there by hand")
+        else:
+            version = f"{source}_{best}"
+            register_version(args.manifest, version, results[best]["path"], versions[source]["classes"])
+            print(f"📋 Added '{version}' to {args.manifest}; set it as \"shadow\" to compare it with live traffic")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
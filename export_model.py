@@ -0,0 +1,182 @@
+"""
+Export the Keras H5 model to TFLite / ONNX for the CPU serving backends.
+
+Usage:
+    python export_model.py plant_disease_1.h5 --formats float32 float16 dynamic int8 onnx \
+        --calibration-dir samples/ --parity-dir holdout/
+
+Outputs are written next to the H5 file:
+    <stem>.tflite          float32 TFLite
+    <stem>.fp16.tflite     float16 weights
+    <stem>.dynamic.tflite  dynamic-range (int8 weights, float activations)
+    <stem>.int8.tflite     full integer quantization from a representative dataset
+    <stem>.onnx            ONNX graph for ONNX Runtime
+
+With --parity-dir, every exported model is compared against the Keras model on
+the held-out images (top-1 agreement, max probability difference, latency).
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from backends import OnnxModel, TFLiteModel
+from inference import CHANNELS, IMAGE_SIZE, load_inference_model
+from preprocessing import decode_path
+
+FORMATS = ("float32", "float16", "dynamic", "int8", "onnx")
+SUFFIXES = {
+    "float32": ".tflite",
+    "float16": ".fp16.tflite",
+    "dynamic": ".dynamic.tflite",
+    "int8": ".int8.tflite",
+    "onnx": ".onnx",
+}
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def list_images(directory: str, limit: int = None) -> list:
+    paths = sorted(
+        p for p in glob.glob(os.path.join(directory, "**", "*"), recursive=True)
+        if p.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    return paths[:limit] if limit else paths
+
+
+def load_image(path: str):
+    """Decode one image as float32, or return None (with a warning) if it can't be read."""
+    image, error = decode_path(path)
+    if image is None:
+        print(f"⚠️  Skipping unreadable image {path}: {error}")
+        return None
+    return image.astype(np.float32)
+
+
+def representative_dataset(calibration_dir: str, samples: int):
+    """Yield calibration inputs for full-integer quantization."""
+    paths = list_images(calibration_dir, samples) if calibration_dir else []
+    if not paths:
+        print("⚠️  No calibration images given; falling back to random inputs (int8 accuracy will suffer)")
+        rng = np.random.default_rng(0)
+        for _ in range(samples):
+            yield [rng.uniform(0, 255, (1, IMAGE_SIZE, IMAGE_SIZE, CHANNELS)).astype(np.float32)]
+        return
+    for path in paths:
+        image = load_image(path)
+        if image is not None:
+            yield [image[np.newaxis]]
+
+
+def export_tflite(model, fmt: str, output_path: str, calibration_dir: str = None, samples: int = 100):
+    # Convert the augmentation-free model so RandomRotation never reaches the TFLite graph
+    converter = tf.lite.TFLiteConverter.from_keras_model(model.inference_model)
+    if fmt == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif fmt == "dynamic":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    elif fmt == "int8":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: representative_dataset(calibration_dir, samples)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        # Keep float32 I/O so the serving code feeds every backend the same batch
+        converter.inference_input_type = tf.float32
+        converter.inference_output_type = tf.float32
+    with open(output_path, "wb") as f:
+        f.write(converter.convert())
+
+
+def export_onnx(model, output_path: str):
+    import tf2onnx
+    spec = (tf.TensorSpec((None, IMAGE_SIZE, IMAGE_SIZE, CHANNELS), tf.float32, name="images"),)
+    inference_model = model.inference_model
+
+    @tf.function(input_signature=spec)
+    def forward(images):
+        return inference_model(images, training=False)
+
+    tf2onnx.convert.from_function(forward, input_signature=spec, opset=17, output_path=output_path)
+
+
+def check_parity(model, exported, paths: list, batch_size: int = 16) -> dict:
+    """Compare an exported backend with the Keras model on held-out images; unreadable files are skipped and counted."""
+    agree, max_diff, total, skipped = 0, 0.0, 0, 0
+    reference_time = exported_time = 0.0
+    for start in range(0, len(paths), batch_size):
+        images = [load_image(p) for p in paths[start:start + batch_size]]
+        skipped += sum(image is None for image in images)
+        images = [image for image in images if image is not None]
+        if not images:
+            continue
+        batch = np.stack(images)
+        t0 = time.perf_counter()
+        reference = model(batch)
+        t1 = time.perf_counter()
+        candidate = exported(batch)
+        t2 = time.perf_counter()
+        reference_time += t1 - t0
+        exported_time += t2 - t1
+        agree += int(np.sum(np.argmax(reference, axis=1) == np.argmax(candidate, axis=1)))
+        max_diff = max(max_diff, float(np.max(np.abs(reference - candidate))))
+        total += len(batch)
+    return {
+        "images": total,
+        "skipped": skipped,
+        "top1_agreement": agree / total if total else 0.0,
+        "max_prob_diff": max_diff,
+        "keras_ms_per_image": reference_time / total * 1000 if total else 0.0,
+        "exported_ms_per_image": exported_time / total * 1000 if total else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the plant disease model for TFLite / ONNX Runtime serving.")
+    parser.add_argument("model_path", nargs="?", default="plant_disease_1.h5")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--calibration-dir", help="Images used as the int8 representative dataset")
+    parser.add_argument("--calibration-samples", type=int, default=100)
+    parser.add_argument("--parity-dir", help="Held-out images for the accuracy-parity check")
+    parser.add_argument("--min-agreement", type=float, default=0.98,
+                        help="Fail if top-1 agreement with Keras drops below this fraction")
+    args = parser.parse_args(argv)
+
+    print(f"\n📂 Loading model from '{args.model_path}'...")
+    model = load_inference_model(args.model_path, warmup=False)
+    stem = os.path.splitext(args.model_path)[0]
+    parity_paths = list_images(args.parity_dir) if args.parity_dir else []
+
+    failed = False
+    for fmt in args.formats:
+        output_path = stem + SUFFIXES[fmt]
+        print(f"🔧 Exporting {fmt} -> {output_path}")
+        if fmt == "onnx":
+            export_onnx(model, output_path)
+        else:
+            export_tflite(model, fmt, output_path, args.calibration_dir, args.calibration_samples)
+        print(f"   {os.path.getsize(output_path) / 1024 / 1024:.2f} MB")
+
+        if parity_paths:
+            exported = OnnxModel(output_path) if fmt == "onnx" else TFLiteModel(output_path)
+            report = check_parity(model, exported, parity_paths)
+            if not report["images"]:
+                print(f"❌ None of the {len(parity_paths)} parity images could be read; cannot check {fmt}")
+                failed = True
+                continue
+            skipped = f" ({report['skipped']} unreadable skipped)" if report["skipped"] else ""
+            print(f"   top-1 agreement {report['top1_agreement'] * 100:.2f}% over {report['images']} images{skipped}, "
+                  f"max prob diff {report['max_prob_diff']:.4f}, "
+                  f"{report['exported_ms_per_image']:.2f} ms/img vs keras {report['keras_ms_per_image']:.2f} ms/img")
+            if report["top1_agreement"] < args.min_agreement:
+                print(f"⚠️  {fmt} is below the {args.min_agreement * 100:.0f}% agreement floor")
+                failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
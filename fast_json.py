@@ -0,0 +1,42 @@
+"""
+JSON rendering for prediction responses.
+
+FastAPI's default path runs a response through jsonable_encoder (a recursive
+Python walk that copies every dict and list) and then json.dumps. Prediction
+responses are small dicts of strings, floats and, with ?full=1, a numpy
+probability vector, which orjson serializes directly in a single C call,
+numpy arrays included. orjson is optional: without it the stdlib encoder is
+used with a numpy fallback, so output is identical and only speed differs.
+"""
+
+import json
+
+import numpy as np
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    """Serialize to compact UTF-8 JSON, numpy scalars and arrays included."""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse that skips jsonable_encoder and renders with dumps()."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,120 @@
+"""
+Compiled inference path for the Keras plant disease model.
+
+`tf.keras.Model.predict` builds a data adapter, runs callbacks and sets up a
+progress bar on every call, which dominates latency for a single 256x256
+image. Here the H5 model is loaded once, training-only layers (the
+RandomFlip/RandomRotation augmentation block from training.ipynb) are
+stripped, and the forward pass is traced into a tf.function with a fixed
+input signature.
+"""
+
+import logging
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SIZE = 256
+CHANNELS = 3
+
+
+def _default_intra_op_threads() -> int:
+    # Several uvicorn workers each running TensorFlow should split the cores, not each claim all of them
+    workers = int(os.getenv("WEB_CONCURRENCY", "0"))
+    return max(1, (os.cpu_count() or 1) // workers) if workers > 1 else 0
+
+
+TF_INTRA_OP_THREADS = int(os.getenv("TF_INTRA_OP_THREADS", str(_default_intra_op_threads())))  # 0 = TensorFlow default
+TF_INTER_OP_THREADS = int(os.getenv("TF_INTER_OP_THREADS", "0"))
+
+try:
+    if TF_INTRA_OP_THREADS:
+        tf.config.threading.set_intra_op_parallelism_threads(TF_INTRA_OP_THREADS)
+    if TF_INTER_OP_THREADS:
+        tf.config.threading.set_inter_op_parallelism_threads(TF_INTER_OP_THREADS)
+except RuntimeError as e:
+    # Only possible before the TensorFlow runtime has started
+    logger.warning(f"Could not size TensorFlow thread pools: {e}")
+
+# Layers that are identity (or noise) at inference time and only matter during training.
+# RandomCrop is deliberately absent: it center-crops at inference and changes the output.
+TRAINING_ONLY_LAYERS = (
+    "RandomFlip", "RandomRotation", "RandomZoom", "RandomTranslation",
+    "RandomContrast", "RandomBrightness", "Dropout", "SpatialDropout2D", "GaussianNoise",
+)
+
+
+def _flatten_layers(layers):
+    """Expand nested Sequential blocks and drop training-only layers."""
+    kept = []
+    for layer in layers:
+        if isinstance(layer, tf.keras.Sequential):
+            kept.extend(_flatten_layers(layer.layers))
+        elif type(layer).__name__ not in TRAINING_ONLY_LAYERS:
+            kept.append(layer)
+    return kept
+
+
+def strip_training_layers(model: tf.keras.Model) -> tf.keras.Model:
+    """Rebuild a Sequential model without its augmentation layers, sharing the trained weights."""
+    if not isinstance(model, tf.keras.Sequential):
+        # Functional graphs can't be re-chained layer by layer; training=False already disables them.
+        return model
+    inputs = tf.keras.Input(shape=(IMAGE_SIZE, IMAGE_SIZE, CHANNELS), dtype=tf.float32)
+    outputs = inputs
+    for layer in _flatten_layers(model.layers):
+        outputs = layer(outputs)
+    return tf.keras.Model(inputs, outputs, name=f"{model.name}_inference")
+
+
+class CompiledModel:
+    """A loaded model plus its traced, signature-fixed forward function."""
+
+    def __init__(self, keras_model: tf.keras.Model, path: str = None):
+        self.path = path
+        self.keras_model = keras_model
+        self.inference_model = strip_training_layers(keras_model)
+        self.num_classes = int(self.inference_model.output_shape[-1])
+
+        inference_model = self.inference_model
+
+        @tf.function(
+            input_signature=[tf.TensorSpec([None, IMAGE_SIZE, IMAGE_SIZE, CHANNELS], tf.float32)],
+            reduce_retracing=True,
+        )
+        def forward(images):
+            return inference_model(images, training=False)
+
+        self._forward = forward
+
+    def __call__(self, img_batch: np.ndarray) -> np.ndarray:
+        """Return class probabilities for an (N, 256, 256, 3) batch of uint8 or float32 pixels."""
+        # uint8 batches from preprocessing are cast here, at the last moment before the model
+        return self._forward(img_batch.astype(np.float32, copy=False)).numpy()
+
+    def warmup(self, check_parity: bool = True, atol: float = 1e-4) -> float:
+        """Trace the function ahead of the first request; optionally compare against Keras predict."""
+        sample = np.random.default_rng(0).uniform(0, 255, (1, IMAGE_SIZE, IMAGE_SIZE, CHANNELS)).astype(np.float32)
+        started = time.perf_counter()
+        compiled = self(sample)
+        elapsed = time.perf_counter() - started
+        logger.info(f"Inference function traced and warmed up in {elapsed:.2f}s")
+        if check_parity:
+            reference = self.keras_model.predict(sample, verbose=0)
+            diff = float(np.max(np.abs(compiled - reference)))
+            if diff > atol:
+                logger.warning(f"Compiled inference differs from Keras predict by {diff:.2e} (tolerance {atol:.0e})")
+        return elapsed
+
+
+def load_inference_model(model_path: str, warmup: bool = True) -> CompiledModel:
+    """Load an H5 model once and wrap it in a compiled inference function."""
+    keras_model = tf.keras.models.load_model(model_path, compile=False)
+    model = CompiledModel(keras_model, path=model_path)
+    if warmup:
+        model.warmup()
+    return model
@@ -0,0 +1,195 @@
+"""
+Dedicated executors for blocking inference work.
+
+Keeps image decoding and model forward passes off the asyncio event loop so
+/health, /voice-token and friends stay responsive while /predict is busy.
+The forward-pass executor is a thread or process pool (INFERENCE_EXECUTOR)
+and admission is bounded by INFERENCE_QUEUE_SIZE: once that many /predict
+requests are in flight, new ones are turned away with ServerBusyError.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_EXECUTOR = os.getenv("INFERENCE_EXECUTOR", "thread").lower()  # "thread" or "process"
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "64"))
+DECODE_WORKERS = int(os.getenv("DECODE_WORKERS", str(min(4, os.cpu_count() or 1))))
+RETRY_AFTER_SECONDS = int(os.getenv("RETRY_AFTER_SECONDS", "2"))
+
+
+class ServerBusyError(Exception):
+    """Raised when the admission queue is full and the request should be retried later."""
+
+    def __init__(self, message="Server is busy, please retry shortly", retry_after=RETRY_AFTER_SECONDS):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# Process-pool workers hold their own copies of the models they serve, keyed by (path, backend).
+# More than one is kept so a version being swapped in (or shadowing) doesn't evict the active one.
+WORKER_MAX_MODELS = int(os.getenv("WORKER_MAX_MODELS", "3"))
+_worker_models = OrderedDict()
+_worker_default = None
+
+
+def _init_worker(model_path=None, backend=None):
+    global _worker_default
+    if model_path:
+        _worker_default = (model_path, backend)
+        _worker_model(model_path, backend)
+
+
+def _worker_model(model_path, backend=None):
+    from backends import INFERENCE_BACKEND, load_backend
+    key = (model_path, backend or INFERENCE_BACKEND)
+    model = _worker_models.get(key)
+    if model is None:
+        model = _worker_models[key] = load_backend(*key)
+        logging.getLogger(__name__).info(f"Inference worker {os.getpid()} loaded {model_path}")
+        while len(_worker_models) > WORKER_MAX_MODELS:
+            _worker_models.popitem(last=False)
+    else:
+        _worker_models.move_to_end(key)
+    return model
+
+
+def predict_in_worker(img_batch, model_path=None, backend=None):
+    """Forward pass used when INFERENCE_EXECUTOR=process."""
+    if model_path is None:
+        model_path, backend = _worker_default
+    return _worker_model(model_path, backend)(img_batch)
+
+
+def warmup_worker(model_path=None, backend=None):
+    """Load a model in this worker and run one forward pass; returns (pid, number of outputs)."""
+    import numpy as np
+    outputs = predict_in_worker(np.zeros((1, 256, 256, 3), dtype=np.float32), model_path, backend)
+    # Hold the worker briefly so the pool hands the other warmup tasks to other workers
+    time.sleep(0.05)
+    return os.getpid(), int(np.shape(outputs)[-1])
+
+
+def _timed_call(fn, args):
+    # time.monotonic is system-wide, so start/finish compare across processes
+    started = time.monotonic()
+    result = fn(*args)
+    return result, started, time.monotonic()
+
+
+class InferencePool:
+    """Bounded admission plus separate decode and forward-pass executors."""
+
+    def __init__(self, kind=INFERENCE_EXECUTOR, workers=INFERENCE_WORKERS,
+                 max_pending=INFERENCE_QUEUE_SIZE, decode_workers=DECODE_WORKERS, model_path=None):
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max(1, int(max_pending))
+        if kind == "process":
+            # spawn, not fork: TensorFlow's runtime threads do not survive a fork
+            self._executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(model_path,),
+            )
+        elif kind == "thread":
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+        else:
+            raise ValueError(f"Unknown INFERENCE_EXECUTOR '{kind}', expected 'thread' or 'process'")
+        self._decode_executor = ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix="decode")
+
+        self.in_flight = 0
+        self.running = 0  # forward passes submitted to the executor and not yet finished
+        self.admitted_total = 0
+        self.rejected_total = 0
+        self.runs_total = 0
+        self.queue_wait_seconds_total = 0.0
+        self.compute_seconds_total = 0.0
+
+    def acquire(self):
+        """Reserve an admission slot or raise ServerBusyError; pair with release()."""
+        if self.in_flight >= self.max_pending:
+            self.rejected_total += 1
+            raise ServerBusyError()
+        self.in_flight += 1
+        self.admitted_total += 1
+
+    def release(self):
+        self.in_flight -= 1
+
+    @contextmanager
+    def admit(self):
+        """Reserve an admission slot for the duration of one request."""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def decode(self, fn, *args):
+        """Run a CPU-bound preprocessing function on the decode threads."""
+        return await asyncio.get_running_loop().run_in_executor(self._decode_executor, fn, *args)
+
+    async def run(self, fn, *args):
+        """Run fn on the inference executor, recording queue wait and compute time separately."""
+        submitted = time.monotonic()
+        self.running += 1
+        try:
+            result, started, finished = await asyncio.get_running_loop().run_in_executor(
+                self._executor, _timed_call, fn, args
+            )
+        finally:
+            self.running -= 1
+        self.runs_total += 1
+        self.queue_wait_seconds_total += max(0.0, started - submitted)
+        self.compute_seconds_total += finished - started
+        metrics.INFERENCE_QUEUE_SECONDS.observe(max(0.0, started - submitted))
+        metrics.STAGE_SECONDS.observe(finished - started, stage="model_forward")
+        return result
+
+    def busy(self) -> bool:
+        """True while every inference worker has a forward pass running or queued."""
+        return self.running >= self.workers
+
+    def warmup(self, model_path=None, backend=None) -> int:
+        """Block until every worker has loaded the model and run one forward pass; returns its output width."""
+        warmed, num_outputs = set(), None
+        # A fast worker can pick up more than one task, so repeat until every process has been seen
+        for _ in range(4):
+            futures = [self._executor.submit(warmup_worker, model_path, backend) for _ in range(self.workers)]
+            for future in futures:
+                pid, num_outputs = future.result()
+                warmed.add(pid)
+            if len(warmed) >= self.workers:
+                break
+        else:
+            logger.warning(f"Warmed {len(warmed)} of {self.workers} inference workers for {model_path}")
+        return num_outputs
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._decode_executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        runs = self.runs_total
+        return {
+            "executor": self.kind,
+            "max_pending": self.max_pending,
+            "in_flight": self.in_flight,
+            "admitted_total": self.admitted_total,
+            "rejected_total": self.rejected_total,
+            "runs_total": runs,
+            "avg_executor_wait_ms": round(self.queue_wait_seconds_total / runs * 1000.0, 3) if runs else 0.0,
+            "avg_compute_ms": round(self.compute_seconds_total / runs * 1000.0, 3) if runs else 0.0,
+        }
@@ -0,0 +1,115 @@
+"""
+Indexed disease knowledge lookup.
+
+plant_disease_database.json is a flat list of {"Disease", "response"} entries
+whose names don't always match the model's class names exactly
+("Potato Late_blight" vs "Potato Late blight", "Spider mites Two-spotted
+spider mite" vs "Spider Mites (Two-spotted Spider Mite)"). The file is
+normalized once into a tuple of responses per class index, so a request is a
+single index lookup. A watcher thread rebuilds the index when the file
+changes and swaps it in atomically; requests never wait on a reload.
+"""
+
+import json
+import logging
+import os
+import random
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+KNOWLEDGE_RELOAD_INTERVAL = float(os.getenv("KNOWLEDGE_RELOAD_INTERVAL", "5"))  # seconds, 0 disables hot reload
+DEFAULT_DESCRIPTION = "Sorry, There's no detailed information for this disease yet."
+
+# Database names that describe a class under a shorter or older name
+ALIASES = {
+    "corn cercospora leaf spot": "corn cercospora leaf spot gray leaf spot",
+}
+
+
+def normalize_name(name: str) -> str:
+    """Lowercase and collapse punctuation/underscores so naming variants compare equal."""
+    normalized = re.sub(r"[^a-z0-9]+", " ", name.lower()).strip()
+    return ALIASES.get(normalized, normalized)
+
+
+class KnowledgeBase:
+    """Maps a predicted class index to its list of human-readable responses."""
+
+    def __init__(self, path: str, class_names: list, reload_interval: float = KNOWLEDGE_RELOAD_INTERVAL):
+        self.path = path
+        self.class_names = list(class_names)
+        self.reload_interval = reload_interval
+        self._class_lookup = {normalize_name(name): i for i, name in enumerate(self.class_names)}
+        self._index = tuple(() for _ in self.class_names)
+        self._mtime = None
+        self._stop = threading.Event()
+        self._watcher = None
+        self.reloads = 0
+        self.load()
+
+    def build_index(self, entries: list) -> tuple:
+        responses = [[] for _ in self.class_names]
+        unmatched = set()
+        for entry in entries:
+            class_index = self._class_lookup.get(normalize_name(entry.get("Disease", "")))
+            if class_index is None:
+                unmatched.add(entry.get("Disease"))
+            elif entry.get("response"):
+                responses[class_index].append(entry["response"])
+        if unmatched:
+            logger.debug(f"Knowledge entries for classes the model does not predict: {sorted(unmatched)}")
+        return tuple(tuple(r) for r in responses)
+
+    def load(self):
+        """(Re)build the index from disk; on failure the previous index stays in service."""
+        if not os.path.exists(self.path):
+            logger.warning(f"Disease database not found at {self.path}")
+            return
+        try:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, "r") as f:
+                index = self.build_index(json.load(f))
+        except Exception as e:
+            logger.error(f"Error loading disease database: {e}")
+            return
+        missing = [name for name, responses in zip(self.class_names, index) if not responses]
+        if missing:
+            logger.warning(f"Disease database has no entries for {len(missing)} class(es): {missing}")
+        # A single reference assignment, so readers see either the old or the new index
+        self._index = index
+        self._mtime = mtime
+        logger.info(f"Disease knowledge indexed: {sum(map(len, index))} responses for {len(index) - len(missing)}/{len(index)} classes")
+
+    def missing_classes(self) -> list:
+        return [name for name, responses in zip(self.class_names, self._index) if not responses]
+
+    def responses(self, class_index: int) -> tuple:
+        index = self._index
+        return index[class_index] if 0 <= class_index < len(index) else ()
+
+    def describe(self, class_index: int) -> str:
+        """Pick one of the responses for a class at random, or the default message."""
+        responses = self.responses(class_index)
+        return random.choice(responses) if responses else DEFAULT_DESCRIPTION
+
+    def _watch(self):
+        while not self._stop.wait(self.reload_interval):
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                continue
+            if mtime != self._mtime:
+                logger.info(f"{self.path} changed, reloading disease knowledge")
+                self.load()
+                self.reloads += 1
+
+    def start_watching(self):
+        if self.reload_interval <= 0 or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, name="knowledge-reload", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop.set()
@@ -0,0 +1,221 @@
+"""
+Minimal Prometheus-style metrics for the prediction pipeline.
+
+A small in-process registry of counters, gauges and histograms rendered in
+the Prometheus text exposition format at /metrics. It avoids a
+prometheus_client dependency and keeps observation cheap enough for the hot
+path: a lock and a few additions per sample.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from sub-millisecond cache hits to multi-second cold batches
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # callback() -> value (or {label_tuple: value}) is evaluated at scrape time,
+        # for numbers another component already tracks
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _items(self) -> list:
+        if self.callback is not None:
+            value = self.callback()
+            return sorted(value.items()) if isinstance(value, dict) else [((), value)]
+        with self._lock:
+            return sorted(self._values.items())
+
+    def _key(self, labels):
+        if tuple(sorted(labels)) != tuple(sorted(self.labelnames)):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list:
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, key)} {float(v)}" for key, v in self._items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount=1.0, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def render(self) -> list:
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, key)} {float(v)}" for key, v in self._items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][position] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted((key, ([*state[0]], state[1], state[2])) for key, state in self._values.items())
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Pipeline metrics shared by plantapi, the batcher and the inference pool
+STAGE_SECONDS = REGISTRY.histogram(
+    "plantsense_stage_seconds",
+    "Time spent in each stage of the prediction pipeline",
+    ["stage"],
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "plantsense_request_seconds",
+    "End-to-end request latency by endpoint",
+    ["endpoint"],
+)
+INFERENCE_QUEUE_SECONDS = REGISTRY.histogram(
+    "plantsense_inference_queue_seconds",
+    "Time a forward pass waited for a free inference worker",
+)
+BATCH_SIZE = REGISTRY.histogram(
+    "plantsense_batch_size",
+    "Images per forward pass",
+    buckets=SIZE_BUCKETS,
+)
+PREDICTIONS = REGISTRY.counter(
+    "plantsense_predictions_total",
+    "Predictions served, by predicted class",
+    ["disease"],
+)
+UNCERTAIN_PREDICTIONS = REGISTRY.counter(
+    "plantsense_uncertain_predictions_total",
+    "Predictions whose top confidence fell below CONFIDENCE_THRESHOLD",
+)
+REJECTED_REQUESTS = REGISTRY.counter(
+    "plantsense_rejected_requests_total",
+    "Requests turned away before inference, by reason",
+    ["reason"],
+)
+INFLIGHT_REQUESTS = REGISTRY.gauge(
+    "plantsense_inflight_requests",
+    "Prediction requests currently being processed",
+    ["endpoint"],
+)
+SHADOW_PREDICTIONS = REGISTRY.counter(
+    "plantsense_shadow_predictions_total",
+    "Sampled requests scored by the shadow model, by outcome",
+    ["result"],
+)
+SHADOW_SECONDS = REGISTRY.histogram(
+    "plantsense_shadow_forward_seconds",
+    "Single-image forward pass time of the shadow model",
+)
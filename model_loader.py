@@ -0,0 +1,104 @@
+"""
+Background model loading.
+
+The API binds its port immediately and loads (and warms) the model on a
+daemon thread, so TensorFlow's import and the H5 load never delay startup.
+Request handlers await readiness with a timeout instead of the process
+blocking at import time.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ModelNotReadyError(Exception):
+    """Raised when the model is still loading (or failed to load)."""
+
+
+class ModelLoader:
+    """Loads a model once on a background thread and tracks its readiness."""
+
+    def __init__(self, load_fn, name="model"):
+        self.load_fn = load_fn
+        self.name = name
+        self.state = "pending"  # pending -> loading -> ready | failed
+        self.model = None
+        self.error = None
+        self.load_seconds = None
+        self._lock = threading.Lock()
+        self._waiters = []
+        self._thread = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.state = "loading"
+            self._thread = threading.Thread(target=self._load, name=f"{self.name}-loader", daemon=True)
+        self._thread.start()
+
+    def _load(self):
+        started = time.perf_counter()
+        try:
+            model = self.load_fn()
+        except Exception as e:
+            logger.error(f"Failed to load {self.name}: {e}")
+            with self._lock:
+                self.state, self.error = "failed", str(e)
+                waiters, self._waiters = self._waiters, []
+        else:
+            with self._lock:
+                self.model = model
+                self.load_seconds = time.perf_counter() - started
+                self.state = "ready"
+                waiters, self._waiters = self._waiters, []
+            logger.info(f"{self.name} ready after {self.load_seconds:.2f}s")
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def join(self, timeout: float = None) -> bool:
+        """Start loading if needed and block (off the event loop) until it finishes; True if ready."""
+        self.start()
+        self._thread.join(timeout)
+        return self.ready
+
+    async def wait_ready(self, timeout: float):
+        """Return the model once loaded, waiting at most `timeout` seconds."""
+        # Normally started at app startup; also start on first demand (e.g. when lifespan events are skipped)
+        self.start()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.state not in ("ready", "failed"):
+                future = loop.create_future()
+                self._waiters.append((loop, future))
+            else:
+                future = None
+        if future is not None:
+            try:
+                await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                raise ModelNotReadyError(f"{self.name} is still loading")
+        if self.state == "failed":
+            raise ModelNotReadyError(f"{self.name} failed to load: {self.error}")
+        return self.model
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "error": self.error,
+        }
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,398 @@
+"""
+Model versions served side by side, with hot swap and shadow scoring.
+
+models.json lists every model version with its file, optional backend and
+class list (in the order of the model's output units), plus which version is
+active and which, if any, shadows it:
+
+    {"active": "plant_disease_1",
+     "shadow": {"version": "plant_disease_2", "sample_rate": 0.05},
+     "versions": {"plant_disease_1": {"path": "plant_disease_1.h5", "classes": [...]}, ...}}
+
+The registry watches the manifest like the knowledge base watches its JSON.
+When "active" changes, the new version is loaded and warmed on a background
+thread while the current one keeps serving, then traffic switches with a
+single reference swap; the old version is retired once in-flight requests
+have drained. A shadow version scores a sample of live requests after the
+response has been sent, on the same inference executor as live traffic
+(the worker processes with INFERENCE_EXECUTOR=process) but only while one
+of its workers is free, recording top-1 agreement and latency so a candidate
+can be judged before it is promoted.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import metrics
+from backends import INFERENCE_BACKEND, backend_model_path
+from batching import MicroBatcher
+from knowledge_base import KnowledgeBase, normalize_name
+from model_loader import ModelLoader
+from prediction_cache import model_version_for
+
+logger = logging.getLogger(__name__)
+
+MODEL_MANIFEST = os.getenv("MODEL_MANIFEST", "models.json")
+MODEL_MANIFEST_RELOAD_INTERVAL = float(os.getenv("MODEL_MANIFEST_RELOAD_INTERVAL", "5"))  # seconds, 0 disables
+MODEL_ACTIVATE_TIMEOUT = float(os.getenv("MODEL_ACTIVATE_TIMEOUT", "600"))
+MODEL_RETIRE_AFTER = float(os.getenv("MODEL_RETIRE_AFTER", "30"))  # seconds a replaced version lingers for in-flight requests
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0.05"))
+SHADOW_MAX_PENDING = int(os.getenv("SHADOW_MAX_PENDING", "32"))
+
+IMAGE_SIZE = 256
+
+
+class ModelRegistryError(Exception):
+    """Raised for an invalid manifest or an unknown model version."""
+
+
+def load_manifest(path: str = MODEL_MANIFEST) -> dict:
+    """Read and validate the model manifest."""
+    with open(path) as f:
+        manifest = json.load(f)
+    versions = manifest.get("versions") or {}
+    for name, spec in versions.items():
+        if not spec.get("path") or not spec.get("classes"):
+            raise ModelRegistryError(f"Model version '{name}' in {path} needs a path and a classes list")
+    if manifest.get("active") not in versions:
+        raise ModelRegistryError(f"Active model '{manifest.get('active')}' is not listed in {path}")
+    shadow = manifest.get("shadow")
+    if shadow and shadow.get("version") not in versions:
+        raise ModelRegistryError(f"Shadow model '{shadow.get('version')}' is not listed in {path}")
+    return manifest
+
+
+def manifest_version(name_or_path: str = None, manifest_path: str = MODEL_MANIFEST) -> tuple:
+    """(name, spec) of the version with this name or model path; the active version by default."""
+    manifest = load_manifest(manifest_path)
+    versions = manifest["versions"]
+    if name_or_path is None:
+        return manifest["active"], versions[manifest["active"]]
+    if name_or_path in versions:
+        return name_or_path, versions[name_or_path]
+    for name, spec in versions.items():
+        if os.path.normpath(spec["path"]) == os.path.normpath(name_or_path):
+            return name, spec
+    raise ModelRegistryError(f"No version in {manifest_path} for '{name_or_path}'; add it with its class list")
+
+
+class ModelVersion:
+    """One model file with its class list, knowledge index and micro-batcher."""
+
+    def __init__(self, name: str, spec: dict, knowledge_path: str):
+        self.name = name
+        self.spec = spec
+        self.path = spec["path"]
+        self.backend = spec.get("backend", INFERENCE_BACKEND)
+        self.class_names = list(spec["classes"])
+        self.knowledge = KnowledgeBase(knowledge_path, self.class_names)
+        self.loader = None
+        # Set once loaded
+        self.predict_fn = None
+        self.batcher = None
+        self.cache_version = None
+
+    def class_name(self, index: int) -> str:
+        return self.class_names[index] if 0 <= index < len(self.class_names) else str(index)
+
+    def check_outputs(self, num_outputs: int):
+        """Refuse a model whose output layer doesn't match this version's class list."""
+        if num_outputs != len(self.class_names):
+            raise ValueError(
+                f"{self.path} has {num_outputs} outputs but version '{self.name}' lists {len(self.class_names)} classes"
+            )
+
+    def status(self) -> dict:
+        return {"path": self.path, "backend": self.backend, "classes": len(self.class_names), **self.loader.status()}
+
+
+class ModelRegistry:
+    """Model versions by name, with one active version and an optional shadow."""
+
+    def __init__(self, load_fn, runner=None, caches=(), knowledge_path="plant_disease_database.json",
+                 manifest_path=MODEL_MANIFEST, reload_interval=MODEL_MANIFEST_RELOAD_INTERVAL, busy=None):
+        # load_fn(version) loads and warms one version and returns its predict function
+        self.load_fn = load_fn
+        self.runner = runner
+        # busy() is true while live traffic occupies the runner; shadow passes are skipped then
+        self.busy = busy or (lambda: False)
+        # Anything with set_model_version(): the prediction cache, the near-duplicate index
+        self.caches = tuple(caches)
+        self.knowledge_path = knowledge_path
+        self.manifest_path = manifest_path
+        self.reload_interval = reload_interval
+
+        self._versions = {}
+        self._apply_lock = threading.Lock()
+        self._loop = None
+        self._stop = threading.Event()
+        self._watcher = None
+        self.swaps = 0
+
+        self._shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+        self._shadow_lock = threading.Lock()
+        self._shadow_pending = 0
+        self.shadow = None
+        self.shadow_sample_rate = 0.0
+        self._reset_shadow_stats()
+
+        manifest = load_manifest(manifest_path)
+        self._mtime = os.path.getmtime(manifest_path)
+        self._sync_versions(manifest)
+        self.active = self._versions[manifest["active"]]
+        self._initial_shadow = manifest.get("shadow")
+
+    # Versions
+
+    def _new_version(self, name: str, spec: dict) -> ModelVersion:
+        version = ModelVersion(name, spec, self.knowledge_path)
+        version.loader = ModelLoader(lambda: self._load(version), name=f"model '{name}'")
+        return version
+
+    def _sync_versions(self, manifest: dict):
+        """Track manifest entries; an edited or previously failed entry gets a fresh, unloaded version."""
+        versions = {}
+        for name, spec in manifest["versions"].items():
+            existing = self._versions.get(name)
+            if existing is None or existing.spec != spec or existing.loader.state == "failed":
+                versions[name] = self._new_version(name, spec)
+            else:
+                versions[name] = existing
+        self._versions = versions
+
+    def _load(self, version: ModelVersion):
+        predict_fn = self.load_fn(version)
+        version.predict_fn = predict_fn
+        version.batcher = MicroBatcher(predict_fn, runner=self.runner)
+        # Cached predictions are only valid for the exact model file that produced them
+        version.cache_version = model_version_for(backend_model_path(version.path, version.backend), version.backend)
+        if version is self.active:
+            self._promote(version)
+        return predict_fn
+
+    def _promote(self, version: ModelVersion):
+        for cache in self.caches:
+            cache.set_model_version(version.cache_version)
+        version.knowledge.start_watching()
+        # A single reference assignment: each request reads the active version once and sticks with it
+        self.active = version
+
+    def _retire_later(self, version: ModelVersion):
+        timer = threading.Timer(MODEL_RETIRE_AFTER, self._retire, args=(version,))
+        timer.daemon = True
+        timer.start()
+
+    def _retire(self, version: ModelVersion):
+        # Runs on a timer thread: serialize with reload(), which rebuilds the version table
+        with self._apply_lock:
+            if version is self.active or version is self.shadow:
+                return
+            version.knowledge.stop_watching()
+            if version.batcher is not None and self._loop is not None and not self._loop.is_closed():
+                asyncio.run_coroutine_threadsafe(version.batcher.close(), self._loop)
+            # Swap in an unloaded entry so the retired model can be garbage collected
+            if self._versions.get(version.name) is version:
+                self._versions[version.name] = self._new_version(version.name, version.spec)
+        logger.info(f"Retired model '{version.name}'")
+
+    # Lifecycle
+
+    def start(self):
+        """Load the active version in the background and start watching the manifest."""
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        self.active.loader.start()
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, name="model-registry", daemon=True)
+            self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+        self._shadow_executor.shutdown(wait=False, cancel_futures=True)
+        for version in list(self._versions.values()) + [self.active]:
+            version.knowledge.stop_watching()
+
+    async def wait_ready(self, timeout: float) -> ModelVersion:
+        """Return the active version once it is loaded, waiting at most `timeout` seconds."""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        version = self.active
+        await version.loader.wait_ready(timeout)
+        return version
+
+    def _watch(self):
+        if self._initial_shadow:
+            with self._apply_lock:
+                self._apply_shadow(self._initial_shadow)
+        if self.reload_interval <= 0:
+            return
+        while not self._stop.wait(self.reload_interval):
+            try:
+                mtime = os.path.getmtime(self.manifest_path)
+            except OSError:
+                continue
+            if mtime != self._mtime:
+                self._mtime = mtime
+                logger.info(f"{self.manifest_path} changed, reconciling model versions")
+                try:
+                    self.reload()
+                except Exception as e:
+                    logger.error(f"Could not apply {self.manifest_path}: {e}")
+
+    def reload(self):
+        """Re-read the manifest and converge on its active and shadow versions; blocks while loading."""
+        with self._apply_lock:
+            manifest = load_manifest(self.manifest_path)
+            self._sync_versions(manifest)
+            self._apply_active(manifest["active"])
+            self._apply_shadow(manifest.get("shadow"))
+
+    def _apply_active(self, name: str):
+        candidate = self._versions[name]
+        if candidate is self.active:
+            return
+        previous = self.active
+        logger.info(f"Loading model '{name}' before switching traffic from '{previous.name}'")
+        if not candidate.loader.join(MODEL_ACTIVATE_TIMEOUT):
+            logger.error(f"Model '{name}' did not become ready ({candidate.loader.error or 'timed out'}); "
+                         f"'{previous.name}' keeps serving")
+            return
+        self._promote(candidate)
+        self.swaps += 1
+        logger.info(f"Switched traffic from model '{previous.name}' to '{name}'")
+        if self.shadow is candidate:
+            self.shadow = None
+        self._retire_later(previous)
+
+    # Shadow scoring
+
+    def _reset_shadow_stats(self):
+        self.shadow_stats = {
+            "scored": 0, "agreed": 0, "errors": 0, "dropped": 0,
+            "seconds_total": 0.0, "max_seconds": 0.0, "confidence_delta_total": 0.0,
+        }
+
+    def _apply_shadow(self, shadow_spec: dict):
+        previous = self.shadow
+        if not shadow_spec:
+            if previous is not None:
+                logger.info(f"Shadow scoring with model '{previous.name}' stopped")
+                self.shadow = None
+                self._retire_later(previous)
+            return
+        candidate = self._versions[shadow_spec["version"]]
+        sample_rate = float(shadow_spec.get("sample_rate", SHADOW_SAMPLE_RATE))
+        if candidate is self.active:
+            logger.warning(f"Model '{candidate.name}' is active; not shadowing it against itself")
+            return
+        if candidate is previous:
+            self.shadow_sample_rate = sample_rate
+            return
+        if not candidate.loader.join(MODEL_ACTIVATE_TIMEOUT):
+            logger.error(f"Shadow model '{candidate.name}' did not become ready: {candidate.loader.error or 'timed out'}")
+            return
+        # Pay any lazy setup now rather than in the first measurement
+        sample = np.zeros((1, IMAGE_SIZE, IMAGE_SIZE, 3), dtype=np.uint8)
+        try:
+            self._shadow_executor.submit(self._shadow_forward, candidate, sample).result()
+        except Exception as e:
+            logger.error(f"Shadow model '{candidate.name}' failed its warmup pass: {e}")
+            return
+        self._reset_shadow_stats()
+        self.shadow, self.shadow_sample_rate = candidate, sample_rate
+        logger.info(f"Shadow scoring {sample_rate:.1%} of traffic with model '{candidate.name}'")
+        if previous is not None:
+            self._retire_later(previous)
+
+    def _shadow_forward(self, version: ModelVersion, batch: np.ndarray) -> np.ndarray:
+        """One shadow forward pass, through the same runner as live predictions.
+
+        With INFERENCE_EXECUTOR=process the predict function only works inside the
+        worker processes; calling it here would load the model into the API process.
+        """
+        if self.runner is None:
+            return version.predict_fn(batch)
+        if self._loop is None or self._loop.is_closed():
+            raise RuntimeError("no event loop to run the shadow pass on")
+        return asyncio.run_coroutine_threadsafe(self.runner(version.predict_fn, batch), self._loop).result()
+
+    def shadow_score(self, version: ModelVersion, image: np.ndarray, probabilities: np.ndarray):
+        """Maybe queue this request for the shadow model; never blocks or fails the caller."""
+        shadow = self.shadow
+        if shadow is None or shadow is version or random.random() >= self.shadow_sample_rate:
+            return
+        with self._shadow_lock:
+            if self._shadow_pending >= SHADOW_MAX_PENDING:
+                self.shadow_stats["dropped"] += 1
+                metrics.SHADOW_PREDICTIONS.inc(result="dropped")
+                return
+            self._shadow_pending += 1
+        try:
+            self._shadow_executor.submit(self._score_shadow, shadow, version, image, probabilities)
+        except RuntimeError:
+            # Executor shut down during app shutdown
+            with self._shadow_lock:
+                self._shadow_pending -= 1
+
+    def _score_shadow(self, shadow: ModelVersion, version: ModelVersion, image: np.ndarray, probabilities: np.ndarray):
+        try:
+            if self.busy():
+                # Shadow passes share the live executor; never make a live request wait behind one
+                self.shadow_stats["dropped"] += 1
+                metrics.SHADOW_PREDICTIONS.inc(result="busy")
+                return
+            started = time.perf_counter()
+            try:
+                shadow_probabilities = np.asarray(self._shadow_forward(shadow, image[np.newaxis]))[0]
+            except Exception as e:
+                logger.warning(f"Shadow model '{shadow.name}' failed: {e}")
+                self.shadow_stats["errors"] += 1
+                metrics.SHADOW_PREDICTIONS.inc(result="error")
+                return
+            elapsed = time.perf_counter() - started
+            if shadow is not self.shadow:
+                return
+            active_index, shadow_index = int(np.argmax(probabilities)), int(np.argmax(shadow_probabilities))
+            # Compare by class name, since versions may order or spell their classes differently
+            agreed = normalize_name(version.class_name(active_index)) == normalize_name(shadow.class_name(shadow_index))
+            stats = self.shadow_stats
+            stats["scored"] += 1
+            stats["agreed"] += agreed
+            stats["seconds_total"] += elapsed
+            stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+            stats["confidence_delta_total"] += float(shadow_probabilities[shadow_index]) - float(probabilities[active_index])
+            metrics.SHADOW_PREDICTIONS.inc(result="agree" if agreed else "disagree")
+            metrics.SHADOW_SECONDS.observe(elapsed)
+        finally:
+            with self._shadow_lock:
+                self._shadow_pending -= 1
+
+    def status(self) -> dict:
+        shadow = None
+        if self.shadow is not None:
+            stats = self.shadow_stats
+            scored = stats["scored"]
+            shadow = {
+                "version": self.shadow.name,
+                "sample_rate": self.shadow_sample_rate,
+                "scored": scored,
+                "agreement": round(stats["agreed"] / scored, 4) if scored else None,
+                "avg_ms": round(stats["seconds_total"] / scored * 1000.0, 3) if scored else None,
+                "max_ms": round(stats["max_seconds"] * 1000.0, 3),
+                "mean_confidence_delta": round(stats["confidence_delta_total"] / scored * 100, 2) if scored else None,
+                "errors": stats["errors"],
+                "dropped": stats["dropped"],
+            }
+        versions = {name: version.status() for name, version in self._versions.items()}
+        versions[self.active.name] = self.active.status()
+        return {"active": self.active.name, "swaps": self.swaps, "shadow": shadow, "versions": versions}
@@ -0,0 +1,321 @@
+"""
+One model-serving process shared by every HTTP worker.
+
+With `uvicorn --workers N` each worker imports TensorFlow and loads its own
+copy of the model: N times the memory and startup time, and N intra-op
+thread pools fighting over the same cores. Under serve.py a single model
+server owns the models and the node's compute threads instead, and the HTTP
+workers (which then never import TensorFlow) send it preprocessed images.
+
+Each client connection owns a shared-memory slot for up to
+MODEL_SERVER_SLOT_IMAGES uint8 images, so only a small header crosses the
+Unix socket. The server merges requests from all workers into one forward
+pass per model, so micro-batching also works across processes.
+"""
+
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from inference_pool import WORKER_MAX_MODELS
+
+logger = logging.getLogger(__name__)
+
+MODEL_SERVER_ADDRESS = os.getenv("MODEL_SERVER_ADDRESS")  # Unix socket path; set by serve.py
+MODEL_SERVER_AUTHKEY = os.getenv("MODEL_SERVER_AUTHKEY", "")
+MODEL_SERVER_CONNECTIONS = int(os.getenv("MODEL_SERVER_CONNECTIONS", "4"))  # per HTTP worker
+MODEL_SERVER_SLOT_IMAGES = int(os.getenv("MODEL_SERVER_SLOT_IMAGES", "32"))
+MODEL_SERVER_MAX_BATCH = int(os.getenv("MODEL_SERVER_MAX_BATCH", "64"))
+MODEL_SERVER_MAX_WAIT_MS = float(os.getenv("MODEL_SERVER_MAX_WAIT_MS", "2"))
+
+IMAGE_SHAPE = (256, 256, 3)
+
+
+class ModelServerError(Exception):
+    """Raised in an HTTP worker when the model server rejects or fails a request."""
+
+
+def _slot_array(shm: SharedMemory, images: int) -> np.ndarray:
+    return np.ndarray((images,) + IMAGE_SHAPE, dtype=np.uint8, buffer=shm.buf)
+
+
+def _attach(name: str) -> SharedMemory:
+    """Open a worker's segment without taking it over; the worker unlinks it."""
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=name, track=False)
+    # Attaching registers the name again, but serve.py's processes share one resource tracker
+    # that already holds it: the worker's unlink clears it, and the tracker reclaims it if a worker dies
+    return SharedMemory(name=name)
+
+
+class ModelServer:
+    """Accepts worker connections and runs their images through shared, cross-worker batches."""
+
+    def __init__(self, address: str, authkey: bytes, max_batch=MODEL_SERVER_MAX_BATCH,
+                 max_wait_ms=MODEL_SERVER_MAX_WAIT_MS):
+        self.address = address
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._listener = Listener(address, family="AF_UNIX", authkey=authkey)
+        self._work = queue.Queue()
+        self._models = OrderedDict()  # least recently used first
+        self._models_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._waiting = {}  # key -> requests queued until their model finishes loading
+
+    def _cached(self, key: tuple):
+        with self._models_lock:
+            model = self._models.get(key)
+            if model is not None:
+                self._models.move_to_end(key)
+            return model
+
+    def load(self, model_path: str, backend: str):
+        """Load (once) and return a model; concurrent workers asking for the same version share one load."""
+        key = (model_path, backend)
+        model = self._cached(key)
+        if model is not None:
+            return model
+        # Only loads are serialized; forward passes on already-loaded models never wait for a hot swap
+        with self._load_lock:
+            model = self._cached(key)
+            if model is None:
+                from backends import load_backend
+                model = load_backend(model_path, backend)
+                with self._models_lock:
+                    self._models[key] = model
+                    while len(self._models) > WORKER_MAX_MODELS:
+                        self._models.popitem(last=False)
+                logger.info(f"Model server loaded {model_path} ({backend} backend)")
+            return model
+
+    def _run_after_load(self, key: tuple, items: list):
+        """Hold requests for a model that isn't loaded, loading it off the batch thread."""
+        with self._models_lock:
+            waiting = self._waiting.get(key)
+            if waiting is not None:
+                waiting.extend(items)
+                return
+            self._waiting[key] = list(items)
+        threading.Thread(target=self._load_waiting, args=(key,), name="model-server-load", daemon=True).start()
+
+    def _load_waiting(self, key: tuple):
+        error = None
+        try:
+            self.load(*key)
+        except Exception as e:
+            logger.error(f"Could not load {key[0]}: {e}")
+            error = e
+        with self._models_lock:
+            items = self._waiting.pop(key)
+        for images, future in items:
+            if error is None:
+                self._work.put((key, images, future))
+            else:
+                future.set_exception(error)
+
+    def serve_forever(self):
+        threading.Thread(target=self._batch_loop, name="model-server-batches", daemon=True).start()
+        logger.info(f"Model server {os.getpid()} listening on {self.address}")
+        while True:
+            try:
+                conn = self._listener.accept()
+            except Exception as e:
+                # A client that fails authentication or hangs up mid-handshake
+                logger.warning(f"Rejected model server connection: {e}")
+                continue
+            threading.Thread(target=self._handle, args=(conn,), name="model-server-conn", daemon=True).start()
+
+    def _handle(self, conn):
+        shm, slot = None, None
+        try:
+            while True:
+                message = conn.recv()
+                try:
+                    op = message[0]
+                    if op == "attach":
+                        _, name, images = message
+                        shm = _attach(name)
+                        slot = _slot_array(shm, images)
+                        reply = None
+                    elif op == "load":
+                        _, model_path, backend = message
+                        model = self.load(model_path, backend)
+                        reply = int(np.shape(model(np.zeros((1,) + IMAGE_SHAPE, dtype=np.uint8)))[-1])
+                    elif op == "predict":
+                        _, model_path, backend, count = message
+                        future = Future()
+                        self._work.put(((model_path, backend), slot[:count], future))
+                        reply = future.result()
+                    else:
+                        raise ValueError(f"Unknown model server operation '{op}'")
+                except Exception as e:
+                    conn.send(("error", f"{type(e).__name__}: {e}"))
+                else:
+                    conn.send(("ok", reply))
+        except (EOFError, OSError):
+            pass  # worker exited or closed the connection
+        finally:
+            slot = None
+            if shm is not None:
+                try:
+                    shm.close()
+                except BufferError:
+                    pass  # a batch still references the slot; the mapping goes away with it
+            conn.close()
+
+    def _collect(self) -> list:
+        batch = [self._work.get()]
+        images = len(batch[0][1])
+        deadline = time.monotonic() + self.max_wait
+        while images < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._work.get(timeout=remaining) if remaining > 0 else self._work.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            images += len(item[1])
+        return batch
+
+    def _batch_loop(self):
+        while True:
+            groups = {}
+            for key, images, future in self._collect():
+                groups.setdefault(key, []).append((images, future))
+            for key, items in groups.items():
+                model = self._cached(key)
+                if model is None:
+                    # Evicted or never loaded: don't stall every other model's batches behind the load
+                    self._run_after_load(key, items)
+                    continue
+                try:
+                    outputs = np.asarray(model(np.concatenate([images for images, _ in items])))
+                except Exception as e:
+                    logger.error(f"Forward pass failed for {len(items)} request(s): {e}")
+                    for _, future in items:
+                        future.set_exception(e)
+                    continue
+                start = 0
+                for images, future in items:
+                    future.set_result(outputs[start:start + len(images)])
+                    start += len(images)
+
+
+def run_server(address: str, authkey: bytes, preload: list = ()):
+    """Entry point of the model server process started by serve.py."""
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+    server = ModelServer(address, authkey)
+    for model_path, backend in preload:
+        try:
+            server.load(model_path, backend)
+        except Exception as e:
+            # Workers will see the error when their registry asks for this version
+            logger.error(f"Could not preload {model_path}: {e}")
+    server.serve_forever()
+
+
+class ModelServerClient:
+    """A worker's pool of connections to the model server, each with its own shared-memory slot."""
+
+    def __init__(self, address=MODEL_SERVER_ADDRESS, authkey=MODEL_SERVER_AUTHKEY,
+                 connections=MODEL_SERVER_CONNECTIONS, slot_images=MODEL_SERVER_SLOT_IMAGES):
+        self.address = address
+        self.authkey = authkey.encode() if isinstance(authkey, str) else authkey
+        self.slot_images = max(1, int(slot_images))
+        # None marks a slot whose connection hasn't been opened yet (or was dropped)
+        self._slots = queue.Queue()
+        for _ in range(max(1, int(connections))):
+            self._slots.put(None)
+        self._open = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+        shm = SharedMemory(create=True, size=self.slot_images * int(np.prod(IMAGE_SHAPE)))
+        try:
+            self._request([conn, shm, None], ("attach", shm.name, self.slot_images))
+        except Exception:
+            conn.close()
+            shm.close()
+            shm.unlink()
+            raise
+        slot = [conn, shm, _slot_array(shm, self.slot_images)]
+        with self._lock:
+            self._open.append(slot)
+        return slot
+
+    def _discard(self, slot):
+        conn, shm, _ = slot
+        with self._lock:
+            if any(open_slot is slot for open_slot in self._open):
+                self._open = [open_slot for open_slot in self._open if open_slot is not slot]
+        slot[2] = None  # release the array view so the mapping can close
+        conn.close()
+        shm.close()
+        shm.unlink()
+
+    @staticmethod
+    def _request(slot, message):
+        conn = slot[0]
+        conn.send(message)
+        status, reply = conn.recv()
+        if status != "ok":
+            raise ModelServerError(reply)
+        return reply
+
+    def _call(self, fn):
+        slot = self._slots.get()
+        try:
+            if slot is None:
+                slot = self._connect()
+            return fn(slot)
+        except (EOFError, OSError):
+            # The connection is unusable; reopen it on next use
+            if slot is not None:
+                self._discard(slot)
+            slot = None
+            raise ModelServerError("Lost connection to the model server")
+        finally:
+            self._slots.put(slot)
+
+    def load(self, model_path: str, backend: str) -> int:
+        """Have the server load and warm a model; returns its number of outputs."""
+        return self._call(lambda slot: self._request(slot, ("load", model_path, backend)))
+
+    def predict(self, img_batch: np.ndarray, model_path: str, backend: str) -> np.ndarray:
+        def run(slot):
+            outputs = []
+            for start in range(0, len(img_batch), self.slot_images):
+                chunk = img_batch[start:start + self.slot_images]
+                slot[2][:len(chunk)] = chunk
+                outputs.append(self._request(slot, ("predict", model_path, backend, len(chunk))))
+            return np.concatenate(outputs)
+        return self._call(run)
+
+    def close(self):
+        with self._lock:
+            slots = list(self._open)
+        for slot in slots:
+            self._discard(slot)
+
+
+class RemoteModel:
+    """Callable stand-in for a loaded model whose forward passes run in the model server."""
+
+    def __init__(self, client: ModelServerClient, model_path: str, backend: str):
+        self.client = client
+        self.model_path = model_path
+        self.backend = backend
+
+    def __call__(self, img_batch: np.ndarray) -> np.ndarray:
+        return self.client.predict(img_batch, self.model_path, self.backend)
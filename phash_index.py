@@ -0,0 +1,230 @@
+"""
+Near-duplicate index of recent predictions, keyed by perceptual hash.
+
+The byte-keyed PredictionCache misses the most common kind of repeat: the
+same leaf photographed twice, or a photo recompressed and resized by a
+messaging app. This index hashes the decoded 256x256 image with a 64-bit
+DCT perceptual hash and returns the stored prediction of any image within
+PHASH_MAX_DISTANCE bits (Hamming distance), skipping the forward pass.
+
+Lookups use multi-index hashing: the 64 bits are split into
+PHASH_MAX_DISTANCE + 1 bands, and two hashes within that distance must agree
+exactly on at least one band (pigeonhole), so only the entries sharing a band
+value are compared bit by bit. Like PredictionCache, it is bounded (LRU),
+dropped when the model changes, and optionally snapshotted to disk.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PHASH_INDEX_SIZE = int(os.getenv("PHASH_INDEX_SIZE", "4096"))  # 0 disables near-duplicate lookups
+PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", "4"))  # bits out of 64
+PHASH_INDEX_TTL = float(os.getenv("PHASH_INDEX_TTL", "3600"))  # seconds, 0 disables expiry
+PHASH_INDEX_PATH = os.getenv("PHASH_INDEX_PATH")  # optional .npz snapshot
+
+HASH_BITS = 64
+# Hashes with fewer set (or unset) bits than this come from nearly flat images and match too much
+MIN_HASH_ENTROPY_BITS = 8
+
+_DCT_SIZE = 32
+
+
+def _dct_matrix(size: int) -> np.ndarray:
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2.0 / size)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT = _dct_matrix(_DCT_SIZE)
+
+
+def perceptual_hash(image: np.ndarray) -> int:
+    """64-bit DCT hash of an (H, W, 3) uint8 image: low frequencies of a 32x32 grey thumbnail vs their median."""
+    grey = image.astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    height, width = grey.shape
+    # Block-average down to 32x32; the 256x256 model input divides evenly
+    block_h, block_w = height // _DCT_SIZE, width // _DCT_SIZE
+    grey = grey[:block_h * _DCT_SIZE, :block_w * _DCT_SIZE]
+    thumbnail = grey.reshape(_DCT_SIZE, block_h, _DCT_SIZE, block_w).mean(axis=(1, 3))
+    low = (_DCT @ thumbnail @ _DCT.T)[:8, :8].ravel()
+    bits = low > np.median(low[1:])
+    bits[0] = False  # the DC term only encodes overall brightness
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class NearDuplicateIndex:
+    """Thread-safe LRU of probability vectors, looked up by perceptual-hash distance."""
+
+    def __init__(self, max_entries=PHASH_INDEX_SIZE, max_distance=PHASH_MAX_DISTANCE,
+                 ttl_seconds=PHASH_INDEX_TTL, persist_path=PHASH_INDEX_PATH):
+        self.max_entries = max(0, int(max_entries))
+        self.max_distance = max(0, min(int(max_distance), HASH_BITS - 1))
+        self.ttl = float(ttl_seconds)
+        self.persist_path = persist_path
+        self.model_version = None
+        self._entries = OrderedDict()  # hash -> (probabilities, stored_at)
+        bands = self.max_distance + 1
+        edges = np.linspace(0, HASH_BITS, bands + 1).round().astype(int)
+        self._bands = [(int(start), (1 << int(end - start)) - 1) for start, end in zip(edges[:-1], edges[1:])]
+        self._tables = [{} for _ in self._bands]  # band value -> set of hashes
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.skipped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.model_version is not None
+
+    def set_model_version(self, version: str):
+        """Switch to a new model version, dropping entries computed by the old one."""
+        with self._lock:
+            if version == self.model_version:
+                return
+            if self._entries:
+                logger.info(f"Model changed to {version}; invalidating {len(self._entries)} near-duplicate entries")
+            self.model_version = version
+            self._clear()
+        if self.persist_path:
+            self.load()
+
+    def _clear(self):
+        self._entries.clear()
+        for table in self._tables:
+            table.clear()
+
+    def _band_values(self, image_hash: int):
+        return [(image_hash >> shift) & mask for shift, mask in self._bands]
+
+    def _insert(self, image_hash: int, probabilities: np.ndarray, stored_at: float):
+        if image_hash not in self._entries:
+            for table, value in zip(self._tables, self._band_values(image_hash)):
+                table.setdefault(value, set()).add(image_hash)
+        self._entries[image_hash] = (probabilities, stored_at)
+        self._entries.move_to_end(image_hash)
+
+    def _remove(self, image_hash: int):
+        del self._entries[image_hash]
+        for table, value in zip(self._tables, self._band_values(image_hash)):
+            bucket = table[value]
+            bucket.discard(image_hash)
+            if not bucket:
+                del table[value]
+
+    def _current(self, model_version: str) -> bool:
+        return self.enabled and (model_version is None or model_version == self.model_version)
+
+    @staticmethod
+    def indexable(image_hash: int) -> bool:
+        return MIN_HASH_ENTROPY_BITS <= image_hash.bit_count() <= HASH_BITS - MIN_HASH_ENTROPY_BITS
+
+    def get(self, image_hash: int, model_version: str = None):
+        """Return (probabilities, distance) of the closest stored hash within max_distance, or None."""
+        if not self._current(model_version):
+            return None
+        if not self.indexable(image_hash):
+            self.skipped += 1
+            return None
+        now = time.time()
+        with self._lock:
+            best, best_distance = None, self.max_distance + 1
+            for table, value in zip(self._tables, self._band_values(image_hash)):
+                for candidate in table.get(value, ()):
+                    distance = hamming(image_hash, candidate)
+                    if distance < best_distance:
+                        best, best_distance = candidate, distance
+            if best is not None and self.ttl and now - self._entries[best][1] > self.ttl:
+                self._remove(best)
+                best = None
+            if best is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best)
+            self.hits += 1
+            return self._entries[best][0], best_distance
+
+    def put(self, image_hash: int, probabilities: np.ndarray, model_version: str = None):
+        if not self._current(model_version) or not self.indexable(image_hash):
+            return
+        # Read-only copy so a caller can't mutate what other requests will receive
+        probabilities = np.array(probabilities, dtype=np.float32)
+        probabilities.setflags(write=False)
+        with self._lock:
+            self._insert(image_hash, probabilities, time.time())
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def save(self):
+        """Snapshot live entries to persist_path (an .npz file)."""
+        if not self.persist_path or self.model_version is None:
+            return
+        with self._lock:
+            hashes = list(self._entries.keys())
+            values = list(self._entries.values())
+        if not hashes:
+            return
+        tmp_path = f"{self.persist_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                model_version=np.array(self.model_version),
+                hashes=np.array(hashes, dtype=np.uint64),
+                probabilities=np.stack([probabilities for probabilities, _ in values]),
+                stored_at=np.array([stored_at for _, stored_at in values], dtype=np.float64),
+            )
+        os.replace(tmp_path, self.persist_path)
+        logger.info(f"Saved {len(hashes)} near-duplicate entries to {self.persist_path}")
+
+    def load(self):
+        """Restore a snapshot written by save(), if it matches the current model version."""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with np.load(self.persist_path, allow_pickle=False) as snapshot:
+                if str(snapshot["model_version"]) != self.model_version:
+                    logger.info("Discarding near-duplicate snapshot from a different model version")
+                    return
+                hashes, probabilities, stored_at = snapshot["hashes"], snapshot["probabilities"], snapshot["stored_at"]
+        except Exception as e:
+            logger.warning(f"Could not load near-duplicate index from {self.persist_path}: {e}")
+            return
+        now = time.time()
+        with self._lock:
+            for image_hash, row, stamp in zip(hashes, probabilities, stored_at):
+                if self.ttl and now - stamp > self.ttl:
+                    continue
+                row.setflags(write=False)
+                self._insert(int(image_hash), row, float(stamp))
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+        logger.info(f"Restored {len(self._entries)} near-duplicate entries from {self.persist_path}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "max_distance": self.max_distance,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "skipped_flat_images": self.skipped,
+        }
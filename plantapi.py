@@ -1,21 +1,36 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-import json
 import logging
 import os
 from dotenv import load_dotenv
 
 load_dotenv()  # loads .env from the project root
 import numpy as np
-import tensorflow as tf
-from PIL import Image
-from io import BytesIO
-from fastapi.responses import FileResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi import UploadFile, File, HTTPException, Request
-from fastapi.staticfiles import StaticFiles
-from livekit import api
+from starlette.routing import compile_path
+from typing import List
+import asyncio
 import time
-import random
+from functools import lru_cache, partial
+from fast_json import FastJSONResponse, dumps
+from backends import load_backend
+from batching import BatcherClosedError, QueueFullError
+from batch_upload import BATCH_MAX_ITEMS, BATCH_MAX_UPLOAD_BYTES, BATCH_PREDICT_SIZE, MAX_IMAGE_BYTES, BatchItem, expand_archive, is_archive
+from inference_pool import InferencePool, ServerBusyError, INFERENCE_EXECUTOR, RETRY_AFTER_SECONDS, predict_in_worker
+import metrics
+from model_loader import ModelNotReadyError
+from model_registry import ModelRegistry
+from model_server import MODEL_SERVER_ADDRESS, ModelServerClient, RemoteModel
+from phash_index import NearDuplicateIndex, perceptual_hash
+from plantsense_voice.token_service import VoiceTokenService, voice_token_router
+from prediction_cache import PredictionCache
+from preprocessing import decode_image
+from request_logging import log_event, setup_logging
+from static_serving import StaticSite
+import tta
+from tiling import SCAN_MAX_IMAGE_PIXELS, SCAN_MAX_UPLOAD_BYTES, plan_scan, predict_tiles, summarize_scan
+from upload_validation import MULTIPART_OVERHEAD, UploadLimitMiddleware, UploadRejected, check_header, read_upload
 
 
 
@@ -23,22 +38,35 @@ import random
 
 app = FastAPI(title="Plant Disease API", description="Plant disease classification with symptoms and remedies")
 
-if os.path.exists("build/static"):
-    app.mount("/static", StaticFiles(directory="build/static"), name="static")
+# The React build is served from memory with precompressed variants; see the catch-all route at the end
+STATIC_SITE = StaticSite()
 
 CONFIDENCE_THRESHOLD = 0.70
+# How long /predict waits for a still-loading model before answering 503
+MODEL_READY_TIMEOUT = float(os.getenv("MODEL_READY_TIMEOUT", "10"))
 
 # LiveKit configuration
 LIVEKIT_API_KEY = os.getenv("LIVEKIT_API_KEY")
 LIVEKIT_API_SECRET = os.getenv("LIVEKIT_API_SECRET")
 LIVEKIT_URL = os.getenv("LIVEKIT_URL")
+VOICE_TOKENS = VoiceTokenService(LIVEKIT_API_KEY, LIVEKIT_API_SECRET, LIVEKIT_URL)
 
-logging.basicConfig(level=logging.INFO)
+# Log handlers run on a background thread; per-request events are sampled
+setup_logging()
 logger = logging.getLogger(__name__)
 
 if not all([LIVEKIT_API_KEY, LIVEKIT_API_SECRET, LIVEKIT_URL]):
     logger.warning("Missing required LiveKit configuration in environment variables. /voice-token will require these to be set.")
 
+# Oversized bodies are refused before Starlette spools them to disk (added first, so CORS headers still wrap its 413s)
+app.add_middleware(
+    UploadLimitMiddleware,
+    limits={
+        "/predict": MAX_IMAGE_BYTES + MULTIPART_OVERHEAD,
+        "/predict/batch": BATCH_MAX_UPLOAD_BYTES,
+        "/scan": SCAN_MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD,
+    },
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], 
@@ -48,181 +76,281 @@ app.add_middleware(
 )
 
 @app.get("/")
-async def root():
+async def root(request: Request):
+    # Browsers get the frontend; API clients and uptime checks keep getting the status JSON
+    if STATIC_SITE.enabled and "text/html" in request.headers.get("accept", ""):
+        return STATIC_SITE.response("index.html", request.headers, request.method)
     return {"status": "online", "service": "PlantSense AI Backend"}
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"} 
+    """Liveness: the process is up and serving, whether or not the model has loaded."""
+    return {"status": "healthy", "model": MODEL_REGISTRY.active.loader.state}
 
-# Load disease data
-disease_data = []
-if os.path.exists("plant_disease_database.json"):
-    try:
-        with open("plant_disease_database.json", "r") as f:
-            disease_data = json.load(f)
-    except Exception as e:
-        logger.error(f"Error loading disease database: {e}")
-
-MODEL = None
-MODEL_PATH = "plant_disease_1.h5"
-try:
-    if os.path.exists(MODEL_PATH):
-        MODEL = tf.keras.models.load_model(MODEL_PATH)
-        logger.info(f"Model loaded successfully from {MODEL_PATH}")
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness: the model is loaded and warmed, so /predict will not wait."""
+    status = {"version": MODEL_REGISTRY.active.name, **MODEL_REGISTRY.active.loader.status()}
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content={"status": "not ready", "model": status})
+    return {"status": "ready", "model": status}
+
+def load_serving_model(version):
+    """Load and warm one model version; runs on a loader thread so TensorFlow is imported off the startup path."""
+    if not os.path.exists(version.path):
+        raise FileNotFoundError(f"Model file not found at {version.path}")
+    if MODEL_SERVER is not None:
+        # Under serve.py one model server process holds the model for every HTTP worker
+        num_outputs = MODEL_SERVER.load(version.path, version.backend)
+        predict_fn = RemoteModel(MODEL_SERVER, version.path, version.backend)
+    elif INFERENCE_EXECUTOR == "process":
+        # Pool workers load their own copy; the parent waits for all of them to come up warm
+        num_outputs = INFERENCE_POOL.warmup(version.path, version.backend)
+        predict_fn = partial(predict_in_worker, model_path=version.path, backend=version.backend)
     else:
-        logger.warning(f"Model file not found at {MODEL_PATH}")
-except Exception as e:
-    logger.error(f"Failed to load model: {str(e)}")
-
-CLASS_NAMES = [
-    "Corn Cercospora leaf spot Gray leaf spot", 'Corn Common rust',
-    'Corn (maize) Northern Leaf Blight', 'Corn (maize) healthy',
-    'Potato Early blight', 'Potato Late_blight', 'Potato healthy',
-    'Tomato Bacterial spot', 'Tomato Early blight', 'Tomato Late blight',
-    'Tomato Leaf Mold', 'Tomato Septoria leaf spot',
-    'Tomato Spider mites Two-spotted spider mite', 'Tomato Target Spot',
-    'Tomato Yellow Leaf Curl Virus', 'Tomato mosaic virus',
-    'Tomato healthy'
-]
+        # Traced Keras function or an exported TFLite/ONNX model, warmed up before the first request
+        predict_fn = load_backend(version.path, version.backend)
+        num_outputs = predict_fn(np.zeros((1, 256, 256, 3), dtype=np.uint8)).shape[-1]
+    version.check_outputs(num_outputs)
+    logger.info(f"Model '{version.name}' loaded from {version.path} ({version.backend} backend)")
+    return predict_fn
+
+PREDICTION_CACHE = PredictionCache()
+# Catches re-shot and recompressed photos that the byte-keyed cache misses
+NEAR_DUPLICATES = NearDuplicateIndex()
+MODEL_SERVER = ModelServerClient() if MODEL_SERVER_ADDRESS else None
+
+# Decode and forward passes run on dedicated executors so the event loop stays free for /health
+INFERENCE_POOL = InferencePool()
+
+# Model versions and their class lists come from models.json; editing it swaps or shadows models live
+MODEL_REGISTRY = ModelRegistry(
+    load_serving_model,
+    runner=INFERENCE_POOL.run,
+    busy=INFERENCE_POOL.busy,
+    caches=(PREDICTION_CACHE, NEAR_DUPLICATES),
+    knowledge_path="plant_disease_database.json",
+)
+
+@app.on_event("startup")
+async def start_model_loading():
+    MODEL_REGISTRY.start()
+    STATIC_SITE.start()
+
+@app.on_event("shutdown")
+async def shutdown_inference():
+    MODEL_REGISTRY.stop()
+    if MODEL_REGISTRY.active.batcher is not None:
+        await MODEL_REGISTRY.active.batcher.close()
+    INFERENCE_POOL.shutdown()
+    if MODEL_SERVER is not None:
+        MODEL_SERVER.close()
+    PREDICTION_CACHE.save()
+    NEAR_DUPLICATES.save()
+
+# Model state is read at scrape time rather than pushed on every transition
+metrics.REGISTRY.gauge(
+    "plantsense_model_ready",
+    "1 when the model is loaded and warmed, else 0",
+    callback=lambda: 1.0 if MODEL_REGISTRY.active.loader.ready else 0.0,
+)
+metrics.REGISTRY.gauge(
+    "plantsense_model_load_state",
+    "Current model loader state (1 for the active state)",
+    ["state"],
+    callback=lambda: {(state,): float(MODEL_REGISTRY.active.loader.state == state) for state in ("pending", "loading", "ready", "failed")},
+)
+metrics.REGISTRY.gauge(
+    "plantsense_model_active",
+    "1 for the model version currently serving /predict",
+    ["version"],
+    callback=lambda: {(MODEL_REGISTRY.active.name,): 1.0},
+)
+metrics.REGISTRY.counter(
+    "plantsense_model_swaps_total",
+    "Times traffic was switched to a different model version",
+    callback=lambda: MODEL_REGISTRY.swaps,
+)
+metrics.REGISTRY.gauge(
+    "plantsense_inference_queue_depth",
+    "Images waiting in the micro-batching queue",
+    callback=lambda: MODEL_REGISTRY.active.batcher.stats()["queue_depth"] if MODEL_REGISTRY.active.batcher else 0,
+)
+metrics.REGISTRY.counter(
+    "plantsense_prediction_cache_requests_total",
+    "Prediction cache lookups by result",
+    ["result"],
+    callback=lambda: {("hit",): PREDICTION_CACHE.hits, ("miss",): PREDICTION_CACHE.misses},
+)
+metrics.REGISTRY.counter(
+    "plantsense_near_duplicate_requests_total",
+    "Perceptual-hash index lookups by result",
+    ["result"],
+    callback=lambda: {("hit",): NEAR_DUPLICATES.hits, ("miss",): NEAR_DUPLICATES.misses},
+)
+metrics.REGISTRY.counter(
+    "plantsense_voice_token_requests_total",
+    "/voice-token requests by result",
+    ["result"],
+    callback=lambda: {("issued",): VOICE_TOKENS.issued, ("reused",): VOICE_TOKENS.reused, ("rate_limited",): VOICE_TOKENS.rate_limited},
+)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return Response(content=metrics.REGISTRY.render(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+@app.get("/stats")
+async def stats():
+    batcher = MODEL_REGISTRY.active.batcher
+    return {
+        "model": {"version": MODEL_REGISTRY.active.name, **MODEL_REGISTRY.active.loader.status()},
+        "cache": PREDICTION_CACHE.stats(),
+        "near_duplicates": NEAR_DUPLICATES.stats(),
+        "batching": batcher.stats() if batcher is not None else None,
+        "inference": INFERENCE_POOL.stats(),
+        "voice_tokens": VOICE_TOKENS.stats(),
+    }
+
+@app.get("/api/models")
+async def models():
+    """Model versions, which one is serving, and shadow agreement/latency if a candidate is shadowing."""
+    return MODEL_REGISTRY.status()
 
 def read_file_as_image(data) -> np.ndarray:
-    """Process uploaded image data and prepare it for model prediction."""
+    """Process uploaded image data and prepare it for model prediction (256x256x3 uint8)."""
     try:
-        image = Image.open(BytesIO(data)).convert("RGB")
-        image = image.resize((256, 256))
-        image_array = np.array(image, dtype=np.float32)
-        return image_array
+        with metrics.STAGE_SECONDS.time(stage="decode"):
+            return decode_image(data)
     except Exception as e:
         raise ValueError(f"Error processing image: {str(e)}")
+
+
+def read_file_as_hashed_image(data):
+    """read_file_as_image plus the perceptual hash of the resized array, for the near-duplicate index."""
+    image = read_file_as_image(data)
+    with metrics.STAGE_SECONDS.time(stage="phash"):
+        return image, perceptual_hash(image)
  
 
 
 
 
 
-@app.post("/voice-token")
-async def get_voice_token(request: Request):
-    """Generate a LiveKit token for voice assistant connection."""
-    try:
-        # Extract prediction data from request body if provided
-        prediction_data = None
-        try:
-            body = await request.json()
-            prediction_data = body.get("predictionData", None)
-        except:
-            # Request body might be empty, which is fine
-            pass
-        
-        # Generate a unique identity for current user session
-        identity = f"user_{int(time.time() * 1000)}"
-        # Use a fixed room name so the Windows agent (agent_windows.py) is always in the same room
-        room_name = "plant-voice-assistant"
-        
-        # Create token with LiveKit API
-        token = api.AccessToken(LIVEKIT_API_KEY, LIVEKIT_API_SECRET)
-        token.with_identity(identity).with_name(identity).with_grants(
-            api.VideoGrants(
-                room_join=True,
-                room=room_name,
-                can_publish=True,
-                can_subscribe=True,
-            )
-        )
-        
-        jwt_token = token.to_jwt()
-        
-        logger.info(f"Generated voice token for identity: {identity}, room: {room_name}")
-        if prediction_data:
-            logger.info(f"Prediction data provided: {prediction_data}")
-        
-        return {
-            "token": jwt_token,
-            "url": LIVEKIT_URL,
-            "room": room_name,
-            "predictionData": prediction_data
-        }
-    except Exception as e:
-        logger.error(f"Error generating voice token: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to generate voice token: {str(e)}")
+# One implementation shared with plantsense_voice/token_server.py: pre-keyed signing, per-session grant cache, per-client rate limit
+app.include_router(voice_token_router(VOICE_TOKENS))
+
+
+def build_prediction_response(probabilities: np.ndarray, version, full: bool = False) -> dict:
+    """Shape a probability vector into the /predict response: top-3, description and uncertainty flag.
+
+    Percentages are rounded in one numpy call; with `full` the whole vector is
+    returned as an array, which FastJSONResponse serializes without a Python loop.
+    """
+    percentages = np.round(np.asarray(probabilities, dtype=np.float64) * 100, 2)
+    top3_indices = np.argsort(probabilities)[-3:][::-1].tolist()
+    predicted_index = int(np.argmax(probabilities))
+    confidence = float(percentages[predicted_index])
+    predicted_class = version.class_name(predicted_index)
+
+    # Get disease info - randomly select from the responses indexed for this class
+    with metrics.STAGE_SECONDS.time(stage="knowledge_lookup"):
+        description = version.knowledge.describe(predicted_index)
+
+    metrics.PREDICTIONS.inc(disease=predicted_class)
+    is_uncertain = confidence < CONFIDENCE_THRESHOLD * 100
+    if is_uncertain:
+        metrics.UNCERTAIN_PREDICTIONS.inc()
+
+    response = {
+        "disease": predicted_class,
+        "description": description,
+        "confidence": confidence,
+        "predictions": [
+            {"disease": version.class_name(idx), "confidence": confidence_pct}
+            for idx, confidence_pct in zip(top3_indices, percentages[top3_indices].tolist())
+        ],
+        "isUncertain": is_uncertain,
+    }
+    if full:
+        response["classes"] = version.class_names
+        response["probabilities"] = percentages
+    return response
 
 
 @app.post("/predict")
-async def predict(file: UploadFile = File(...)):
+async def predict(file: UploadFile = File(...), full: bool = False):
     """Predict plant disease from uploaded image."""
+    started = time.perf_counter()
+    with metrics.INFLIGHT_REQUESTS.track_inprogress(endpoint="predict"):
+        response = await _predict(file, full)
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint="predict")
+    return response
+
+
+async def _predict(file: UploadFile, full: bool = False):
+    started = time.perf_counter()
+    cached = escalated = near_duplicate = False
     try:
-        #File type and size validation
-        if not file.content_type or not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="File must be an image")
-        
-        
-        file_content = await file.read()
-        if len(file_content) > 10 * 1024 * 1024:
-            raise HTTPException(status_code=400, detail="File size must be less than 10MB")
-        
-        
-        image = read_file_as_image(file_content)
-        img_batch = np.expand_dims(image, 0)
-        
-        # Check if model is loaded
-        if MODEL is None:
-            raise HTTPException(status_code=503, detail="Model not available")
-        
-        # Prediction Logic
-        logger.info(f"Making prediction for file: {file.filename}")
-        logger.info(f"Image shape after preprocessing: {img_batch.shape}")
-        predictions = MODEL.predict(img_batch)
-        probabilities = predictions[0]
-        predicted_index = int(np.argmax(probabilities))
-        raw_confidence = float(np.max(probabilities))
-        confidence = round(raw_confidence * 100, 2)  # Convert to percentage
-        predicted_class = CLASS_NAMES[predicted_index] if predicted_index < len(CLASS_NAMES) else str(predicted_index)
-        
+        # File type, size and resolution are checked from the first chunks, before the image is decoded
+        with metrics.STAGE_SECONDS.time(stage="upload_read"):
+            file_content = await read_upload(file)
         
+        # Wait briefly for a model that is still loading rather than failing the first requests after a deploy
+        try:
+            # The version is fixed for the rest of the request, even if a hot swap happens meanwhile
+            version = await MODEL_REGISTRY.wait_ready(MODEL_READY_TIMEOUT)
+        except ModelNotReadyError as e:
+            logger.warning(str(e))
+            metrics.REJECTED_REQUESTS.inc(reason="model_not_ready")
+            raise HTTPException(
+                status_code=503,
+                detail="Model not available",
+                headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+            )
         
-        # Get top 3 predictions
-        top3_indices = np.argsort(probabilities)[-3:][::-1]
-        top3_predictions = []
-        for idx in top3_indices:
-            class_name = CLASS_NAMES[idx] if idx < len(CLASS_NAMES) else str(idx)
-            pred_conf = float(probabilities[idx])
-            top3_predictions.append({
-                "disease": class_name,
-                "confidence": round(pred_conf * 100, 2)  # Convert to percentage
-            })
-            
-        threshold_pct = CONFIDENCE_THRESHOLD * 100  # Convert threshold to percentage
-        if confidence < threshold_pct:
-            response = {
-                "class": predicted_class,  # Just use the predicted class as is
-                "confidence": confidence,
-                "predictions": top3_predictions,
-                "message": "PlantSense.ai is not able to make a confident prediction based on the provided image. This may be due to poor image quality or the disease not being represented in the training data."
-            }
+        # Repeat uploads of the same bytes skip decoding and the forward pass
+        probabilities = PREDICTION_CACHE.get(file_content, version.cache_version)
+        if probabilities is not None:
+            cached = True
         else:
-            response = {
-            "class": predicted_class,
-            "confidence": confidence,
-            "index": predicted_index,
-            "predictions": top3_predictions  # Add top 3 predictions to response
-        }
-            
-        
-        
-        
-        logger.info(f"Prediction response: {response}")
-        
-        
-        
-        
-        # Get disease info from .json file - randomly select from all matching entries
-        normalized_pred = predicted_class.lower().strip()
-        description = "Sorry, There's no detailed information for this disease yet."
-        matching_entries = [entry for entry in disease_data if entry["Disease"].lower().strip() == normalized_pred]
-        if matching_entries:
-            description = random.choice(matching_entries)["response"]
-
+            # Fail fast with 503 + Retry-After instead of queueing behind a saturated executor
+            try:
+                with INFERENCE_POOL.admit():
+                    image, image_hash = await INFERENCE_POOL.decode(read_file_as_hashed_image, file_content)
+                    # A re-shot or recompressed copy of a recent photo reuses its diagnosis
+                    near_match = NEAR_DUPLICATES.get(image_hash, version.cache_version)
+                    if near_match is not None:
+                        near_duplicate = True
+                        probabilities, distance = near_match
+                        logger.debug(f"Near-duplicate of a recent upload (distance {distance})")
+                    else:
+                        # Prediction Logic - the batcher runs this image together with any concurrent requests
+                        probabilities = model_probabilities = await version.batcher.submit(image)
+                        # Only the uncertain tail pays for test-time augmentation
+                        if tta.should_escalate(probabilities):
+                            escalated = True
+                            probabilities = (await tta.refine(
+                                image[np.newaxis], probabilities[np.newaxis], version.predict_fn, INFERENCE_POOL.run,
+                            ))[0]
+            except (ServerBusyError, QueueFullError, BatcherClosedError):
+                metrics.REJECTED_REQUESTS.inc(reason="busy")
+                raise HTTPException(
+                    status_code=503,
+                    detail="Server is busy, please retry shortly",
+                    headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+                )
+            if not near_duplicate:
+                PREDICTION_CACHE.put(file_content, probabilities, version.cache_version)
+                NEAR_DUPLICATES.put(image_hash, probabilities, version.cache_version)
+                # The shadow model is compared against the plain forward pass, not the augmented one
+                MODEL_REGISTRY.shadow_score(version, image, model_probabilities)
+        final_response = build_prediction_response(probabilities, version, full=full)
+        final_response["nearDuplicate"] = near_duplicate
     
+    except UploadRejected as e:
+        logger.warning(f"Rejected upload {file.filename}: {e}")
+        metrics.REJECTED_REQUESTS.inc(reason="invalid_upload")
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except ValueError as e:
         logger.warning(f"Validation error: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -233,27 +361,234 @@ async def predict(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
         
 
-    # Threshold Logic for uncertain predictions
-    threshold_pct = CONFIDENCE_THRESHOLD * 100  # Convert threshold to percentage
-    if confidence < threshold_pct:
-        final_response = {
-            "disease": predicted_class,  # Use the actual predicted class name
-            "description": description,  # Include the description of the top prediction
-            "confidence": confidence,  # Already in percentage
-            "predictions": top3_predictions,
-            "isUncertain": True
-        }
-    else:
-        final_response = {
-            "disease": predicted_class,
-            "description": description,
-            "confidence": confidence,  # Already in percentage
-            "predictions": top3_predictions,
-            "isUncertain": False
-        }
+    # Rendered here rather than by FastAPI so the cost shows up as a stage
+    with metrics.STAGE_SECONDS.time(stage="serialize"):
+        response = FastJSONResponse(final_response, headers={"X-Model-Version": version.name})
     
-    logger.info(f"Sending final response: {final_response}")
-    return final_response
+    log_event(
+        logger, "prediction",
+        filename=file.filename,
+        model=version.name,
+        disease=final_response["disease"],
+        confidence=final_response["confidence"],
+        uncertain=final_response["isUncertain"],
+        cached=cached,
+        tta=escalated,
+        near_duplicate=near_duplicate,
+        ms=round((time.perf_counter() - started) * 1000, 2),
+    )
+    return response
     
     
 
+
+
+async def _read_batch_items(files: List[UploadFile]) -> list:
+    """Turn uploaded files and archives into BatchItems, keeping per-file errors."""
+    items = []
+    for upload in files:
+        if len(items) >= BATCH_MAX_ITEMS:
+            break
+        if is_archive(upload.filename, upload.content_type):
+            # Read straight from the spooled upload, off the event loop: decompression is CPU-bound
+            expanded = await INFERENCE_POOL.decode(expand_archive, upload.filename, upload.file, BATCH_MAX_ITEMS - len(items))
+            for item in expanded:
+                if item.data is not None:
+                    try:
+                        check_header(item.data, complete=True)
+                    except UploadRejected as e:
+                        item.data, item.error = None, str(e)
+            items.extend(expanded)
+            continue
+        try:
+            items.append(BatchItem(upload.filename, data=await read_upload(upload)))
+        except UploadRejected as e:
+            items.append(BatchItem(upload.filename, error=str(e)))
+    return items
+
+
+async def _predict_batch_stream(items: list, version):
+    """Decode chunk N+1 while chunk N runs through the model, yielding one NDJSON line per image."""
+    async def decode_chunk(chunk):
+        async def decode(item):
+            """(image or probabilities, perceptual hash, near duplicate), looked up like /predict does."""
+            if item.error:
+                return None
+            cached = PREDICTION_CACHE.get(item.data, version.cache_version)
+            if cached is not None:
+                return cached, None, False
+            image, image_hash = await INFERENCE_POOL.decode(read_file_as_hashed_image, item.data)
+            near_match = NEAR_DUPLICATES.get(image_hash, version.cache_version)
+            if near_match is not None:
+                return near_match[0], None, True
+            return image, image_hash, False
+        return await asyncio.gather(*(decode(item) for item in chunk), return_exceptions=True)
+
+    chunks = [list(enumerate(items))[i:i + BATCH_PREDICT_SIZE] for i in range(0, len(items), BATCH_PREDICT_SIZE)]
+    try:
+        next_decode = asyncio.ensure_future(decode_chunk([item for _, item in chunks[0]])) if chunks else None
+        for chunk_number, chunk in enumerate(chunks):
+            decoded = await next_decode
+            if chunk_number + 1 < len(chunks):
+                next_decode = asyncio.ensure_future(decode_chunk([item for _, item in chunks[chunk_number + 1]]))
+
+            # Cache and near-duplicate hits come back as probability vectors, fresh decodes as 256x256x3 images
+            ok = {pos: result for pos, result in enumerate(decoded) if isinstance(result, tuple)}
+            to_run = [pos for pos, result in ok.items() if result[0].ndim == 3]
+            probabilities = {pos: result[0] for pos, result in ok.items() if result[0].ndim == 1}
+            batch_error = None
+            if to_run:
+                try:
+                    metrics.BATCH_SIZE.observe(len(to_run))
+                    images = np.stack([decoded[pos][0] for pos in to_run])
+                    outputs = np.array(await INFERENCE_POOL.run(version.predict_fn, images))
+                    # Uncertain images of the chunk share one augmented forward pass
+                    uncertain = [row for row, output in enumerate(outputs) if tta.should_escalate(output)]
+                    if uncertain:
+                        outputs[uncertain] = await tta.refine(
+                            images[uncertain], outputs[uncertain], version.predict_fn, INFERENCE_POOL.run,
+                        )
+                    for pos, row in zip(to_run, outputs):
+                        probabilities[pos] = row
+                        PREDICTION_CACHE.put(chunk[pos][1].data, row, version.cache_version)
+                        NEAR_DUPLICATES.put(decoded[pos][1], row, version.cache_version)
+                except Exception as e:
+                    logger.error(f"Batch prediction error: {str(e)}")
+                    batch_error = f"Prediction failed: {str(e)}"
+
+            for pos, (index, item) in enumerate(chunk):
+                line = {"index": index, "filename": item.filename}
+                if item.error:
+                    line["error"] = item.error
+                elif isinstance(decoded[pos], Exception):
+                    line["error"] = str(decoded[pos])
+                elif pos in probabilities:
+                    line.update(build_prediction_response(probabilities[pos], version))
+                    line["nearDuplicate"] = decoded[pos][2]
+                else:
+                    line["error"] = batch_error or "Prediction failed"
+                yield dumps(line) + b"\n"
+    finally:
+        if next_decode is not None and not next_decode.done():
+            next_decode.cancel()
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """A stream that holds an admission slot until the response ends, however it ends.
+
+    Releasing from the body generator would leak the slot when the client
+    disconnects before the body starts, since the generator then never runs.
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            INFERENCE_POOL.release()
+
+
+@app.post("/predict/batch")
+async def predict_batch_endpoint(files: List[UploadFile] = File(...)):
+    """Predict many images (or zip/tar archives of images), streaming one NDJSON result per image."""
+    try:
+        version = await MODEL_REGISTRY.wait_ready(MODEL_READY_TIMEOUT)
+    except ModelNotReadyError as e:
+        logger.warning(str(e))
+        metrics.REJECTED_REQUESTS.inc(reason="model_not_ready")
+        raise HTTPException(status_code=503, detail="Model not available", headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+    items = await _read_batch_items(files)
+    if not items:
+        raise HTTPException(status_code=400, detail="No images found in upload")
+
+    # The whole job holds one admission slot, released when the response ends
+    try:
+        INFERENCE_POOL.acquire()
+    except ServerBusyError:
+        metrics.REJECTED_REQUESTS.inc(reason="busy")
+        raise HTTPException(status_code=503, detail="Server is busy, please retry shortly", headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+    logger.info(f"Batch prediction for {len(items)} image(s)")
+    return AdmittedStreamingResponse(
+        _predict_batch_stream(items, version),
+        media_type="application/x-ndjson",
+        headers={"X-Model-Version": version.name},
+    )
+
+
+@app.post("/scan")
+async def scan(file: UploadFile = File(...)):
+    """Scan a wide field or whole-plant photo tile by tile; returns an aggregate diagnosis and a per-tile heatmap."""
+    started = time.perf_counter()
+    try:
+        data = await read_upload(file, max_bytes=SCAN_MAX_UPLOAD_BYTES, max_pixels=SCAN_MAX_IMAGE_PIXELS)
+        version = await MODEL_REGISTRY.wait_ready(MODEL_READY_TIMEOUT)
+        with INFERENCE_POOL.admit():
+            plan = await INFERENCE_POOL.decode(plan_scan, data)
+            if not len(plan.tiles):
+                raise ValueError("No plant material found in image")
+            probabilities = await predict_tiles(plan, version.predict_fn, INFERENCE_POOL.run)
+    except UploadRejected as e:
+        metrics.REJECTED_REQUESTS.inc(reason="invalid_upload")
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except ModelNotReadyError as e:
+        logger.warning(str(e))
+        metrics.REJECTED_REQUESTS.inc(reason="model_not_ready")
+        raise HTTPException(status_code=503, detail="Model not available", headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+    except (ServerBusyError, QueueFullError, BatcherClosedError):
+        metrics.REJECTED_REQUESTS.inc(reason="busy")
+        raise HTTPException(status_code=503, detail="Server is busy, please retry shortly", headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+    except ValueError as e:
+        logger.warning(f"Scan validation error: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Scan error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+    summary = summarize_scan(plan, probabilities, version.class_name, CONFIDENCE_THRESHOLD)
+    predicted_index = summary.pop("predictedIndex")
+    response = {
+        "disease": version.class_name(predicted_index),
+        "description": version.knowledge.describe(predicted_index),
+        "confidence": summary["confidence"],
+        "isUncertain": summary["confidence"] < CONFIDENCE_THRESHOLD * 100,
+        "scan": summary["scan"],
+    }
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint="scan")
+    log_event(
+        logger, "scan",
+        filename=file.filename,
+        model=version.name,
+        disease=response["disease"],
+        tiles=response["scan"]["tilesScanned"],
+        skipped=response["scan"]["tilesSkipped"],
+        ms=round((time.perf_counter() - started) * 1000, 2),
+    )
+    return FastJSONResponse(response, headers={"X-Model-Version": version.name})
+
+
+@lru_cache(maxsize=1)
+def api_routes() -> tuple:
+    """API path patterns with their methods, and the first path segments the API owns ("api" is reserved)."""
+    routes = [(compile_path(path)[0], {method.upper() for method in operations})
+              for path, operations in app.openapi()["paths"].items()]
+    prefixes = {"api"} | {path.strip("/").split("/", 1)[0] for path in app.openapi()["paths"] if path.strip("/")}
+    return routes, frozenset(prefixes)
+
+
+# Registered last so every API route above takes precedence
+@app.api_route("/{path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+async def frontend(path: str, request: Request):
+    """Frontend assets and the SPA fallback, served from memory."""
+    routes, prefixes = api_routes()
+    prefix = path.split("/", 1)[0]
+    # A browser opening or refreshing a client route (/predict, /scan...) gets the app, like / does;
+    # only /api/... is never a page
+    wants_page = STATIC_SITE.enabled and prefix != "api" and "text/html" in request.headers.get("accept", "")
+    if prefix in prefixes and not wants_page:
+        # API clients never get the SPA shell for a typo, or for a GET on a POST endpoint
+        for pattern, methods in routes:
+            if pattern.match("/" + path):
+                raise HTTPException(status_code=405, detail="Method Not Allowed", headers={"Allow": ", ".join(sorted(methods))})
+        raise HTTPException(status_code=404, detail="Not Found")
+    return STATIC_SITE.response(path, request.headers, request.method)
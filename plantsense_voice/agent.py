@@ -1,44 +1,63 @@
+import logging
+import time
+
 from dotenv import load_dotenv
 
 from livekit import agents
-from livekit.agents import AgentSession, Agent, RoomInputOptions, RoomOutputOptions
+from livekit.agents import AgentSession, Agent, ChatContext, ChatMessage, RoomInputOptions, RoomOutputOptions, StopResponse
 from livekit.plugins import noise_cancellation, silero
 
+from retrieval import ASSISTANT_INSTRUCTIONS, KnowledgeIndex, KnowledgeRouter, load_index, prediction_from_metadata
+
 load_dotenv(".env.local")
 
+logger = logging.getLogger(__name__)
+
+
+# First thing the agent says when a caller joins
+GREETING_INSTRUCTIONS = (
+    "Greet the user warmly as PlantSense-AI Voice Assistant. Let them know you can help diagnose plant diseases "
+    "and provide treatment advice. Ask them to describe their plant issue or tell you what plant they are concerned about."
+)
+
 
 class Assistant(Agent):
-    def __init__(self) -> None:
-        super().__init__(
-            instructions="""You are PlantSense Voice Assistant, a specialized AI for plant disease diagnosis and treatment.
-            
-            Your capabilities:
-            - Help users identify plant diseases based on their descriptions
-            - Provide detailed treatment advice and remedies
-            - Answer questions about plant health, symptoms, and care
-            - Guide users through the diagnosis process
-            
-            Your knowledge includes diseases for:
-            - Corn/Maize (Cercospora leaf spot, Common rust, Northern Leaf Blight)
-            - Potato (Early blight, Late blight)
-            - Tomato (Bacterial spot, Early blight, Late blight, Leaf Mold, Septoria leaf spot, Spider mites, Target Spot, Yellow Leaf Curl Virus, Mosaic virus)
-            
-            Communication style:
-            - Be conversational, friendly, and empathetic
-            - Use clear, simple language without technical jargon unless necessary
-            - Keep responses concise and to the point
-            - No emojis, asterisks, or complex formatting in speech
-            - Ask clarifying questions when needed
-            
-            When a user describes symptoms:
-            1. Ask about the plant type if not mentioned
-            2. Inquire about specific symptoms (leaf color, spots, wilting, etc.)
-            3. Provide your best diagnosis with confidence level
-            4. Offer treatment recommendations
-            5. Suggest preventive measures
-            
-            Always be helpful and encouraging to farmers and plant enthusiasts.""",
-        )
+    """Answers disease questions from the local knowledge index; the LLM only sees the snippets a turn needs."""
+
+    def __init__(self, knowledge: KnowledgeIndex = None, prediction: dict = None) -> None:
+        # knowledge is the index prewarm (or the supervisor) loaded once per process; None disables routing
+        super().__init__(instructions=ASSISTANT_INSTRUCTIONS)
+        self.router = KnowledgeRouter(knowledge, prediction)
+
+    def use_room_prediction(self, room) -> None:
+        """Pick up the diagnosis /voice-token attached to the caller's participant metadata."""
+        for participant in room.remote_participants.values():
+            prediction = prediction_from_metadata(participant.metadata)
+            if prediction:
+                self.router.set_prediction(prediction)
+
+    async def on_user_turn_completed(self, turn_ctx: ChatContext, new_message: ChatMessage) -> None:
+        text = new_message.text_content
+        if not text:
+            return
+        started = time.perf_counter()
+        route = self.router.route(text)
+        logger.info(f"Turn routed to {route.action} ({route.disease or 'no topic'}) in {(time.perf_counter() - started) * 1000:.2f} ms")
+        if route.action == "answer":
+            # Spoken straight from the database: no LLM round-trip for this turn
+            self.session.say(route.answer)
+            raise StopResponse()
+        if route.action == "ground":
+            # Reference material for this turn, not something the assistant has already said
+            turn_ctx.add_message(role="system", content=route.context)
+
+
+def prewarm(proc: agents.JobProcess):
+    # Loaded once per worker process instead of on every job
+    proc.userdata["vad"] = silero.VAD.load()
+    proc.userdata["knowledge"] = load_index()
+    if proc.userdata["knowledge"] is None:
+        logger.warning("No knowledge index available: voice turns will reach the LLM without PlantSense grounding")
 
 
 async def entrypoint(ctx: agents.JobContext):
@@ -46,12 +65,13 @@ async def entrypoint(ctx: agents.JobContext):
         stt="assemblyai/universal-streaming:en",
         llm="openai/gpt-4.1-mini",
         tts="cartesia/sonic-2:2ce680f2-df85-4b45-bcbd-231e7d4519bb",
-        vad=silero.VAD.load(),
+        vad=ctx.proc.userdata.get("vad") or silero.VAD.load(),
     )
 
+    assistant = Assistant(knowledge=ctx.proc.userdata.get("knowledge"))
     await session.start(
         room=ctx.room,
-        agent=Assistant(),
+        agent=assistant,
         room_input_options=RoomInputOptions(
             # For telephony applications, use `BVCTelephony` instead for best results
             noise_cancellation=noise_cancellation.BVC(),
@@ -63,10 +83,10 @@ async def entrypoint(ctx: agents.JobContext):
         ),
     )
 
-    await session.generate_reply(
-        instructions="Greet the user warmly as PlantSense-AI Voice Assistant. Let them know you can help diagnose plant diseases and provide treatment advice. Ask them to describe their plant issue or tell you what plant they're concerned about."
-    )
+    assistant.use_room_prediction(ctx.room)
+
+    await session.generate_reply(instructions=GREETING_INSTRUCTIONS)
 
 
 if __name__ == "__main__":
-    agents.cli.run_app(agents.WorkerOptions(entrypoint_fnc=entrypoint))
\ No newline at end of file
+    agents.cli.run_app(agents.WorkerOptions(entrypoint_fnc=entrypoint, prewarm_fnc=prewarm))
\ No newline at end of file
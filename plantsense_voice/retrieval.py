@@ -0,0 +1,365 @@
+"""
+Local retrieval over plant_disease_database.json for the voice assistant.
+
+Every user turn used to go to the remote LLM with a long static prompt that
+hard-coded the disease list. Instead, a BM25 index over the database is
+built once, saved as .npy postings and memory-mapped by every agent process
+(rebuilds swap in new files rather than rewriting mapped ones).
+KnowledgeRouter then decides per turn:
+
+  - answer: a treatment/description question that resolves to one disease
+    (named in the question, or the diagnosis the caller arrived with) is
+    answered from the database directly, with no LLM round-trip
+  - ground: anything else that matches the database gets only the few
+    relevant snippets injected into the LLM turn
+  - pass: small talk and off-topic turns go to the LLM unchanged
+
+The diagnosis comes from the predictionData plantapi puts in the caller's
+token metadata, or from the context message the frontend sends on connect.
+
+Usage: python retrieval.py "how do I treat early blight on tomatoes"
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import sys
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DATABASE_PATH = os.getenv(
+    "KNOWLEDGE_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "plant_disease_database.json"),
+)
+RETRIEVAL_INDEX_DIR = os.getenv(
+    "RETRIEVAL_INDEX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".retrieval_index")
+)
+RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", "3.0"))  # below this a turn isn't about the database
+RETRIEVAL_ANSWER_MARGIN = float(os.getenv("RETRIEVAL_ANSWER_MARGIN", "1.25"))  # best disease vs the runner-up
+RETRIEVAL_SNIPPETS = int(os.getenv("RETRIEVAL_SNIPPETS", "3"))
+MAX_DIRECT_QUESTION_TERMS = 12  # longer turns carry detail the LLM should handle
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+NAME_WEIGHT = 2  # disease-name terms count this many times in their entry
+PREDICTION_BOOST = 1.5
+INDEX_FORMAT = 2
+
+# Replaces the static prompt that listed every disease: facts now arrive with each turn
+ASSISTANT_INSTRUCTIONS = """You are PlantSense Voice Assistant, helping farmers and gardeners diagnose and treat plant diseases.
+When PlantSense knowledge comes with the caller's message, base your answer on it. Otherwise answer briefly from \
+general knowledge, and suggest scanning a leaf photo in the app when the diagnosis is unclear.
+Speak in short, plain, friendly sentences with no emojis, asterisks or formatting. Ask about the plant or the \
+symptoms when they are unclear."""
+
+STOPWORDS = frozenset(
+    "a about an and any are as at be been but by can could did do does for from had has have how i if in is it "
+    "its just like me my of on or our please should so some tell that the their them there these they this to too "
+    "us was we what when where which who why will with would you your "
+    # Conversational filler: rare in the database, so it would otherwise score high
+    "bye cool good great hello hey hi no nice ok okay sure thank thanks yeah yes".split()
+)
+IRREGULAR = {"leaves": "leaf", "tomatoes": "tomato", "potatoes": "potato"}
+SUFFIXES = ("ment", "ing", "ed", "es", "s")
+
+ALIASES = {"corn cercospora leaf spot": "corn cercospora leaf spot gray leaf spot"}
+DIAGNOSIS_CONTEXT = re.compile(r"Disease:\s*(?P<disease>[^,]+),\s*Confidence:\s*(?P<confidence>[\d.]+)%", re.I)
+
+
+def _strip_suffix(token: str, suffixes) -> str:
+    for suffix in suffixes:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            if suffix == "s" and token.endswith(("ss", "us", "is")):  # grass, virus, analysis
+                return token
+            return token[:-len(suffix)]
+    return token
+
+
+def stem(token: str) -> str:
+    """Crude suffix stripping; it only has to map the database and the caller's words to the same stems."""
+    token = _strip_suffix(_strip_suffix(IRREGULAR.get(token, token), SUFFIXES), ("ment", "ing", "ed"))  # treatments -> treat
+    return token[:-1] if token.endswith("e") and len(token) > 3 else token  # cause, causes, caused -> caus
+
+
+# Question shapes the database can answer on its own
+ANSWER_INTENTS = frozenset(stem(word) for word in (
+    "treat cure control manage prevent spray fix stop remedy rid save kill fungicide "
+    "cause symptom sign look spread serious severe dangerous bad".split()
+))
+
+
+def tokenize(text: str) -> list:
+    return [stem(token) for token in re.findall(r"[a-z0-9]+", text.lower()) if len(token) > 1 and token not in STOPWORDS]
+
+
+def normalize_disease(name: str) -> str:
+    """Same normalization as the API's knowledge_base, so model class names match database names."""
+    normalized = re.sub(r"[^a-z0-9]+", " ", name.lower()).strip()
+    return ALIASES.get(normalized, normalized)
+
+
+def _database_digest(path: str) -> str:
+    """Identifies the database contents and the index parameters an index was built with."""
+    digest = hashlib.sha256(f"{INDEX_FORMAT}:{NAME_WEIGHT}:{BM25_K1}:{BM25_B}:{sorted(STOPWORDS)}".encode())
+    with open(path, "rb") as f:
+        digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def _write_atomic(path: str, write):
+    """Write a file beside its final name and rename it into place, so readers never see it half-written."""
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary, "wb") as f:
+            write(f)
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def _array_path(index_dir: str, name: str, digest: str) -> str:
+    return os.path.join(index_dir, f"{name}.{digest}.npy")
+
+
+def build_index(database_path: str = DATABASE_PATH, index_dir: str = RETRIEVAL_INDEX_DIR) -> str:
+    """Write the BM25 postings for the database to index_dir; returns the directory.
+
+    Other agent processes may have the current index memory-mapped while this runs.
+    The arrays are named after the digest in meta.json, so a rebuild never rewrites a
+    file in place. Every file is renamed into place, and meta.json is swapped last,
+    so a reader always opens one complete, matching set.
+    """
+    with open(database_path) as f:
+        entries = list({
+            (entry["Disease"], entry["response"]): entry for entry in json.load(f)
+            if entry.get("response") and entry.get("Disease", "Unknown") != "Unknown"
+        }.values())
+
+    documents = [tokenize(entry["Disease"]) * NAME_WEIGHT + tokenize(entry["response"]) for entry in entries]
+    vocabulary = sorted({term for document in documents for term in document})
+    term_ids = {term: i for i, term in enumerate(vocabulary)}
+    lengths = np.array([len(document) for document in documents], dtype=np.float64)
+    average_length = lengths.mean()
+
+    postings = [[] for _ in vocabulary]
+    for doc_id, document in enumerate(documents):
+        counts = {}
+        for term in document:
+            counts[term] = counts.get(term, 0) + 1
+        for term, count in counts.items():
+            postings[term_ids[term]].append((doc_id, count))
+
+    offsets, doc_ids, weights = [0], [], []
+    for term_postings in postings:
+        idf = math.log(1 + (len(documents) - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+        for doc_id, count in term_postings:
+            norm = count + BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc_id] / average_length)
+            doc_ids.append(doc_id)
+            weights.append(idf * count * (BM25_K1 + 1) / norm)
+        offsets.append(len(doc_ids))
+
+    digest = _database_digest(database_path)
+    os.makedirs(index_dir, exist_ok=True)
+    arrays = {
+        "offsets": np.array(offsets, dtype=np.int32),
+        "doc_ids": np.array(doc_ids, dtype=np.int32),
+        "weights": np.array(weights, dtype=np.float32),
+    }
+    for name, array in arrays.items():
+        _write_atomic(_array_path(index_dir, name, digest), lambda f, array=array: np.save(f, array))
+    # Swapped in last: its digest names the arrays that belong to it
+    meta = {
+        "digest": digest,
+        "vocabulary": vocabulary,
+        "diseases": [entry["Disease"] for entry in entries],
+        # Terms that name a plant or disease; a turn without any is about the caller's diagnosis
+        "name_terms": sorted({term for entry in entries for term in tokenize(entry["Disease"])} - {"healthy"}),
+        "responses": [entry["response"] for entry in entries],
+    }
+    _write_atomic(os.path.join(index_dir, "meta.json"), lambda f: f.write(json.dumps(meta).encode()))
+    # Processes that already mapped an older set keep it until they close; the names just go away
+    for name in os.listdir(index_dir):
+        if name.endswith(".npy") and not name.endswith(f".{digest}.npy"):
+            os.remove(os.path.join(index_dir, name))
+    return index_dir
+
+
+@dataclass
+class Hit:
+    disease: str
+    text: str
+    score: float
+
+
+class KnowledgeIndex:
+    """Memory-mapped BM25 postings plus the entry texts."""
+
+    def __init__(self, index_dir: str):
+        with open(os.path.join(index_dir, "meta.json")) as f:
+            meta = json.load(f)
+        self.digest = meta["digest"]
+        self.term_ids = {term: i for i, term in enumerate(meta["vocabulary"])}
+        self.diseases = meta["diseases"]
+        self.name_terms = frozenset(meta["name_terms"])
+        self.responses = meta["responses"]
+        self._offsets = np.load(_array_path(index_dir, "offsets", self.digest), mmap_mode="r")
+        self._doc_ids = np.load(_array_path(index_dir, "doc_ids", self.digest), mmap_mode="r")
+        self._weights = np.load(_array_path(index_dir, "weights", self.digest), mmap_mode="r")
+        self._disease_keys = np.array([normalize_disease(name) for name in self.diseases])
+
+    def scores(self, text: str) -> np.ndarray:
+        scores = np.zeros(len(self.diseases), dtype=np.float32)
+        for term in set(tokenize(text)):
+            term_id = self.term_ids.get(term)
+            if term_id is not None:
+                start, end = self._offsets[term_id], self._offsets[term_id + 1]
+                np.add.at(scores, self._doc_ids[start:end], self._weights[start:end])
+        return scores
+
+    def disease_mask(self, disease: str) -> np.ndarray:
+        return self._disease_keys == normalize_disease(disease)
+
+
+def _open_index(index_dir: str) -> KnowledgeIndex:
+    try:
+        return KnowledgeIndex(index_dir)
+    except FileNotFoundError:
+        # Another process swapped in a rebuild between our reading meta.json and its arrays
+        return KnowledgeIndex(index_dir)
+
+
+def load_index(database_path: str = DATABASE_PATH, index_dir: str = RETRIEVAL_INDEX_DIR):
+    """Open the saved index, rebuilding it first if the database changed since it was written.
+
+    Without the database (the agent image is built from plantsense_voice/ alone) the index
+    committed in .retrieval_index/ is used as-is; with neither, returns None and the assistant
+    runs without it.
+    """
+    if not os.path.exists(database_path):
+        if os.path.exists(os.path.join(index_dir, "meta.json")):
+            logger.warning(f"Disease database not found at {database_path}; using the saved index in {index_dir}")
+            return _open_index(index_dir)
+        logger.warning(f"Neither a disease database at {database_path} nor a saved index in {index_dir}; "
+                       f"the assistant will run without local knowledge (set KNOWLEDGE_DB_PATH)")
+        return None
+    try:
+        with open(os.path.join(index_dir, "meta.json")) as f:
+            digest = json.load(f).get("digest")
+        current = digest == _database_digest(database_path) and all(
+            os.path.exists(_array_path(index_dir, name, digest)) for name in ("offsets", "doc_ids", "weights"))
+    except (OSError, ValueError):
+        current = False
+    if not current:
+        build_index(database_path, index_dir)
+        logger.info(f"Built knowledge index for {database_path} in {index_dir}")
+    return _open_index(index_dir)
+
+
+def prediction_from_metadata(metadata: str):
+    """The predictionData plantapi's /voice-token stores in the caller's participant metadata, if any."""
+    try:
+        prediction = json.loads(metadata or "{}").get("predictionData")
+    except (ValueError, AttributeError):
+        return None
+    return prediction if isinstance(prediction, dict) else None
+
+
+@dataclass
+class Route:
+    action: str  # "answer", "ground" or "pass"
+    answer: Optional[str] = None  # spoken as-is when action == "answer"
+    context: Optional[str] = None  # injected into the LLM turn when action == "ground"
+    disease: Optional[str] = None
+    hits: list = field(default_factory=list)
+
+
+class KnowledgeRouter:
+    """Per-conversation routing of user turns: answer locally, ground the LLM, or pass through."""
+
+    def __init__(self, index: Optional[KnowledgeIndex], prediction: dict = None):
+        self.index = index
+        self.prediction = None
+        self.topic = None  # the disease the conversation is currently about
+        self._spoken = set()  # entries already answered with
+        if prediction:
+            self.set_prediction(prediction)
+
+    def set_prediction(self, prediction: dict):
+        """Remember the image diagnosis ({"disease": ..., "confidence": ...}) the caller arrived with."""
+        if prediction and prediction.get("disease"):
+            self.prediction = {"disease": prediction["disease"], "confidence": prediction.get("confidence")}
+            self.topic = prediction["disease"]
+
+    def _diagnosis_line(self) -> str:
+        if not self.prediction:
+            return ""
+        confidence = self.prediction.get("confidence")
+        detail = f" ({confidence}% confidence)" if confidence is not None else ""
+        return f"The caller's photo was diagnosed as {self.prediction['disease']}{detail}.\n"
+
+    def route(self, text: str) -> Route:
+        context_message = DIAGNOSIS_CONTEXT.search(text)
+        if context_message:
+            # The frontend's diagnosis hand-off: remember it and acknowledge without the LLM
+            self.set_prediction({"disease": context_message["disease"].strip(), "confidence": context_message["confidence"]})
+            disease = self.prediction["disease"]
+            return Route("answer", disease=disease, answer=(
+                f"Thanks, I can see your plant was diagnosed with {disease}. "
+                "What would you like to know about treating or preventing it?"
+            ))
+
+        if self.index is None:
+            return Route("pass")
+        terms = tokenize(text)
+        scores = self.index.scores(text)
+        if self.topic:
+            scores = np.where(self.index.disease_mask(self.topic), scores * PREDICTION_BOOST, scores)
+        order = np.argsort(scores)[::-1]
+        hits = [Hit(self.index.diseases[i], self.index.responses[i], float(scores[i])) for i in order if scores[i] > 0]
+
+        # Which disease the turn is about. One that names a plant or disease is about the clear
+        # retrieval winner, if any; "how do I treat it?" is about the diagnosis or the last topic.
+        topic = None
+        if not self.index.name_terms.intersection(terms):
+            topic = self.topic
+        elif hits and hits[0].score >= RETRIEVAL_MIN_SCORE:
+            top_key = normalize_disease(hits[0].disease)
+            runner_up = next((hit.score for hit in hits if normalize_disease(hit.disease) != top_key), 0.0)
+            if hits[0].score >= runner_up * RETRIEVAL_ANSWER_MARGIN:
+                topic = self.topic = hits[0].disease
+        topic_hits = [hit for hit in hits if topic and normalize_disease(hit.disease) == normalize_disease(topic)]
+
+        if topic and len(terms) <= MAX_DIRECT_QUESTION_TERMS and ANSWER_INTENTS.intersection(terms):
+            candidates = topic_hits or [Hit(self.index.diseases[i], self.index.responses[i], 0.0)
+                                        for i in np.flatnonzero(self.index.disease_mask(topic))]
+            # Never read the same entry twice; once they're used up the LLM rephrases from the snippets
+            fresh = [hit for hit in candidates if hit.text not in self._spoken]
+            if fresh:
+                self._spoken.add(fresh[0].text)
+                return Route("answer", answer=fresh[0].text, disease=topic, hits=fresh[:1])
+
+        relevant = [hit for hit in hits if hit.score >= RETRIEVAL_MIN_SCORE]
+        if not relevant:
+            return Route("pass", hits=hits[:RETRIEVAL_SNIPPETS])
+        # The topic's best entry leads even when other diseases happen to score higher on this wording
+        snippets = topic_hits[:1] + [hit for hit in relevant if hit not in topic_hits[:1]]
+        snippets = snippets[:RETRIEVAL_SNIPPETS]
+        lines = "\n".join(f"- {hit.disease}: {hit.text}" for hit in snippets)
+        return Route("ground", disease=topic, hits=snippets, context=(
+            f"PlantSense knowledge for the caller's next message:\n{self._diagnosis_line()}{lines}"
+        ))
+
+
+if __name__ == "__main__":
+    router = KnowledgeRouter(load_index())
+    for question in sys.argv[1:] or ["how do I treat early blight on tomatoes"]:
+        decision = router.route(question)
+        print(f"🌱 {question}\n   {decision.action}: {decision.answer or decision.context or '(LLM)'}")
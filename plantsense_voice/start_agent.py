@@ -9,7 +9,7 @@ from dotenv import load_dotenv
 from livekit import agents, rtc
 
 # Import the entrypoint from agent.py
-from agent import entrypoint
+from agent import entrypoint, prewarm
 
 # Load environment variables
 load_dotenv(".env.local")
@@ -25,6 +25,7 @@ async def main():
     # Disable IPC for Windows compatibility
     worker_options = agents.WorkerOptions(
         entrypoint_fnc=entrypoint,
+        prewarm_fnc=prewarm,
         initialize_process_fnc=None,  # Disable process initialization
     )
     
@@ -0,0 +1,388 @@
+"""
+Voice agent supervisor: one process serving many callers, each in their own room.
+
+Usage: python supervisor.py [--max-rooms 8] [--prewarm 2] [--room NAME]
+
+agent_windows.py used to join a single hard-coded room, serve it serially,
+and reload the Silero VAD and build a fresh AgentSession on every reconnect.
+The supervisor instead:
+
+  - loads the VAD once per process and shares it between sessions
+  - keeps AGENT_PREWARM sessions built ahead of time, so a new caller only
+    waits for the room connection and the greeting
+  - discovers caller rooms (plantapi's /voice-token gives every caller a
+    dedicated `plantsense-...` room) and serves up to AGENT_MAX_ROOMS of
+    them concurrently
+  - joins under its own agent identity and skips rooms another agent is
+    already in, so several supervisor processes can share the callers
+  - leaves a room once nobody else has been in it for AGENT_IDLE_TIMEOUT
+    seconds, freeing the slot
+  - polls for rooms every AGENT_DISPATCH_INTERVAL seconds while callers
+    arrive, backing off to AGENT_DISPATCH_MAX_INTERVAL while nothing changes
+
+Rooms, sessions and room discovery are injected, so the supervisor runs
+against a local `livekit-server --dev`, or entirely in-process with fake
+rooms and sessions (tests/test_supervisor.py). livekit-agents is only
+imported by the default factories.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+import uuid
+
+from dotenv import load_dotenv
+
+load_dotenv(".env.local")
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env.local"))
+load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
+
+from token_service import VOICE_ROOM_PREFIX  # noqa: E402  (the prefix /voice-token names caller rooms with)
+
+logger = logging.getLogger(__name__)
+
+LIVEKIT_URL = os.getenv("LIVEKIT_URL")
+LIVEKIT_API_KEY = os.getenv("LIVEKIT_API_KEY")
+LIVEKIT_API_SECRET = os.getenv("LIVEKIT_API_SECRET")
+
+AGENT_MAX_ROOMS = int(os.getenv("AGENT_MAX_ROOMS", "8"))  # concurrent callers per process
+AGENT_PREWARM = int(os.getenv("AGENT_PREWARM", "2"))  # sessions kept built and ready
+AGENT_IDLE_TIMEOUT = float(os.getenv("AGENT_IDLE_TIMEOUT", "60"))  # seconds alone in a room before leaving
+AGENT_DISPATCH_INTERVAL = float(os.getenv("AGENT_DISPATCH_INTERVAL", "0.25"))  # room discovery poll while callers arrive
+# Polls back off to this while no new rooms appear, so an idle supervisor makes ~1 list_rooms call every 2s, not 4/s
+AGENT_DISPATCH_MAX_INTERVAL = float(os.getenv("AGENT_DISPATCH_MAX_INTERVAL", "2"))
+AGENT_IDENTITY_PREFIX = "plant-assistant-agent"
+# Unique per process: LiveKit disconnects a participant when another joins the room with the same identity
+AGENT_IDENTITY = f"{AGENT_IDENTITY_PREFIX}-{uuid.uuid4().hex[:8]}"
+AGENT_KIND = 4  # ParticipantInfo.Kind.AGENT, the kind of participant an agent token joins as
+# Room listings lag a moment behind our own departure; don't rejoin a room we just left
+REJOIN_COOLDOWN = 5.0
+
+
+def is_agent(participant) -> bool:
+    """A PlantSense agent from any supervisor process, or any other LiveKit agent."""
+    return (getattr(participant, "kind", None) == AGENT_KIND
+            or getattr(participant, "identity", "").startswith(AGENT_IDENTITY_PREFIX))
+
+
+class LiveKitRoomDirectory:
+    """Finds caller rooms through the LiveKit room service."""
+
+    def __init__(self, prefix=VOICE_ROOM_PREFIX, url=LIVEKIT_URL, api_key=LIVEKIT_API_KEY, api_secret=LIVEKIT_API_SECRET):
+        from livekit import api
+        self.prefix = prefix
+        self._api = api.LiveKitAPI(url, api_key, api_secret)
+        self._request = api.ListRoomsRequest
+        self._participants_request = api.ListParticipantsRequest
+
+    async def _needs_agent(self, room_name: str) -> bool:
+        response = await self._api.room.list_participants(self._participants_request(room=room_name))
+        participants = response.participants
+        return any(not is_agent(p) for p in participants) and not any(is_agent(p) for p in participants)
+
+    async def pending_rooms(self, skip=()) -> dict:
+        """{room name: creation time} of caller rooms with a caller in them and no agent yet.
+
+        `skip` names rooms the caller already serves or just left; their participants aren't listed.
+        """
+        response = await self._api.room.list_rooms(self._request())
+        candidates = [
+            room for room in response.rooms
+            if room.name.startswith(self.prefix) and room.num_participants > 0 and room.name not in skip
+        ]
+        needs_agent = await asyncio.gather(*(self._needs_agent(room.name) for room in candidates))
+        return {
+            room.name: room.creation_time_ms / 1000 if room.creation_time_ms else float(room.creation_time)
+            for room, pending in zip(candidates, needs_agent)
+            if pending
+        }
+
+    async def aclose(self):
+        await self._api.aclose()
+
+
+class StaticRoomDirectory:
+    """A fixed list of rooms, e.g. the single shared room agent_windows.py used to join."""
+
+    def __init__(self, names):
+        self.names = list(names)
+
+    async def pending_rooms(self, skip=()) -> dict:
+        return {name: None for name in self.names}
+
+    async def aclose(self):
+        pass
+
+
+async def connect_livekit_room(room_name: str):
+    """Join a room as the agent and return the connected rtc.Room."""
+    from livekit import api, rtc
+    token = api.AccessToken(LIVEKIT_API_KEY, LIVEKIT_API_SECRET)
+    token.with_identity(AGENT_IDENTITY).with_kind("agent").with_name("PlantSense AI").with_grants(api.VideoGrants(
+        room_join=True,
+        room=room_name,
+        can_publish=True,
+        can_subscribe=True,
+    ))
+    room = rtc.Room()
+    await room.connect(LIVEKIT_URL, token.to_jwt())
+    return room
+
+
+class AgentSessionFactory:
+    """Builds PlantSense agent sessions around one shared VAD model and knowledge index, loaded once."""
+
+    def __init__(self):
+        from livekit.plugins import silero
+        from retrieval import load_index
+        started = time.perf_counter()
+        self.vad = silero.VAD.load()
+        self.knowledge = load_index()
+        logger.info(f"Loaded Silero VAD and knowledge index in {(time.perf_counter() - started) * 1000:.0f} ms (shared by all sessions)")
+
+    def __call__(self):
+        return PlantSenseSession(self.vad, self.knowledge)
+
+
+class PlantSenseSession:
+    """An AgentSession and its Assistant, built before a caller is assigned."""
+
+    def __init__(self, vad, knowledge=None):
+        from livekit.agents import AgentSession
+        from agent_windows import Assistant
+        self.session = AgentSession(
+            stt="assemblyai/universal-streaming:en",
+            llm="openai/gpt-4.1-mini",
+            tts="cartesia/sonic-2:9626c31c-bec5-4cca-baa8-f8ba9e84c8bc",
+            vad=vad,
+        )
+        self.agent = Assistant(knowledge=knowledge)
+
+    async def start(self, room):
+        from livekit.agents import RoomInputOptions, RoomOutputOptions
+        from livekit.plugins import noise_cancellation
+        await self.session.start(
+            room=room,
+            agent=self.agent,
+            room_input_options=RoomInputOptions(
+                noise_cancellation=noise_cancellation.BVC(),
+                text_enabled=True,
+            ),
+            room_output_options=RoomOutputOptions(
+                transcription_enabled=True,
+                sync_transcription=True,
+            ),
+        )
+        self.agent.use_room_prediction(room)
+
+    async def greet(self):
+        from agent_windows import GREETING_INSTRUCTIONS
+        await self.session.generate_reply(instructions=GREETING_INSTRUCTIONS)
+
+    async def aclose(self):
+        await self.session.aclose()
+
+
+class AgentSupervisor:
+    """Dispatches caller rooms to pre-warmed sessions, up to max_rooms at a time."""
+
+    def __init__(self, directory, session_factory, connect_room=connect_livekit_room, max_rooms=AGENT_MAX_ROOMS,
+                 prewarm=AGENT_PREWARM, idle_timeout=AGENT_IDLE_TIMEOUT, dispatch_interval=AGENT_DISPATCH_INTERVAL,
+                 max_dispatch_interval=AGENT_DISPATCH_MAX_INTERVAL, identity=AGENT_IDENTITY):
+        self.directory = directory
+        self.session_factory = session_factory
+        self.connect_room = connect_room
+        self.max_rooms = max(1, int(max_rooms))
+        self.prewarm = max(0, int(prewarm))
+        self.idle_timeout = float(idle_timeout)
+        self.dispatch_interval = float(dispatch_interval)
+        self.max_dispatch_interval = max(self.dispatch_interval, float(max_dispatch_interval))
+        self.identity = identity  # the identity connect_room joins with
+
+        self._warm = asyncio.Queue()
+        self._warming = 0
+        self.rooms = {}  # room name -> serving task
+        self._left = {}  # room name -> monotonic time the agent left it
+        self._waiting = set()  # rooms already reported as queued behind the concurrency limit
+        self._stopping = asyncio.Event()
+
+        self.served = 0
+        self.reaped = 0
+        self.cold_starts = 0
+        self.yielded = 0
+
+    # Pre-warmed sessions
+
+    def _refill(self):
+        while self._warm.qsize() + self._warming < self.prewarm:
+            self._warming += 1
+            asyncio.get_running_loop().create_task(self._build_warm())
+
+    async def _build_warm(self):
+        try:
+            # Built on the loop: AgentSession binds to it; the expensive VAD load already happened once
+            session = self.session_factory()
+            await self._warm.put(session)
+        except Exception as e:
+            logger.error(f"Could not pre-warm an agent session: {e}")
+        finally:
+            self._warming -= 1
+
+    async def _take_session(self):
+        try:
+            session = self._warm.get_nowait()
+        except asyncio.QueueEmpty:
+            self.cold_starts += 1
+            session = self.session_factory()
+        self._refill()
+        return session
+
+    # Rooms
+
+    async def _serve(self, room_name: str, created_at=None):
+        started = time.perf_counter()
+        room = session = None
+        try:
+            room = await self.connect_room(room_name)
+            # Two supervisors can pick the same room from one listing; the agent whose identity sorts first keeps it
+            rivals = [p for p in room.remote_participants.values() if is_agent(p) and p.identity < self.identity]
+            if rivals:
+                logger.info(f"Leaving {room_name}: agent {rivals[0].identity} already serves it")
+                self.yielded += 1
+                return
+            session = await self._take_session()
+            await session.start(room)
+            await session.greet()
+            waited = f", {time.time() - created_at:.2f}s after the room opened" if created_at else ""
+            logger.info(f"Greeted caller in {room_name} {(time.perf_counter() - started) * 1000:.0f} ms after dispatch{waited}")
+
+            idle_since = None
+            while not self._stopping.is_set() and room.isconnected():
+                if any(not is_agent(p) for p in room.remote_participants.values()):
+                    idle_since = None
+                elif idle_since is None:
+                    idle_since = time.monotonic()
+                elif time.monotonic() - idle_since > self.idle_timeout:
+                    logger.info(f"Leaving {room_name}: no caller for {self.idle_timeout:.0f}s")
+                    self.reaped += 1
+                    break
+                await asyncio.sleep(min(1.0, self.idle_timeout / 2))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Agent error in {room_name}: {e}", exc_info=True)
+        finally:
+            if session is not None:
+                self.served += 1
+                try:
+                    await session.aclose()
+                except Exception as e:
+                    logger.warning(f"Error closing session for {room_name}: {e}")
+            if room is not None:
+                try:
+                    await room.disconnect()
+                except Exception as e:
+                    logger.warning(f"Error leaving {room_name}: {e}")
+            self._left[room_name] = time.monotonic()
+            self.rooms.pop(room_name, None)
+
+    async def dispatch_once(self) -> int:
+        """Start serving any newly discovered rooms, within the concurrency limit; returns how many rooms are new."""
+        found = 0
+        now = time.monotonic()
+        self._left = {name: left for name, left in self._left.items() if now - left < REJOIN_COOLDOWN}
+        pending = await self.directory.pending_rooms(skip=set(self.rooms) | set(self._left))
+        for room_name, created_at in pending.items():
+            if room_name in self.rooms or room_name in self._left:
+                continue
+            found += 1
+            if len(self.rooms) >= self.max_rooms:
+                if room_name not in self._waiting:
+                    self._waiting.add(room_name)
+                    logger.warning(f"At capacity ({self.max_rooms} rooms); {room_name} waits for a free slot")
+                continue
+            self._waiting.discard(room_name)
+            self.rooms[room_name] = asyncio.get_running_loop().create_task(self._serve(room_name, created_at))
+        return found
+
+    async def run(self):
+        logger.info(f"Agent supervisor up: {self.max_rooms} room(s) max, {self.prewarm} pre-warmed session(s)")
+        self._refill()
+        interval = self.dispatch_interval
+        try:
+            while not self._stopping.is_set():
+                try:
+                    found = await self.dispatch_once()
+                except Exception as e:
+                    logger.error(f"Room discovery failed: {e}")
+                    found = 0
+                # Poll quickly while callers are arriving (or queued), back off while nothing changes
+                interval = self.dispatch_interval if found else min(interval * 2, self.max_dispatch_interval)
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            await self.aclose()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def aclose(self):
+        self._stopping.set()
+        tasks = list(self.rooms.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        while not self._warm.empty():
+            await self._warm.get_nowait().aclose()
+        await self.directory.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "rooms": sorted(self.rooms),
+            "max_rooms": self.max_rooms,
+            "prewarmed": self._warm.qsize(),
+            "served": self.served,
+            "reaped": self.reaped,
+            "cold_starts": self.cold_starts,
+            "yielded": self.yielded,
+        }
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-rooms", type=int, default=AGENT_MAX_ROOMS)
+    parser.add_argument("--prewarm", type=int, default=AGENT_PREWARM)
+    parser.add_argument("--idle-timeout", type=float, default=AGENT_IDLE_TIMEOUT)
+    parser.add_argument("--room", action="append", help="Serve these fixed rooms instead of discovering caller rooms")
+    args = parser.parse_args(argv)
+
+    from livekit.agents.utils import http_context
+
+    print("🌱 PlantSense Voice Agent supervisor starting...")
+    print(f"LiveKit URL: {LIVEKIT_URL}")
+    directory = StaticRoomDirectory(args.room) if args.room else LiveKitRoomDirectory()
+    supervisor = AgentSupervisor(
+        directory,
+        AgentSessionFactory(),
+        max_rooms=args.max_rooms,
+        prewarm=args.prewarm,
+        # A fixed room is the shared room agent_windows.py used to hold; stay in it
+        idle_timeout=float("inf") if args.room else args.idle_timeout,
+    )
+    async with http_context.open():
+        await supervisor.run()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\n👋 Agent stopped")
@@ -1,11 +1,12 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from livekit import api
 import os
 from dotenv import load_dotenv
 
 load_dotenv(".env.local")
 
+from token_service import VoiceTokenService, voice_token_router  # noqa: E402  (reads its settings from the env)
+
 app = FastAPI()
 
 # Enable CORS
@@ -22,47 +23,14 @@ LIVEKIT_API_KEY = os.getenv("LIVEKIT_API_KEY")
 LIVEKIT_API_SECRET = os.getenv("LIVEKIT_API_SECRET")
 LIVEKIT_URL = os.getenv("LIVEKIT_URL", "wss://final-llm-a8copwku.livekit.cloud")
 
+# Same /voice-token as plantapi.py
+VOICE_TOKENS = VoiceTokenService(LIVEKIT_API_KEY, LIVEKIT_API_SECRET, LIVEKIT_URL)
+app.include_router(voice_token_router(VOICE_TOKENS))
+
 @app.get("/")
 async def root():
     return {"message": "PlantSense LiveKit Token Server", "status": "running"}
 
-@app.post("/voice-token")
-async def get_voice_token():
-    """Generate a LiveKit token for voice chat"""
-    try:
-        if not LIVEKIT_API_KEY or not LIVEKIT_API_SECRET:
-            raise HTTPException(
-                status_code=500,
-                detail="LiveKit credentials not configured"
-            )
-        
-        # Generate a unique room name
-        import uuid
-        room_name = f"plantsense-{uuid.uuid4().hex[:8]}"
-        
-        # Create token
-        token = api.AccessToken(LIVEKIT_API_KEY, LIVEKIT_API_SECRET)
-        token.with_identity(f"user-{uuid.uuid4().hex[:8]}")
-        token.with_name("PlantSense User")
-        token.with_grants(
-            api.VideoGrants(
-                room_join=True,
-                room=room_name,
-                can_publish=True,
-                can_subscribe=True,
-            )
-        )
-        
-        jwt_token = token.to_jwt()
-        
-        return {
-            "token": jwt_token,
-            "url": LIVEKIT_URL,
-            "room": room_name
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
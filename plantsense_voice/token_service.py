@@ -0,0 +1,277 @@
+"""
+LiveKit access tokens for voice callers, shared by plantapi.py and token_server.py.
+
+Both apps used to build an api.AccessToken from scratch on every request,
+with diverging responses, and plantapi named callers after a millisecond
+timestamp, so two callers in the same millisecond got the same identity.
+VoiceTokenService instead:
+
+  - signs with an HMAC key and JWT header prepared once; the grant layout is
+    taken from livekit's own VideoGrants, so tokens match what AccessToken emits
+  - names callers and rooms from uuid4, so identities never collide
+  - keeps each session's grant for VOICE_GRANT_CACHE_TTL seconds: a client
+    reconnecting with the sessionId it was given gets the same room and
+    identity back instead of opening yet another room for the agent to join
+  - rate limits each caller's address with an in-memory token bucket, read
+    from X-Forwarded-For when TRUSTED_PROXY_HOPS proxies sit in front
+
+Minting is a few tens of microseconds of CPU on the event loop: a reconnect
+storm never waits behind inference in the thread pool, and never adds to it.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse
+from livekit import api
+
+logger = logging.getLogger(__name__)
+
+# Must match the prefix supervisor.py looks for
+VOICE_ROOM_PREFIX = os.getenv("VOICE_ROOM_PREFIX", "plantsense-")
+VOICE_TOKEN_TTL = int(os.getenv("VOICE_TOKEN_TTL", "21600"))  # seconds; livekit's own default is 6 hours
+VOICE_GRANT_CACHE_TTL = float(os.getenv("VOICE_GRANT_CACHE_TTL", "300"))  # seconds a session keeps its room
+VOICE_GRANT_CACHE_SIZE = int(os.getenv("VOICE_GRANT_CACHE_SIZE", "10000"))
+VOICE_TOKEN_RATE = float(os.getenv("VOICE_TOKEN_RATE", "0.5"))  # tokens per second per client, refilled
+VOICE_TOKEN_BURST = int(os.getenv("VOICE_TOKEN_BURST", "10"))  # requests a client may make back to back
+VOICE_RATE_LIMIT_CLIENTS = 10000  # buckets tracked at once; the least recently seen are dropped first
+# Reverse proxies in front of the app (1 behind the platform router in the Procfile); 0 trusts the socket peer
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+CALLER_NAME = "PlantSense User"
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limited; retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucketLimiter:
+    """Per-key token buckets: `burst` requests at once, refilled at `rate` per second."""
+
+    def __init__(self, rate=VOICE_TOKEN_RATE, burst=VOICE_TOKEN_BURST, max_keys=VOICE_RATE_LIMIT_CLIENTS):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self.max_keys = max(1, int(max_keys))
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, now: float = None) -> float:
+        """Take one token for key; returns 0 if allowed, else seconds until a token is available."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate if self.rate > 0 else math.inf
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                # A bucket idle long enough to be evicted would have refilled anyway
+                self._buckets.popitem(last=False)
+            return wait
+
+
+def _b64(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+class TokenSigner:
+    """HS256 LiveKit room-join tokens from a key and header prepared once."""
+
+    def __init__(self, api_key: str, api_secret: str, ttl: int = VOICE_TOKEN_TTL):
+        self.api_key = api_key
+        self.ttl = int(ttl)
+        self._header = _b64(json.dumps({"alg": "HS256", "typ": "JWT"}, separators=(",", ":")).encode()) + b"."
+        self._mac = hmac.new(api_secret.encode(), digestmod=hashlib.sha256)
+        # The claims livekit's AccessToken would write for a caller's grants; only the room varies
+        grants = api.VideoGrants(room_join=True, room="-", can_publish=True, can_subscribe=True)
+        self._video = api.AccessToken(api_key, api_secret).with_grants(grants).claims.asdict()["video"]
+
+    def sign(self, identity: str, room: str, name: str = CALLER_NAME, metadata: str = None) -> str:
+        now = int(time.time())
+        claims = {"name": name, "video": {**self._video, "room": room},
+                  "sub": identity, "iss": self.api_key, "nbf": now, "exp": now + self.ttl}
+        if metadata:
+            claims["metadata"] = metadata
+        signing_input = self._header + _b64(json.dumps(claims, separators=(",", ":")).encode())
+        mac = self._mac.copy()
+        mac.update(signing_input)
+        return (signing_input + b"." + _b64(mac.digest())).decode()
+
+
+@dataclass
+class VoiceGrant:
+    session_id: str
+    identity: str
+    room: str
+    token: str
+    metadata: str
+    issued_at: float
+
+
+def prediction_metadata(prediction_data) -> str:
+    """Participant metadata carrying the diagnosis to the voice agent (see retrieval.prediction_from_metadata)."""
+    if not isinstance(prediction_data, dict) or not prediction_data.get("disease"):
+        return None
+    return json.dumps({"predictionData": {
+        "disease": prediction_data["disease"],
+        "confidence": prediction_data.get("confidence"),
+    }})
+
+
+class VoiceTokenService:
+    """Issues, caches and rate limits voice tokens; one instance per process."""
+
+    def __init__(self, api_key=None, api_secret=None, url=None, room_prefix=VOICE_ROOM_PREFIX,
+                 ttl=VOICE_TOKEN_TTL, cache_ttl=VOICE_GRANT_CACHE_TTL, cache_size=VOICE_GRANT_CACHE_SIZE,
+                 limiter: TokenBucketLimiter = None):
+        self.url = url
+        self.room_prefix = room_prefix
+        self.signer = TokenSigner(api_key, api_secret, ttl) if api_key and api_secret else None
+        self.cache_ttl = float(cache_ttl)
+        self.cache_size = max(0, int(cache_size))
+        self.limiter = limiter or TokenBucketLimiter()
+        self._grants = OrderedDict()  # session id -> VoiceGrant
+        self._lock = threading.Lock()
+
+        self.issued = 0
+        self.reused = 0
+        self.rate_limited = 0
+
+    @property
+    def configured(self) -> bool:
+        return self.signer is not None and bool(self.url)
+
+    def _cached(self, session_id: str, now: float):
+        with self._lock:
+            grant = self._grants.get(session_id)
+            if grant is None:
+                return None
+            if now - grant.issued_at > self.cache_ttl:
+                del self._grants[session_id]
+                return None
+            self._grants.move_to_end(session_id)
+            return grant
+
+    def _store(self, grant: VoiceGrant):
+        if not self.cache_size:
+            return
+        with self._lock:
+            self._grants[grant.session_id] = grant
+            self._grants.move_to_end(grant.session_id)
+            while len(self._grants) > self.cache_size:
+                self._grants.popitem(last=False)
+
+    def issue(self, client: str, session_id: str = None, prediction_data=None) -> VoiceGrant:
+        """Return a grant for the caller, reusing its session's grant if still cached.
+
+        Raises RateLimited when the client is over its budget.
+        """
+        if not self.configured:
+            raise RuntimeError("LiveKit credentials not configured")
+        retry_after = self.limiter.acquire(client)
+        if retry_after:
+            self.rate_limited += 1
+            raise RateLimited(retry_after)
+
+        now = time.monotonic()
+        metadata = prediction_metadata(prediction_data)
+        grant = self._cached(session_id, now) if session_id else None
+        if grant is not None:
+            self.reused += 1
+            if metadata is None or metadata == grant.metadata:
+                return grant
+            # Same caller and room, new diagnosis: re-sign so the agent sees it on reconnect
+            grant = VoiceGrant(grant.session_id, grant.identity, grant.room,
+                               self.signer.sign(grant.identity, grant.room, metadata=metadata), metadata, grant.issued_at)
+        else:
+            self.issued += 1
+            identity = f"user-{uuid.uuid4().hex}"
+            room = f"{self.room_prefix}{uuid.uuid4().hex[:12]}"
+            grant = VoiceGrant(uuid.uuid4().hex, identity, room, self.signer.sign(identity, room, metadata=metadata), metadata, now)
+            logger.info(f"Issued voice token for {identity} in room {room}")
+        self._store(grant)
+        return grant
+
+    def stats(self) -> dict:
+        return {
+            "configured": self.configured,
+            "issued": self.issued,
+            "reused": self.reused,
+            "rate_limited": self.rate_limited,
+            "cached_sessions": len(self._grants),
+        }
+
+
+def client_address(request: Request, trusted_hops: int = TRUSTED_PROXY_HOPS) -> str:
+    """The caller's address, the key rate limits are applied to.
+
+    Behind N trusted proxies it is the Nth X-Forwarded-For entry from the right, the one
+    the outermost trusted proxy recorded: a client can prepend entries, but not change those.
+    """
+    peer = request.client.host if request.client else "unknown"
+    if trusted_hops <= 0:
+        return peer
+    hops = [hop.strip() for value in request.headers.getlist("x-forwarded-for") for hop in value.split(",") if hop.strip()]
+    if not hops:
+        return peer
+    return hops[-trusted_hops] if len(hops) >= trusted_hops else hops[0]
+
+
+def voice_token_router(service: VoiceTokenService) -> APIRouter:
+    """The /voice-token endpoint, mounted by both plantapi.py and token_server.py."""
+    router = APIRouter()
+
+    @router.post("/voice-token")
+    async def get_voice_token(request: Request):
+        """Generate a LiveKit token for voice assistant connection.
+
+        Optional JSON body: {"predictionData": {...}, "sessionId": "..."}; send back the
+        returned sessionId when reconnecting to keep the same room.
+        """
+        body = {}
+        raw = await request.body()
+        if raw:
+            try:
+                body = json.loads(raw)
+            except ValueError:
+                pass
+        if not isinstance(body, dict):
+            body = {}
+        prediction_data = body.get("predictionData")
+        try:
+            grant = service.issue(client_address(request), body.get("sessionId"), prediction_data)
+        except RateLimited as e:
+            return JSONResponse(
+                status_code=429,
+                content={"detail": "Too many voice token requests, please retry shortly"},
+                # VOICE_TOKEN_RATE=0 never refills; ask for an hour rather than infinity
+                headers={"Retry-After": str(max(1, math.ceil(min(e.retry_after, 3600))))},
+            )
+        except RuntimeError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        return {
+            "token": grant.token,
+            "url": service.url,
+            "room": grant.room,
+            "identity": grant.identity,
+            "sessionId": grant.session_id,
+            "predictionData": prediction_data,
+        }
+
+    return router
@@ -0,0 +1,174 @@
+"""
+Content-addressed cache of model outputs.
+
+Field users re-upload the same photo a lot (mobile retries, shared images,
+frontend resubmits). Entries are keyed by a hash of the raw upload bytes and
+the model version and hold the probability vector, so a hit skips decoding
+and the forward pass entirely. Changing the model version drops every entry.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "2048"))
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", "3600"))  # seconds, 0 disables expiry
+PREDICTION_CACHE_PATH = os.getenv("PREDICTION_CACHE_PATH")  # optional .npz snapshot
+
+
+def model_version_for(path: str, backend: str = "") -> str:
+    """Identify a model file by content, so retraining in place still invalidates the cache."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return f"{os.path.basename(path)}:{digest.hexdigest()[:12]}:{backend}"
+
+
+class PredictionCache:
+    """Thread-safe LRU of probability vectors with size and TTL bounds."""
+
+    def __init__(self, max_entries=PREDICTION_CACHE_SIZE, ttl_seconds=PREDICTION_CACHE_TTL,
+                 persist_path=PREDICTION_CACHE_PATH):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl = float(ttl_seconds)
+        self.persist_path = persist_path
+        self.model_version = None
+        self._entries = OrderedDict()  # key -> (probabilities, stored_at)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.model_version is not None
+
+    def key_for(self, data: bytes, model_version: str = None) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update((model_version or self.model_version).encode())
+        digest.update(data)
+        return digest.hexdigest()
+
+    def set_model_version(self, version: str):
+        """Switch to a new model version, dropping entries computed by the old one."""
+        with self._lock:
+            if version == self.model_version:
+                return
+            if self._entries:
+                logger.info(f"Model changed to {version}; invalidating {len(self._entries)} cached predictions")
+            self.model_version = version
+            self._entries.clear()
+        if self.persist_path:
+            self.load()
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _current(self, model_version: str) -> bool:
+        # A request still finishing on a just-replaced model must neither read nor fill the cache
+        return self.enabled and (model_version is None or model_version == self.model_version)
+
+    def get(self, data: bytes, model_version: str = None):
+        """Return the cached probability vector for these upload bytes, or None."""
+        if not self._current(model_version):
+            return None
+        key = self.key_for(data, model_version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            probabilities, stored_at = entry
+            if self.ttl and time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return probabilities
+
+    def put(self, data: bytes, probabilities: np.ndarray, model_version: str = None):
+        if not self._current(model_version):
+            return
+        key = self.key_for(data, model_version)
+        # Read-only copy so a caller can't mutate what other requests will receive
+        probabilities = np.array(probabilities, dtype=np.float32)
+        probabilities.setflags(write=False)
+        with self._lock:
+            self._entries[key] = (probabilities, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def save(self):
+        """Snapshot live entries to persist_path (an .npz file)."""
+        if not self.persist_path or self.model_version is None:
+            return
+        with self._lock:
+            keys = list(self._entries.keys())
+            values = list(self._entries.values())
+        if not keys:
+            return
+        tmp_path = f"{self.persist_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                model_version=np.array(self.model_version),
+                keys=np.array(keys),
+                probabilities=np.stack([probabilities for probabilities, _ in values]),
+                stored_at=np.array([stored_at for _, stored_at in values], dtype=np.float64),
+            )
+        os.replace(tmp_path, self.persist_path)
+        logger.info(f"Saved {len(keys)} cached predictions to {self.persist_path}")
+
+    def load(self):
+        """Restore a snapshot written by save(), if it matches the current model version."""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with np.load(self.persist_path, allow_pickle=False) as snapshot:
+                if str(snapshot["model_version"]) != self.model_version:
+                    logger.info("Discarding prediction cache snapshot from a different model version")
+                    return
+                keys, probabilities, stored_at = snapshot["keys"], snapshot["probabilities"], snapshot["stored_at"]
+        except Exception as e:
+            logger.warning(f"Could not load prediction cache from {self.persist_path}: {e}")
+            return
+        now = time.time()
+        with self._lock:
+            for key, row, stamp in zip(keys, probabilities, stored_at):
+                if self.ttl and now - stamp > self.ttl:
+                    continue
+                row.setflags(write=False)
+                self._entries[str(key)] = (row, float(stamp))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        logger.info(f"Restored {len(self._entries)} cached predictions from {self.persist_path}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "model_version": self.model_version,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
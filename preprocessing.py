@@ -0,0 +1,76 @@
+"""
+Image preprocessing for the plant disease model.
+
+Phone photos are often 12+ MP while the model sees 256x256, so fully
+decoding them wastes most of the per-request CPU. Large JPEGs are decoded
+at reduced resolution (libjpeg DCT scaling via PIL's draft mode), big
+non-JPEG images are shrunk with a box reduce before the final resize, and
+pixels stay uint8 until the model casts the batch to float32.
+"""
+
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+IMAGE_SIZE = 256
+# Draft-decode JPEGs to at least this multiple of the target size; the final
+# resize from there is visually indistinguishable from a full decode.
+DRAFT_OVERSAMPLE = 2
+# Passed to Image.resize: shrink by an integer factor first when the source is
+# this many times larger than the target.
+RESIZE_REDUCING_GAP = 3.0
+
+
+def open_image(data: bytes, size: int = IMAGE_SIZE) -> Image.Image:
+    """Open upload bytes as an RGB PIL image, decoding large JPEGs at reduced resolution."""
+    image = Image.open(BytesIO(data))
+    if image.format == "JPEG":
+        draft_size = size * DRAFT_OVERSAMPLE
+        if image.width > draft_size and image.height > draft_size:
+            # Picks the largest 1/2, 1/4 or 1/8 scale that keeps both sides >= draft_size
+            image.draft("RGB", (draft_size, draft_size))
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return image
+
+
+def decode_image(data: bytes, size: int = IMAGE_SIZE) -> np.ndarray:
+    """Decode and resize upload bytes to a (size, size, 3) uint8 array."""
+    image = open_image(data, size)
+    if image.size != (size, size):
+        image = image.resize((size, size), reducing_gap=RESIZE_REDUCING_GAP)
+    return np.asarray(image)
+
+
+def decode_path(path: str, size: int = IMAGE_SIZE):
+    """Decode an image file for bulk scoring; returns (array, None) or (None, error message).
+
+    Lives here rather than in the scoring script so process-pool workers only
+    import PIL and numpy, never TensorFlow.
+    """
+    try:
+        with open(path, "rb") as f:
+            return decode_image(f.read(), size), None
+    except Exception as e:
+        return None, str(e)
+
+
+def decode_scan_image(data: bytes, max_side: int, min_side: int = IMAGE_SIZE) -> np.ndarray:
+    """Decode a large field or whole-plant photo for tiling: long side at most `max_side`, short side at least `min_side`."""
+    image = Image.open(BytesIO(data))
+    # Past this aspect ratio, raising the short side to min_side would push the long side far beyond max_side
+    if max(image.size) > min(image.size) * max_side / min_side:
+        raise ValueError(f"Image is too narrow to scan ({image.width}x{image.height}); "
+                         f"the long side may be at most {max_side // min_side}x the short side")
+    scale = min(1.0, max_side / max(image.size))
+    if image.format == "JPEG" and scale < 1.0:
+        # Same DCT-scaling trick as open_image, aimed at the scan resolution instead of one model input
+        image.draft("RGB", (round(image.width * scale), round(image.height * scale)))
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    scale = max(min(1.0, max_side / max(image.size)), min_side / min(image.size))
+    if scale != 1.0:
+        size = (max(min_side, round(image.width * scale)), max(min_side, round(image.height * scale)))
+        image = image.resize(size, reducing_gap=RESIZE_REDUCING_GAP)
+    return np.asarray(image)
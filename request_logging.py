@@ -0,0 +1,68 @@
+"""
+Non-blocking, sampled, structured request logging.
+
+Handlers that write to stdout/files run on a QueueListener thread, so a
+request only pays for enqueueing a record. Per-request events are sampled
+(LOG_SAMPLE_RATE) and rendered as JSON lazily, on the listener thread.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.05"))
+
+_listener = None
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue records as-is; the stock QueueHandler formats them in the caller's thread."""
+
+    def prepare(self, record):
+        return record
+
+
+class StructuredMessage:
+    """A log message rendered as JSON only when a handler actually formats it."""
+
+    __slots__ = ("event", "fields", "ts")
+
+    def __init__(self, event: str, fields: dict):
+        self.event = event
+        self.fields = fields
+        # Stamped when the event happens; the queued handler may format it much later
+        self.ts = time.time()
+
+    def __str__(self):
+        return json.dumps({"event": self.event, "ts": round(self.ts, 3), **self.fields}, default=str)
+
+
+def setup_logging(level: str = LOG_LEVEL):
+    """Configure root logging and move its handlers behind a background queue listener."""
+    global _listener
+    logging.basicConfig(level=level)
+    if _listener is not None:
+        return
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    records = queue.SimpleQueue()
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(_DeferredQueueHandler(records))
+    _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def log_event(logger: logging.Logger, event: str, sampled: bool = True, level: int = logging.INFO, **fields):
+    """Log a structured event; sampled events are kept with probability LOG_SAMPLE_RATE."""
+    if sampled and random.random() >= LOG_SAMPLE_RATE:
+        return
+    if logger.isEnabledFor(level):
+        logger.log(level, "%s", StructuredMessage(event, fields))
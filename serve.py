@@ -0,0 +1,161 @@
+"""
+Multi-worker launcher: one shared model server plus N uvicorn workers.
+
+Usage: python serve.py [--workers N] [--host 0.0.0.0] [--port 8000]
+
+TensorFlow can't be forked after it has loaded a model (its runtime threads
+don't survive fork), so instead of copy-on-write weights the model lives in
+a single model server process (model_server.py) that every HTTP worker
+talks to over a Unix socket and shared memory. The node's cores are split
+between the two roles:
+
+  model server  - TensorFlow intra-op threads = all cores, so one large
+                  cross-worker batch uses the whole machine
+  HTTP workers  - no TensorFlow; each gets cores // workers decode threads
+                  and single-threaded math libraries
+
+Workers default to WEB_CONCURRENCY, or the cores this container may use
+(CPU affinity capped by the cgroup CPU quota, not the host's core count).
+Memory is one model copy regardless of the worker count.
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import secrets
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger("serve")
+
+# Set once serve.py itself is shutting down, so the model server's exit is expected
+_stopping = threading.Event()
+
+
+def _cgroup_cpu_limit(root: str = "/sys/fs/cgroup"):
+    """CPUs allowed by the container's CFS quota (cgroup v2, then v1), or None if unlimited."""
+    try:
+        with open(os.path.join(root, "cpu.max")) as f:
+            quota, period = f.read().split()[:2]
+    except (OSError, ValueError):
+        try:
+            with open(os.path.join(root, "cpu", "cpu.cfs_quota_us")) as f:
+                quota = f.read().strip()
+            with open(os.path.join(root, "cpu", "cpu.cfs_period_us")) as f:
+                period = f.read().strip()
+        except OSError:
+            return None
+    if quota in ("max", "-1"):
+        return None
+    try:
+        return max(1, int(int(quota) / int(period)))
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def available_cores() -> int:
+    """Cores this process may actually use: affinity mask, capped by the cgroup quota."""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    limit = _cgroup_cpu_limit()
+    return max(1, min(cores, limit) if limit else cores)
+
+
+def server_environment(cores: int) -> dict:
+    """Thread settings for the model server: it does all the forward passes, so it gets every core."""
+    return {
+        "TF_INTRA_OP_THREADS": str(cores),
+        "TF_INTER_OP_THREADS": "2",
+        "BACKEND_NUM_THREADS": str(cores),
+    }
+
+
+def worker_environment(cores: int, workers: int, address: str, authkey: str) -> dict:
+    """Settings for each HTTP worker: forward passes go to the server; decoding shares the cores."""
+    per_worker = max(1, cores // workers)
+    return {
+        "MODEL_SERVER_ADDRESS": address,
+        "MODEL_SERVER_AUTHKEY": authkey,
+        "DECODE_WORKERS": os.getenv("DECODE_WORKERS", str(per_worker)),
+        # Threads that wait on the model server; one per shared-memory slot
+        "INFERENCE_EXECUTOR": "thread",
+        "INFERENCE_WORKERS": os.getenv("MODEL_SERVER_CONNECTIONS", "4"),
+        # numpy/PIL helpers must not each spin up a thread per core in every worker
+        "OMP_NUM_THREADS": "1",
+        "OPENBLAS_NUM_THREADS": "1",
+        "MKL_NUM_THREADS": "1",
+    }
+
+
+def _wait_for_socket(path: str, process, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        if not process.is_alive():
+            raise RuntimeError(f"Model server exited with code {process.exitcode} during startup")
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Model server did not start listening on {path}")
+        time.sleep(0.05)
+
+
+def _watch_server(process):
+    """Take the whole service down if the model server dies, so the platform restarts it."""
+    process.join()
+    if _stopping.is_set():
+        return
+    logger.error(f"Model server exited with code {process.exitcode}; shutting down")
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "0")) or None)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+
+    import uvicorn
+    import model_server
+    from backends import INFERENCE_BACKEND
+    from model_registry import manifest_version
+
+    cores = available_cores()
+    workers = max(1, args.workers or cores)
+    socket_dir = tempfile.mkdtemp(prefix="plantsense-")
+    address = os.path.join(socket_dir, "model.sock")
+    authkey = secrets.token_hex(16)
+
+    # Spawned children snapshot os.environ, so set the server's settings first, then the workers'
+    os.environ.update(server_environment(cores))
+    _, spec = manifest_version()
+    server = multiprocessing.get_context("spawn").Process(
+        target=model_server.run_server,
+        args=(address, authkey.encode(), [(spec["path"], spec.get("backend", INFERENCE_BACKEND))]),
+        name="model-server",
+        daemon=True,
+    )
+    server.start()
+    _wait_for_socket(address, server)
+    threading.Thread(target=_watch_server, args=(server,), daemon=True).start()
+    logger.info(f"Model server {server.pid} up; starting {workers} HTTP worker(s) on {cores} core(s)")
+
+    os.environ.update(worker_environment(cores, workers, address, authkey))
+    try:
+        uvicorn.run("plantapi:app", host=args.host, port=args.port, workers=workers)
+    finally:
+        _stopping.set()
+        server.terminate()
+        server.join(timeout=5)
+        shutil.rmtree(socket_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
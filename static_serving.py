@@ -0,0 +1,245 @@
+"""
+Precompressed, cache-friendly serving of the React build from the API process.
+
+Usage (optional, at build time): python static_serving.py [build_dir]
+
+Field devices are often on 2G/3G links, so the frontend bundle should cross
+the network once, compressed. StaticSite loads every file under the build
+directory into memory and serves gzip or brotli variants chosen from
+Accept-Encoding. Variants come from .gz/.br files written by the command
+above or, failing that, are compressed once in a background thread after
+startup. Requests never touch the disk or the thread pool, so static
+traffic doesn't compete with inference for workers.
+
+Hashed assets (listed in asset-manifest.json, or named like main.8ab80750.js)
+are served as immutable for a year. Everything else, index.html included,
+must be revalidated, and a matching If-None-Match gets a 304. Paths that look
+like client-side routes fall back to index.html. Source maps are never served.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import sys
+import threading
+from dataclasses import dataclass, field
+
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+FRONTEND_BUILD_DIR = os.getenv("FRONTEND_BUILD_DIR", "build")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+# CRA/webpack content hashes: main.8ab80750.js, ai_agriculture.9019489bb48119abbce6.jpg
+HASHED_NAME = re.compile(r"\.[0-9a-f]{8,}\.")
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "application/manifest+json",
+                      "image/svg+xml", "image/x-icon", "image/vnd.microsoft.icon")
+MIN_COMPRESS_BYTES = 256
+# Keep a variant only if it saves at least this fraction of the bytes
+MIN_COMPRESSION_SAVING = 0.1
+
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+# Source maps would publish the unminified frontend source; they stay on disk for debugging
+EXCLUDED_EXTENSIONS = (".map",)
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _available_encodings() -> list:
+    return [encoding for encoding in ENCODINGS if encoding != "br" or brotli is not None]
+
+
+@dataclass
+class StaticFile:
+    content_type: str
+    cache_control: str
+    etag: str
+    body: bytes
+    compressible: bool
+    variants: dict = field(default_factory=dict)  # encoding -> compressed bytes
+
+
+def parse_accept_encoding(header: str) -> dict:
+    """Accept-Encoding as {coding: q}; codings with q=0 are dropped."""
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted[coding] = quality
+    return accepted
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class StaticSite:
+    """A frontend build directory held in memory with precomputed compressed variants."""
+
+    def __init__(self, directory: str = FRONTEND_BUILD_DIR):
+        self.directory = directory
+        self.files = {}  # URL path without the leading slash -> StaticFile
+        self._compressor = None
+        if os.path.isdir(directory):
+            self._load()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.files)
+
+    def _hashed_paths(self) -> set:
+        try:
+            with open(os.path.join(self.directory, "asset-manifest.json")) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return set()
+        return {url.lstrip("/") for url in manifest.get("files", {}).values()} - {"index.html"}
+
+    def _load(self):
+        hashed = self._hashed_paths()
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(tuple(ENCODINGS.values()) + EXCLUDED_EXTENSIONS):
+                    continue
+                path = os.path.join(root, name)
+                url_path = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    body = f.read()
+                content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                if content_type.startswith("text/") or content_type in ("application/javascript", "application/json"):
+                    content_type += "; charset=utf-8"
+                immutable = url_path in hashed or (url_path.startswith("static/") and HASHED_NAME.search(name))
+                static_file = StaticFile(
+                    content_type=content_type,
+                    cache_control=IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL,
+                    etag=f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"',
+                    body=body,
+                    compressible=len(body) >= MIN_COMPRESS_BYTES and content_type.startswith(COMPRESSIBLE_TYPES),
+                )
+                if static_file.compressible:
+                    self._load_prebuilt(path, static_file)
+                self.files[url_path] = static_file
+        logger.info(f"Serving {len(self.files)} frontend files from {self.directory}")
+
+    def _load_prebuilt(self, path: str, static_file: StaticFile):
+        """Pick up .gz/.br siblings written at build time, if they are at least as new as the source."""
+        for encoding in _available_encodings():
+            variant_path = path + ENCODINGS[encoding]
+            if os.path.exists(variant_path) and os.path.getmtime(variant_path) >= os.path.getmtime(path):
+                with open(variant_path, "rb") as f:
+                    self._add_variant(static_file, encoding, f.read())
+
+    @staticmethod
+    def _add_variant(static_file: StaticFile, encoding: str, data: bytes):
+        if len(data) <= len(static_file.body) * (1 - MIN_COMPRESSION_SAVING):
+            # Copy-on-write so a request thread never sees a half-updated dict
+            static_file.variants = {**static_file.variants, encoding: data}
+
+    def precompress(self):
+        """Compress every compressible file that has no prebuilt variant yet."""
+        for static_file in list(self.files.values()):
+            if not static_file.compressible:
+                continue
+            for encoding in _available_encodings():
+                if encoding not in static_file.variants:
+                    self._add_variant(static_file, encoding, _compress(static_file.body, encoding))
+        logger.info(f"Precompressed frontend assets ({', '.join(_available_encodings())})")
+
+    def start(self):
+        """Compress missing variants in the background; identity responses are served meanwhile."""
+        if self.enabled and self._compressor is None:
+            self._compressor = threading.Thread(target=self.precompress, name="static-precompress", daemon=True)
+            self._compressor.start()
+
+    def _resolve(self, path: str):
+        path = path.lstrip("/") or "index.html"
+        static_file = self.files.get(path)
+        if static_file is not None:
+            return static_file
+        # Client-side routes (no file extension, outside /static) get the SPA shell
+        if not path.startswith("static/") and "." not in path.rsplit("/", 1)[-1]:
+            return self.files.get("index.html")
+        return None
+
+    def response(self, path: str, headers, method: str = "GET") -> Response:
+        static_file = self._resolve(path)
+        if static_file is None:
+            return Response(status_code=404)
+
+        encoding = None
+        if static_file.variants:
+            accepted = parse_accept_encoding(headers.get("accept-encoding", ""))
+            candidates = [coding for coding in static_file.variants if coding in accepted]
+            if candidates:
+                # Prefer the client's highest q, and brotli on ties since it's smaller
+                encoding = max(candidates, key=lambda coding: (accepted[coding], coding == "br"))
+
+        etag = static_file.etag if encoding is None else f'{static_file.etag[:-1]}-{encoding}"'
+        response_headers = {"ETag": etag, "Cache-Control": static_file.cache_control}
+        if static_file.compressible:
+            response_headers["Vary"] = "Accept-Encoding"
+
+        if_none_match = headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=response_headers)
+
+        body = static_file.body if encoding is None else static_file.variants[encoding]
+        if encoding is not None:
+            response_headers["Content-Encoding"] = encoding
+        if method == "HEAD":
+            response_headers["Content-Length"] = str(len(body))
+            body = b""
+        return Response(body, media_type=static_file.content_type, headers=response_headers)
+
+
+def build_variants(directory: str = FRONTEND_BUILD_DIR) -> int:
+    """Write .gz (and .br, with brotli installed) siblings next to compressible build files."""
+    site = StaticSite(directory)
+    site.precompress()
+    written = 0
+    for url_path, static_file in site.files.items():
+        for encoding, data in static_file.variants.items():
+            with open(os.path.join(directory, url_path) + ENCODINGS[encoding], "wb") as f:
+                f.write(data)
+            written += 1
+    return written
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    build_dir = sys.argv[1] if len(sys.argv) > 1 else FRONTEND_BUILD_DIR
+    if not os.path.isdir(build_dir):
+        print(f"❌ No build directory at {build_dir}")
+        sys.exit(1)
+    if brotli is None:
+        print("⚠️ brotli is not installed; writing gzip variants only")
+    print(f"✅ Wrote {build_variants(build_dir)} precompressed variants in {build_dir}")
@@ -1,45 +1,65 @@
 """
-Quick test script for the PlantSense plant disease model.
-Usage: python test_model.py <path_to_image>
-Example: python test_model.py test.jpg
+Quick test script and bulk scorer for the PlantSense plant disease model.
+
+Single image (pretty-printed):
+    python test_model.py <path_to_image>
+    Example: python test_model.py test.jpg
+
+Bulk scoring (directories, globs and/or a manifest of paths):
+    python test_model.py archive/ "extra/*.jpg" --manifest paths.txt --output scores.csv
+    python test_model.py archive/ --output scores.parquet --batch-size 64 --workers 8 --top-k 5
+
+Images are decoded in a process pool and fed to the model in batches through
+a bounded prefetch queue, so decoding overlaps inference. Results go to CSV,
+JSONL or Parquet (by extension). Finished paths are recorded in
+<output>.checkpoint; rerun with --resume to continue an interrupted run.
 """
 
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import queue
 import sys
+import threading
+import time
+
 import numpy as np
-import tensorflow as tf
-from PIL import Image
 
-MODEL_PATH = "plant_disease_1.h5"
+from backends import INFERENCE_BACKEND, load_backend
+from model_registry import manifest_version
+from preprocessing import decode_image, decode_path
+
 CONFIDENCE_THRESHOLD = 70.0
 
-CLASS_NAMES = [
-    "Corn Cercospora leaf spot Gray leaf spot", "Corn Common rust",
-    "Corn (maize) Northern Leaf Blight", "Corn (maize) healthy",
-    "Potato Early blight", "Potato Late_blight", "Potato healthy",
-    "Tomato Bacterial spot", "Tomato Early blight", "Tomato Late blight",
-    "Tomato Leaf Mold", "Tomato Septoria leaf spot",
-    "Tomato Spider mites Two-spotted spider mite", "Tomato Target Spot",
-    "Tomato Yellow Leaf Curl Virus", "Tomato mosaic virus",
-    "Tomato healthy"
-]
-
-def predict(image_path: str):
-    print(f"\n📂 Loading model from '{MODEL_PATH}'...")
-    model = tf.keras.models.load_model(MODEL_PATH)
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp", ".tif", ".tiff")
+
+
+def load_model(model: str = None):
+    """Load a model version from models.json (by name or file; the active one by default) with its class list."""
+    name, spec = manifest_version(model)
+    print(f"\n📂 Loading model '{name}' from '{spec['path']}'...")
+    loaded = load_backend(spec["path"], spec.get("backend", INFERENCE_BACKEND))
     print("✅ Model loaded.\n")
+    return loaded, spec["classes"]
+
+
+def predict(image_path: str, model: str = None):
+    model, class_names = load_model(model)
 
     print(f"🖼️  Processing image: {image_path}")
-    image = Image.open(image_path).convert("RGB").resize((256, 256))
-    img_array = np.array(image, dtype=np.float32)
-    img_batch = np.expand_dims(img_array, axis=0)
+    with open(image_path, "rb") as f:
+        img_batch = decode_image(f.read())[np.newaxis]
 
     print("🔍 Running prediction...\n")
-    predictions = model.predict(img_batch, verbose=0)[0]
+    predictions = model(img_batch)[0]
 
     # Top prediction
     top_idx = int(np.argmax(predictions))
     top_conf = float(predictions[top_idx]) * 100
-    top_class = CLASS_NAMES[top_idx]
+    top_class = class_names[top_idx]
 
     # Top 3
     top3_indices = np.argsort(predictions)[-3:][::-1]
@@ -52,12 +72,210 @@ def predict(image_path: str):
     print(f"   Confidence: {top_conf:.2f}%")
     print("\n📊 Top 3 Predictions:")
     for i, idx in enumerate(top3_indices, 1):
-        print(f"   {i}. {CLASS_NAMES[idx]:<50} {predictions[idx]*100:.2f}%")
+        print(f"   {i}. {class_names[idx]:<50} {predictions[idx]*100:.2f}%")
     print("=" * 50)
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
+
+def collect_paths(inputs: list, manifest: str = None) -> list:
+    """Expand files, directories, globs and an optional manifest into a sorted, de-duplicated path list."""
+    candidates = []
+    for item in inputs:
+        if os.path.isdir(item):
+            candidates.extend(glob.glob(os.path.join(item, "**", "*"), recursive=True))
+        elif os.path.isfile(item):
+            candidates.append(item)
+        else:
+            candidates.extend(glob.glob(item, recursive=True))
+    if manifest:
+        with open(manifest, newline="") as f:
+            if manifest.lower().endswith(".csv"):
+                candidates.extend(row["path"] for row in csv.DictReader(f))
+            else:
+                candidates.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+    paths = {p for p in candidates if p.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(p)}
+    return sorted(paths)
+
+
+def result_row(path: str, probabilities: np.ndarray, top_k: int, class_names: list) -> dict:
+    top_indices = np.argsort(probabilities)[-top_k:][::-1]
+    confidence = float(probabilities[top_indices[0]]) * 100
+    row = {
+        "path": path,
+        "prediction": class_names[top_indices[0]],
+        "confidence": round(confidence, 2),
+        "uncertain": confidence < CONFIDENCE_THRESHOLD,
+        "error": "",
+    }
+    for rank, idx in enumerate(top_indices, 1):
+        row[f"top{rank}_class"] = class_names[idx]
+        row[f"top{rank}_confidence"] = round(float(probabilities[idx]) * 100, 2)
+    return row
+
+
+def error_row(path: str, error: str, top_k: int) -> dict:
+    row = {"path": path, "prediction": "", "confidence": None, "uncertain": None, "error": error}
+    for rank in range(1, top_k + 1):
+        row[f"top{rank}_class"] = ""
+        row[f"top{rank}_confidence"] = None
+    return row
+
+
+class ResultWriter:
+    """Appends result rows as CSV or JSONL; Parquet is staged as JSONL and converted at the end."""
+
+    def __init__(self, output: str, top_k: int, append: bool):
+        self.output = output
+        self.parquet = output.lower().endswith(".parquet")
+        self.path = f"{output}.partial.jsonl" if self.parquet else output
+        self.jsonl = self.parquet or output.lower().endswith((".jsonl", ".ndjson"))
+        self.fields = ["path", "prediction", "confidence", "uncertain", "error"]
+        for rank in range(1, top_k + 1):
+            self.fields += [f"top{rank}_class", f"top{rank}_confidence"]
+
+        if self.parquet and append and os.path.exists(output) and not os.path.exists(self.path):
+            # An earlier run finished and converted its rows; stage them again so the rewrite keeps them
+            import pyarrow.parquet as pq
+            with open(self.path, "w") as f:
+                for row in pq.read_table(output).to_pylist():
+                    f.write(json.dumps(row) + "\n")
+        exists = append and os.path.exists(self.path) and os.path.getsize(self.path) > 0
+        self._file = open(self.path, "a" if append else "w", newline="")
+        if not self.jsonl:
+            self._csv = csv.DictWriter(self._file, fieldnames=self.fields)
+            if not exists:
+                self._csv.writeheader()
+
+    def write(self, rows: list):
+        for row in rows:
+            if self.jsonl:
+                self._file.write(json.dumps(row) + "\n")
+            else:
+                self._csv.writerow(row)
+        self._file.flush()
+
+    def close(self, finished: bool = True):
+        """Close the file; Parquet is only written once the run finished, so --resume keeps the staged rows."""
+        self._file.close()
+        if self.parquet and finished:
+            import pyarrow.json as pa_json
+            import pyarrow.parquet as pq
+            pq.write_table(pa_json.read_json(self.path), self.output)
+            os.remove(self.path)
+
+
+def _put(batches: queue.Queue, item, stop: threading.Event) -> bool:
+    """Block while the prefetch queue is full, giving up once the consumer has stopped."""
+    while not stop.is_set():
+        try:
+            batches.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _produce_batches(paths: list, batch_size: int, workers: int, batches: queue.Queue, stop: threading.Event):
+    """Decode paths in a process pool, one batch at a time, blocking when the prefetch queue is full."""
+    try:
+        # spawn: decode workers must not inherit the parent's TensorFlow threads
+        with multiprocessing.get_context("spawn").Pool(workers) as pool:
+            for start in range(0, len(paths), batch_size):
+                chunk = paths[start:start + batch_size]
+                # Leaving the with block terminates the pool, so a stopped consumer never leaves it behind
+                if stop.is_set() or not _put(batches, (chunk, pool.map(decode_path, chunk)), stop):
+                    return
+    except Exception as e:
+        # Hand the failure to the consumer instead of leaving it waiting forever
+        _put(batches, e, stop)
+        return
+    _put(batches, None, stop)
+
+
+def score(paths: list, model, class_names: list, output: str, batch_size: int = 32, workers: int = None,
+          prefetch: int = 4, top_k: int = 3, resume: bool = False):
+    checkpoint_path = f"{output}.checkpoint"
+    done = set()
+    if resume and os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            done = {line.rstrip("\n") for line in f}
+    remaining = [p for p in paths if p not in done]
+    print(f"🗂️  {len(paths)} images found, {len(done)} already scored, {len(remaining)} to go")
+
+    writer = ResultWriter(output, top_k, append=resume)
+    checkpoint = open(checkpoint_path, "a" if resume else "w")
+    batches = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+    producer = threading.Thread(
+        target=_produce_batches,
+        args=(remaining, batch_size, workers or os.cpu_count() or 1, batches, stop),
+        name="bulk-decode",
+        daemon=True,
+    )
+    producer.start()
+
+    scored, started, finished = 0, time.perf_counter(), False
+    try:
+        while (item := batches.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            chunk, decoded = item
+            good = [i for i, (image, _) in enumerate(decoded) if image is not None]
+            probabilities = model(np.stack([decoded[i][0] for i in good])) if good else []
+            rows = [error_row(path, decoded[i][1], top_k) for i, path in enumerate(chunk)]
+            for i, row in zip(good, probabilities):
+                rows[i] = result_row(chunk[i], row, top_k, class_names)
+            writer.write(rows)
+            # Checkpoint only after the rows are flushed, so a crash never skips an unwritten image
+            checkpoint.write("".join(path + "\n" for path in chunk))
+            checkpoint.flush()
+            scored += len(chunk)
+            rate = scored / (time.perf_counter() - started)
+            print(f"   {scored}/{len(remaining)} scored ({rate:.1f} img/s)", end="\r", flush=True)
+        finished = True
+    finally:
+        # On an error or Ctrl-C, the producer stops at its next batch and shuts the decode pool down
+        stop.set()
+        producer.join()
+        checkpoint.close()
+        writer.close(finished)
+    print(f"\n✅ Wrote {output}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score images with the plant disease model.")
+    parser.add_argument("inputs", nargs="*", help="Image files, directories or glob patterns")
+    parser.add_argument("--manifest", help="Text file with one path per line, or a CSV with a 'path' column")
+    parser.add_argument("--output", help="Results file (.csv, .jsonl or .parquet); enables bulk mode")
+    parser.add_argument("--model", help="Model version name or file from models.json (default: the active version)")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=None, help="Decode processes (default: CPU count)")
+    parser.add_argument("--prefetch", type=int, default=4, help="Decoded batches to keep ready ahead of the model")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--resume", action="store_true", help="Skip paths listed in <output>.checkpoint")
+    args = parser.parse_args(argv)
+
+    if not args.inputs and not args.manifest:
         print("Usage: python test_model.py <path_to_image>")
         print("Example: python test_model.py leaf.jpg")
-        sys.exit(1)
-    predict(sys.argv[1])
+        print("Bulk:    python test_model.py <dir|glob> ... --output results.csv")
+        return 1
+
+    if not args.output:
+        if len(args.inputs) == 1 and os.path.isfile(args.inputs[0]) and not args.manifest:
+            predict(args.inputs[0], args.model)
+            return 0
+        parser.error("--output is required when scoring more than one image")
+
+    paths = collect_paths(args.inputs, args.manifest)
+    if not paths:
+        print("⚠️  No images found")
+        return 1
+
+    model, class_names = load_model(args.model)
+    score(paths, model, class_names, args.output, args.batch_size, args.workers, args.prefetch,
+          min(args.top_k, len(class_names)), args.resume)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
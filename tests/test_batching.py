@@ -0,0 +1,90 @@
+"""MicroBatcher: no caller may be left waiting on a future nobody will resolve."""
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from batching import BatcherClosedError, MicroBatcher, QueueFullError
+
+
+def image(value):
+    return np.full((2, 2, 3), value, dtype=np.float32)
+
+
+def mean_model(batch):
+    return batch.reshape(len(batch), -1).mean(axis=1, keepdims=True)
+
+
+def test_each_caller_gets_its_own_row():
+    async def scenario():
+        batcher = MicroBatcher(mean_model, max_batch_size=4, max_wait_ms=5)
+        results = await asyncio.gather(*(batcher.submit(image(i)) for i in range(6)))
+        await batcher.close()
+        return results
+    assert [float(row[0]) for row in asyncio.run(scenario())] == [0, 1, 2, 3, 4, 5]
+
+
+def test_short_model_output_fails_the_batch():
+    async def scenario():
+        batcher = MicroBatcher(lambda batch: mean_model(batch)[:-1], max_batch_size=3, max_wait_ms=20)
+        results = await asyncio.wait_for(
+            asyncio.gather(*(batcher.submit(image(i)) for i in range(3)), return_exceptions=True), timeout=5)
+        await batcher.close()
+        return results
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_restarted_worker_keeps_queued_requests():
+    async def scenario():
+        release = asyncio.Event()
+
+        async def runner(fn, images):
+            await release.wait()
+            return fn(images)
+
+        batcher = MicroBatcher(mean_model, max_batch_size=1, max_wait_ms=0, runner=runner)
+        in_flight = asyncio.ensure_future(batcher.submit(image(1)))
+        queued = asyncio.ensure_future(batcher.submit(image(2)))
+        await asyncio.sleep(0.01)
+
+        # The worker dies with one request in its batch and one still queued
+        batcher._worker.cancel()
+        await asyncio.sleep(0.01)
+        later = asyncio.ensure_future(batcher.submit(image(3)))
+        release.set()
+        results = await asyncio.wait_for(asyncio.gather(queued, later), timeout=5)
+        # The request the dead worker had already taken is failed, not stranded
+        with pytest.raises(BatcherClosedError):
+            await asyncio.wait_for(in_flight, timeout=5)
+        await batcher.close()
+        return results
+    assert [float(row[0]) for row in asyncio.run(scenario())] == [2, 3]
+
+
+def test_queue_full_is_rejected():
+    async def scenario():
+        batcher = MicroBatcher(mean_model, max_batch_size=1, max_queue=1, runner=lambda fn, images: asyncio.sleep(10))
+        first = asyncio.ensure_future(batcher.submit(image(0)))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(batcher.submit(image(1)))
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError):
+            await batcher.submit(image(2))
+        for task in (first, second):
+            task.cancel()
+        await batcher.close()
+    asyncio.run(scenario())
+
+
+def test_close_fails_collected_and_queued_requests():
+    async def scenario():
+        batcher = MicroBatcher(mean_model, max_batch_size=1, max_wait_ms=0,
+                               runner=lambda fn, images: asyncio.sleep(10))
+        running = asyncio.ensure_future(batcher.submit(image(0)))
+        queued = asyncio.ensure_future(batcher.submit(image(1)))
+        await asyncio.sleep(0.01)
+        await batcher.close()
+        return await asyncio.wait_for(asyncio.gather(running, queued, return_exceptions=True), timeout=5)
+    assert all(isinstance(result, BatcherClosedError) for result in asyncio.run(scenario()))
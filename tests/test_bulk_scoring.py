@@ -0,0 +1,68 @@
+"""Bulk scoring in test_model.py: interrupted runs must resume without losing rows and must not hang."""
+
+import multiprocessing
+import threading
+
+import numpy as np
+import pytest
+from PIL import Image
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+import test_model  # noqa: E402
+
+CLASSES = ["healthy", "blight"]
+
+
+class FlakyModel:
+    """Returns fixed probabilities, failing once after `fail_after` batches."""
+
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.calls = 0
+
+    def __call__(self, batch):
+        self.calls += 1
+        if self.fail_after is not None and self.calls > self.fail_after:
+            raise KeyboardInterrupt
+        return np.tile([0.9, 0.1], (len(batch), 1))
+
+
+@pytest.fixture
+def images(tmp_path):
+    paths = []
+    for i in range(11):
+        path = tmp_path / f"leaf_{i:02d}.png"
+        Image.new("RGB", (32, 32), (i * 20, 120, 40)).save(path)
+        paths.append(str(path))
+    return paths
+
+
+def test_parquet_resume_keeps_rows_from_interrupted_run(images, tmp_path):
+    output = str(tmp_path / "scores.parquet")
+    with pytest.raises(KeyboardInterrupt):
+        test_model.score(images, FlakyModel(fail_after=2), CLASSES, output, batch_size=2, workers=1, top_k=1)
+    # Nothing converted yet: the staged rows stay for --resume
+    assert not (tmp_path / "scores.parquet").exists()
+
+    test_model.score(images, FlakyModel(), CLASSES, output, batch_size=2, workers=1, top_k=1, resume=True)
+    rows = pq.read_table(output).to_pylist()
+    assert sorted(row["path"] for row in rows) == sorted(images)
+    assert not (tmp_path / "scores.parquet.partial.jsonl").exists()
+
+
+def test_parquet_resume_after_finished_run_appends(images, tmp_path):
+    output = str(tmp_path / "scores.parquet")
+    test_model.score(images[:5], FlakyModel(), CLASSES, output, batch_size=2, workers=1, top_k=1)
+    test_model.score(images, FlakyModel(), CLASSES, output, batch_size=2, workers=1, top_k=1, resume=True)
+    rows = pq.read_table(output).to_pylist()
+    assert sorted(row["path"] for row in rows) == sorted(images)
+
+
+def test_interrupted_run_shuts_down_the_decode_pool(images, tmp_path):
+    output = str(tmp_path / "scores.csv")
+    with pytest.raises(KeyboardInterrupt):
+        # A full prefetch queue leaves the producer blocked when the consumer stops
+        test_model.score(images, FlakyModel(fail_after=1), CLASSES, output, batch_size=1, workers=1, prefetch=1)
+    assert not [thread for thread in threading.enumerate() if thread.name == "bulk-decode"]
+    assert not multiprocessing.active_children()
@@ -0,0 +1,46 @@
+"""export_model.py's parity check and where exported backends are loaded from."""
+
+import numpy as np
+import pytest
+from PIL import Image
+
+pytest.importorskip("tensorflow")
+
+import export_model  # noqa: E402
+from backends import backend_model_path  # noqa: E402
+
+
+def reference(batch):
+    return np.tile([0.8, 0.2], (len(batch), 1))
+
+
+def test_parity_skips_unreadable_images(tmp_path):
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"leaf_{i}.png"
+        Image.new("RGB", (64, 64), (0, 40 * i, 0)).save(path)
+        paths.append(str(path))
+    broken = tmp_path / "broken.jpg"
+    broken.write_bytes(b"not an image")
+    paths.insert(1, str(broken))
+
+    report = export_model.check_parity(reference, reference, paths, batch_size=2)
+    assert report["images"] == 3
+    assert report["skipped"] == 1
+    assert report["top1_agreement"] == 1.0
+
+
+def test_parity_reports_no_usable_images(tmp_path):
+    broken = tmp_path / "broken.jpg"
+    broken.write_bytes(b"not an image")
+    report = export_model.check_parity(reference, reference, [str(broken)])
+    assert report["images"] == 0
+    assert report["skipped"] == 1
+
+
+def test_backend_path_comes_from_the_version():
+    assert backend_model_path("plant_disease_1.h5", "keras") == "plant_disease_1.h5"
+    assert backend_model_path("plant_disease_1.h5", "tflite") == "plant_disease_1.tflite"
+    assert backend_model_path("plant_disease_1.h5", "onnx") == "plant_disease_1.onnx"
+    # A version can point straight at a quantized export
+    assert backend_model_path("plant_disease_1.int8.tflite", "tflite") == "plant_disease_1.int8.tflite"
@@ -0,0 +1,56 @@
+"""The frontend catch-all must not answer API paths with the SPA shell, nor serve source maps."""
+
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from starlette.testclient import TestClient  # noqa: E402
+
+import plantapi  # noqa: E402
+from static_serving import StaticSite  # noqa: E402
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    (tmp_path / "static" / "js").mkdir(parents=True)
+    (tmp_path / "index.html").write_text("<html>shell</html>")
+    (tmp_path / "static" / "js" / "main.8ab80750.js").write_text("console.log('plantsense')")
+    (tmp_path / "static" / "js" / "main.8ab80750.js.map").write_text('{"sources": []}')
+    monkeypatch.setattr(plantapi, "STATIC_SITE", StaticSite(str(tmp_path)))
+    return TestClient(plantapi.app)
+
+
+def test_unknown_client_routes_get_the_spa_shell(client):
+    response = client.get("/diagnose/history")
+    assert response.status_code == 200
+    assert response.text == "<html>shell</html>"
+
+
+@pytest.mark.parametrize("path", ["/predict", "/models", "/scan"])
+def test_browser_navigation_to_client_routes_gets_the_spa_shell(client, path):
+    for method in (client.get, client.head):
+        response = method(path, headers={"Accept": "text/html,application/xhtml+xml,*/*;q=0.8"})
+        assert response.status_code == 200
+    assert client.get(path, headers={"Accept": "text/html"}).text == "<html>shell</html>"
+
+
+@pytest.mark.parametrize("path", ["/predict", "/predict/batch", "/scan", "/voice-token"])
+def test_api_get_on_post_endpoints_is_405(client, path):
+    response = client.get(path, headers={"Accept": "application/json"})
+    assert response.status_code == 405
+    assert response.headers["allow"] == "POST"
+
+
+def test_api_namespace_is_never_a_page(client):
+    assert client.get("/api/predcit", headers={"Accept": "text/html"}).status_code == 404
+    assert client.get("/api/models", headers={"Accept": "text/html"}).status_code == 200
+
+
+@pytest.mark.parametrize("path", ["/api/predcit", "/api", "/health/nope", "/predict/batches"])
+def test_unknown_api_paths_are_404(client, path):
+    assert client.get(path).status_code == 404
+
+
+def test_source_maps_are_not_served(client):
+    assert client.get("/static/js/main.8ab80750.js").status_code == 200
+    assert client.get("/static/js/main.8ab80750.js.map").status_code == 404
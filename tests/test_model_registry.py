@@ -0,0 +1,62 @@
+"""Shadow scoring must stay out of live traffic's way, and retiring a version must not race a reload."""
+
+import asyncio
+import json
+import os
+
+import numpy as np
+import pytest
+
+from model_registry import ModelRegistry
+
+KNOWLEDGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "plant_disease_database.json")
+CLASSES = ["Tomato healthy", "Tomato Leaf Mold"]
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    versions = {}
+    for name in ("v1", "v2"):
+        (tmp_path / f"{name}.h5").write_bytes(name.encode())
+        versions[name] = {"path": str(tmp_path / f"{name}.h5"), "classes": CLASSES}
+    path = tmp_path / "models.json"
+    path.write_text(json.dumps({"active": "v1", "shadow": {"version": "v2", "sample_rate": 1.0}, "versions": versions}))
+    return str(path)
+
+
+def shadow_run(manifest, busy):
+    calls = []
+
+    def predict(batch):
+        calls.append(len(batch))
+        return np.tile([0.2, 0.8], (len(batch), 1))
+
+    async def runner(fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    async def scenario():
+        registry = ModelRegistry(lambda version: predict, runner=runner, busy=busy, manifest_path=manifest,
+                                 reload_interval=0, knowledge_path=KNOWLEDGE)
+        registry.start()
+        version = await registry.wait_ready(30)
+        for _ in range(100):
+            if registry.shadow is not None:
+                break
+            await asyncio.sleep(0.05)
+        warmup_calls = len(calls)
+        registry.shadow_score(version, np.zeros((256, 256, 3), np.uint8), np.array([0.1, 0.9]))
+        await asyncio.sleep(0.3)
+        registry.stop()
+        return registry.status()["shadow"], len(calls) - warmup_calls
+
+    return asyncio.run(scenario())
+
+
+def test_shadow_pass_runs_when_the_executor_is_free(manifest):
+    shadow, passes = shadow_run(manifest, busy=lambda: False)
+    assert (shadow["scored"], shadow["dropped"], passes) == (1, 0, 1)
+
+
+def test_shadow_pass_is_skipped_while_live_traffic_is_running(manifest):
+    shadow, passes = shadow_run(manifest, busy=lambda: True)
+    assert (shadow["scored"], shadow["dropped"], passes) == (0, 1, 0)
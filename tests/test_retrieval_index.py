@@ -0,0 +1,46 @@
+"""Rebuilding the voice agent's knowledge index must not disturb processes that have it mapped."""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "plantsense_voice"))
+
+import retrieval  # noqa: E402
+
+
+def write_database(path, diseases):
+    entries = [{"Disease": name, "response": f"{name} is treated with {treatment}."} for name, treatment in diseases]
+    path.write_text(json.dumps(entries))
+
+
+def top(index, text):
+    return index.diseases[int(index.scores(text).argmax())]
+
+
+def test_rebuild_leaves_mapped_index_intact(tmp_path):
+    database, index_dir = tmp_path / "db.json", str(tmp_path / "index")
+    write_database(database, [("Tomato Early blight", "copper fungicide"), ("Potato Late blight", "mancozeb")])
+    before = retrieval.load_index(str(database), index_dir)
+    assert top(before, "copper") == "Tomato Early blight"
+
+    write_database(database, [("Corn Common rust", "resistant hybrids"), ("Tomato Leaf Mold", "ventilation"),
+                              ("Tomato Early blight", "copper fungicide")])
+    after = retrieval.load_index(str(database), index_dir)
+    assert after.digest != before.digest
+    assert top(after, "ventilation") == "Tomato Leaf Mold"
+    # The index opened before the rebuild still reads its own, complete postings
+    assert top(before, "copper") == "Tomato Early blight"
+    assert top(before, "mancozeb") == "Potato Late blight"
+
+    # One matching set of arrays, no leftovers from the old build or from temporary files
+    assert sorted(os.listdir(index_dir)) == sorted(
+        ["meta.json"] + [f"{name}.{after.digest}.npy" for name in ("doc_ids", "offsets", "weights")])
+
+
+def test_missing_arrays_trigger_a_rebuild(tmp_path):
+    database, index_dir = tmp_path / "db.json", str(tmp_path / "index")
+    write_database(database, [("Tomato Early blight", "copper fungicide")])
+    index = retrieval.load_index(str(database), index_dir)
+    os.remove(os.path.join(index_dir, f"weights.{index.digest}.npy"))
+    assert top(retrieval.load_index(str(database), index_dir), "copper") == "Tomato Early blight"
@@ -0,0 +1,28 @@
+"""Scan decoding must never scale an upload beyond SCAN_MAX_SIDE, however it is shaped."""
+
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from preprocessing import decode_scan_image
+from tiling import plan_scan
+
+
+def png(width, height):
+    buffer = BytesIO()
+    Image.new("RGB", (width, height), (40, 140, 40)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("size", [(20000, 10), (10, 20000), (4000, 300)])
+def test_extreme_strips_are_rejected(size):
+    with pytest.raises(ValueError, match="too narrow"):
+        plan_scan(png(*size), max_side=3072)
+
+
+@pytest.mark.parametrize("size", [(3072, 256), (100, 80), (6000, 4000), (300, 3600)])
+def test_scaled_image_stays_within_bounds(size):
+    height, width = decode_scan_image(png(*size), max_side=3072, min_side=256).shape[:2]
+    assert max(height, width) <= 3072
+    assert min(height, width) >= 256
@@ -0,0 +1,33 @@
+"""serve.py must size itself from the container's CPU quota, not the host's core count."""
+
+import os
+
+import serve
+
+
+def test_cgroup_v2_quota(tmp_path):
+    (tmp_path / "cpu.max").write_text("200000 100000\n")
+    assert serve._cgroup_cpu_limit(str(tmp_path)) == 2
+
+
+def test_cgroup_v2_unlimited(tmp_path):
+    (tmp_path / "cpu.max").write_text("max 100000\n")
+    assert serve._cgroup_cpu_limit(str(tmp_path)) is None
+
+
+def test_cgroup_v1_fractional_quota_rounds_down_to_one(tmp_path):
+    (tmp_path / "cpu").mkdir()
+    (tmp_path / "cpu" / "cpu.cfs_quota_us").write_text("50000\n")
+    (tmp_path / "cpu" / "cpu.cfs_period_us").write_text("100000\n")
+    assert serve._cgroup_cpu_limit(str(tmp_path)) == 1
+
+
+def test_no_cgroup_files(tmp_path):
+    assert serve._cgroup_cpu_limit(str(tmp_path)) is None
+
+
+def test_available_cores_is_capped_by_the_quota(monkeypatch):
+    monkeypatch.setattr(serve, "_cgroup_cpu_limit", lambda: 1)
+    assert serve.available_cores() == 1
+    monkeypatch.setattr(serve, "_cgroup_cpu_limit", lambda: None)
+    assert serve.available_cores() == len(os.sched_getaffinity(0))
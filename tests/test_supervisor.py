@@ -0,0 +1,194 @@
+"""The voice agent supervisor against fake rooms, sessions and room discovery."""
+
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "plantsense_voice"))
+
+import supervisor  # noqa: E402
+from supervisor import AgentSupervisor  # noqa: E402
+
+
+class FakeParticipant:
+    def __init__(self, identity, kind=0):
+        self.identity = identity
+        self.kind = kind
+
+
+class FakeRoom:
+    def __init__(self, name, others=(), fail_disconnect=False):
+        self.name = name
+        self.remote_participants = {"caller": FakeParticipant("caller")}
+        self.remote_participants.update({p.identity: p for p in others})
+        self.connected = True
+        self.fail_disconnect = fail_disconnect
+
+    def isconnected(self):
+        return self.connected
+
+    async def disconnect(self):
+        self.connected = False
+        if self.fail_disconnect:
+            raise ConnectionError("signal connection already closed")
+
+
+class FakeSession:
+    def __init__(self):
+        self.room = None
+        self.greeted = False
+        self.closed = False
+
+    async def start(self, room):
+        self.room = room
+
+    async def greet(self):
+        self.greeted = True
+
+    async def aclose(self):
+        self.closed = True
+
+
+class FakeDirectory:
+    """Caller rooms as LiveKit's room service would list them; counts the calls."""
+
+    def __init__(self):
+        self.rooms = set()
+        self.calls = 0
+
+    async def pending_rooms(self, skip=()):
+        self.calls += 1
+        return {name: None for name in self.rooms if name not in skip}
+
+    async def aclose(self):
+        pass
+
+
+class Harness:
+    def __init__(self, room_options=None, **options):
+        self.directory = FakeDirectory()
+        self.rooms = {}
+        self.room_options = room_options or {}
+        self.sessions = []
+        self.supervisor = AgentSupervisor(self.directory, self._session, connect_room=self._connect, **options)
+
+    def _session(self):
+        session = FakeSession()
+        self.sessions.append(session)
+        return session
+
+    async def _connect(self, name):
+        self.rooms[name] = FakeRoom(name, **self.room_options.get(name, {}))
+        return self.rooms[name]
+
+    def caller_leaves(self, name):
+        self.rooms[name].remote_participants = {}
+        self.directory.rooms.discard(name)
+
+
+async def _until(condition, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def test_serves_rooms_concurrently_and_queues_beyond_capacity():
+    async def scenario():
+        h = Harness(max_rooms=2, prewarm=2, idle_timeout=0.1, dispatch_interval=0.01, max_dispatch_interval=0.05)
+        task = asyncio.create_task(h.supervisor.run())
+        h.directory.rooms |= {"plantsense-a", "plantsense-b", "plantsense-c"}
+        await _until(lambda: len(h.supervisor.rooms) == 2)
+        await _until(lambda: sum(s.greeted for s in h.sessions) == 2)
+        assert h.supervisor.cold_starts == 0  # both callers got pre-warmed sessions
+
+        # The first caller hangs up: the agent leaves after the idle timeout and the queued room gets the slot
+        queued, = h.directory.rooms - set(h.supervisor.rooms)
+        first = next(iter(h.supervisor.rooms))
+        h.caller_leaves(first)
+        await _until(lambda: queued in h.supervisor.rooms)
+        assert not h.rooms[first].connected
+        assert h.supervisor.reaped == 1
+
+        h.supervisor.stop()
+        await task
+        assert all(session.closed for session in h.sessions if session.room is not None)
+    asyncio.run(scenario())
+
+
+def test_backs_off_polling_while_idle():
+    async def scenario():
+        h = Harness(prewarm=0, dispatch_interval=0.01, max_dispatch_interval=0.2)
+        task = asyncio.create_task(h.supervisor.run())
+        await asyncio.sleep(1.0)
+        idle_calls = h.directory.calls
+        # Base rate would be ~100 calls; backed off to 0.2s it is a handful
+        assert idle_calls < 15
+
+        # A new caller resets the interval and is picked up promptly
+        h.directory.rooms.add("plantsense-new")
+        await _until(lambda: "plantsense-new" in h.supervisor.rooms, timeout=1.0)
+        h.supervisor.stop()
+        await task
+    asyncio.run(scenario())
+
+
+def test_failed_disconnect_still_frees_the_slot():
+    async def scenario():
+        h = Harness(room_options={"plantsense-a": {"fail_disconnect": True}}, max_rooms=1, prewarm=0,
+                    idle_timeout=0.05, dispatch_interval=0.01, max_dispatch_interval=0.05)
+        task = asyncio.create_task(h.supervisor.run())
+        h.directory.rooms.add("plantsense-a")
+        await _until(lambda: "plantsense-a" in h.supervisor.rooms)
+        h.directory.rooms.add("plantsense-b")
+        h.caller_leaves("plantsense-a")
+        await _until(lambda: "plantsense-b" in h.supervisor.rooms)
+        h.supervisor.stop()
+        await task
+    asyncio.run(scenario())
+
+
+def test_agent_whose_identity_sorts_later_yields_the_room():
+    async def scenario():
+        rival = FakeParticipant("plant-assistant-agent-00000000", kind=supervisor.AGENT_KIND)
+        h = Harness(room_options={"plantsense-a": {"others": [rival]}}, identity="plant-assistant-agent-ffffffff",
+                    prewarm=0, dispatch_interval=0.01, max_dispatch_interval=0.05)
+        task = asyncio.create_task(h.supervisor.run())
+        h.directory.rooms.add("plantsense-a")
+        await _until(lambda: h.supervisor.yielded == 1 and not h.supervisor.rooms)
+        assert not h.rooms["plantsense-a"].connected
+        assert not h.sessions  # no session was spent on the room
+        h.supervisor.stop()
+        await task
+    asyncio.run(scenario())
+
+
+def test_livekit_directory_skips_rooms_with_an_agent():
+    class Api:
+        def __init__(self, rooms, participants):
+            self.rooms, self.participants, self.listed = rooms, participants, []
+
+        async def list_rooms(self, request):
+            return SimpleNamespace(rooms=self.rooms)
+
+        async def list_participants(self, request):
+            self.listed.append(request.room)
+            return SimpleNamespace(participants=self.participants[request.room])
+
+    def room(name, participants):
+        return SimpleNamespace(name=name, num_participants=participants, creation_time_ms=1000, creation_time=1)
+
+    caller = FakeParticipant("caller")
+    agent = FakeParticipant("plant-assistant-agent-12345678", kind=supervisor.AGENT_KIND)
+    api = Api(
+        [room("plantsense-new", 1), room("plantsense-taken", 2), room("plantsense-orphan", 1),
+         room("plantsense-empty", 0), room("other-room", 1), room("plantsense-mine", 2)],
+        {"plantsense-new": [caller], "plantsense-taken": [caller, agent], "plantsense-orphan": [agent]},
+    )
+    directory = object.__new__(supervisor.LiveKitRoomDirectory)
+    directory.prefix, directory._api = "plantsense-", SimpleNamespace(room=api)
+    directory._request, directory._participants_request = SimpleNamespace, SimpleNamespace
+    pending = asyncio.run(directory.pending_rooms(skip={"plantsense-mine"}))
+    assert pending == {"plantsense-new": 1.0}
+    assert sorted(api.listed) == ["plantsense-new", "plantsense-orphan", "plantsense-taken"]
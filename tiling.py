@@ -0,0 +1,182 @@
+"""
+Tiled scanning of wide field and whole-plant photos for /scan.
+
+/predict squeezes the whole upload into one 256x256 input, so on a drone or
+field photo individual lesions end up a few pixels wide. A scan instead
+decodes the image at up to SCAN_MAX_SIDE pixels, cuts it into overlapping
+model-sized tiles, drops tiles that are mostly soil, sky or other
+background, and runs the rest through the model in batches. The result is
+a per-tile disease map plus an aggregate diagnosis.
+
+The background filter works on summed-area tables of a subsampled copy of
+the image, so scoring every tile position is a few numpy operations rather
+than a loop over tiles.
+"""
+
+import os
+from dataclasses import dataclass
+
+import numpy as np
+
+import metrics
+from preprocessing import IMAGE_SIZE, decode_scan_image
+
+SCAN_MAX_UPLOAD_BYTES = int(os.getenv("SCAN_MAX_UPLOAD_BYTES", str(30 * 1024 * 1024)))
+SCAN_MAX_IMAGE_PIXELS = int(os.getenv("SCAN_MAX_IMAGE_PIXELS", str(120_000_000)))
+SCAN_MAX_SIDE = int(os.getenv("SCAN_MAX_SIDE", "3072"))  # long side the image is scaled to before tiling
+SCAN_TILE_OVERLAP = float(os.getenv("SCAN_TILE_OVERLAP", "0.25"))
+SCAN_BATCH_SIZE = int(os.getenv("SCAN_BATCH_SIZE", "64"))  # tiles per forward pass
+SCAN_MAX_TILES = int(os.getenv("SCAN_MAX_TILES", "512"))
+SCAN_MIN_PLANT_FRACTION = float(os.getenv("SCAN_MIN_PLANT_FRACTION", "0.15"))  # share of green pixels to keep a tile
+SCAN_MIN_TEXTURE = float(os.getenv("SCAN_MIN_TEXTURE", "6.0"))  # grey-level std dev; flatter tiles are background
+SCAN_GREEN_MARGIN = 20  # excess green (2G - R - B) above which a pixel counts as vegetation
+FILTER_STEP = 4  # the filter samples every 4th pixel in each direction
+
+SCAN_TILES = metrics.REGISTRY.counter(
+    "plantsense_scan_tiles_total",
+    "Tiles considered by /scan, by whether they went through the model",
+    ["result"],
+)
+
+
+@dataclass
+class ScanPlan:
+    width: int
+    height: int
+    tile: int
+    stride: int
+    ys: np.ndarray  # tile row offsets
+    xs: np.ndarray  # tile column offsets
+    keep: np.ndarray  # (rows, cols) bool mask of tiles sent to the model
+    tiles: np.ndarray  # (kept, tile, tile, 3) uint8, row-major over `keep`
+
+
+def tile_starts(length: int, tile: int, stride: int) -> np.ndarray:
+    """Offsets of tiles covering [0, length), the last one flush with the edge."""
+    starts = list(range(0, length - tile + 1, stride))
+    if starts[-1] != length - tile:
+        starts.append(length - tile)
+    return np.asarray(starts)
+
+
+def _summed_area(values: np.ndarray) -> np.ndarray:
+    table = np.zeros((values.shape[0] + 1, values.shape[1] + 1), dtype=np.float64)
+    np.cumsum(np.cumsum(values, axis=0), axis=1, out=table[1:, 1:])
+    return table
+
+
+def _window_sums(table: np.ndarray, ys: np.ndarray, xs: np.ndarray, size: int) -> np.ndarray:
+    """Sum over every size x size window at (ys x xs) offsets, from a summed-area table."""
+    top, left = ys[:, None], xs[None, :]
+    bottom, right = top + size, left + size
+    return table[bottom, right] - table[top, right] - table[bottom, left] + table[top, left]
+
+
+def plant_mask(image: np.ndarray, ys: np.ndarray, xs: np.ndarray, tile: int) -> np.ndarray:
+    """(rows, cols) mask of tiles with enough vegetation and texture to be worth a forward pass."""
+    sample = image[::FILTER_STEP, ::FILTER_STEP].astype(np.float32)
+    red, green, blue = sample[..., 0], sample[..., 1], sample[..., 2]
+    vegetation = (2 * green - red - blue) > SCAN_GREEN_MARGIN
+    grey = 0.299 * red + 0.587 * green + 0.114 * blue
+
+    size = tile // FILTER_STEP
+    sys_, sxs = ys // FILTER_STEP, xs // FILTER_STEP
+    area = float(size * size)
+    green_fraction = _window_sums(_summed_area(vegetation), sys_, sxs, size) / area
+    mean = _window_sums(_summed_area(grey), sys_, sxs, size) / area
+    mean_square = _window_sums(_summed_area(grey * grey), sys_, sxs, size) / area
+    texture = np.sqrt(np.maximum(mean_square - mean * mean, 0.0))
+    return (green_fraction >= SCAN_MIN_PLANT_FRACTION) & (texture >= SCAN_MIN_TEXTURE)
+
+
+def plan_scan(data: bytes, tile: int = IMAGE_SIZE, max_side: int = SCAN_MAX_SIDE,
+              overlap: float = SCAN_TILE_OVERLAP, max_tiles: int = SCAN_MAX_TILES) -> ScanPlan:
+    """Decode, tile and pre-filter an upload; CPU-bound, so run it on the decode pool."""
+    try:
+        with metrics.STAGE_SECONDS.time(stage="scan_decode"):
+            image = decode_scan_image(data, max_side, tile)
+    except Exception as e:
+        raise ValueError(f"Error processing image: {str(e)}")
+    with metrics.STAGE_SECONDS.time(stage="scan_tile"):
+        height, width = image.shape[:2]
+        stride = max(1, int(tile * (1 - overlap)))
+        ys, xs = tile_starts(height, tile, stride), tile_starts(width, tile, stride)
+        keep = plant_mask(image, ys, xs, tile)
+        if keep.sum() > max_tiles:
+            # Thin the kept tiles evenly rather than truncating, so coverage stays spread over the image
+            positions = np.flatnonzero(keep)
+            chosen = positions[np.linspace(0, len(positions) - 1, max_tiles).round().astype(int)]
+            keep[:] = False
+            keep.flat[chosen] = True
+        rows, cols = np.nonzero(keep)
+        tiles = np.empty((len(rows), tile, tile, 3), dtype=np.uint8)
+        for index, (row, col) in enumerate(zip(rows, cols)):
+            tiles[index] = image[ys[row]:ys[row] + tile, xs[col]:xs[col] + tile]
+    SCAN_TILES.inc(len(tiles), result="scanned")
+    SCAN_TILES.inc(keep.size - len(tiles), result="skipped")
+    return ScanPlan(width, height, tile, stride, ys, xs, keep, tiles)
+
+
+async def predict_tiles(plan: ScanPlan, predict_fn, runner, batch_size: int = SCAN_BATCH_SIZE) -> np.ndarray:
+    """(kept, classes) probabilities for the plan's tiles, SCAN_BATCH_SIZE tiles per forward pass."""
+    outputs = []
+    for start in range(0, len(plan.tiles), batch_size):
+        batch = plan.tiles[start:start + batch_size]
+        metrics.BATCH_SIZE.observe(len(batch))
+        outputs.append(np.asarray(await runner(predict_fn, batch)))
+    return np.concatenate(outputs)
+
+
+def summarize_scan(plan: ScanPlan, probabilities: np.ndarray, class_name, threshold: float) -> dict:
+    """Aggregate diagnosis and per-tile heatmap from tile probabilities.
+
+    The diagnosis is the disease with the most confident-tile evidence (summed
+    confidence of tiles predicting it above `threshold`); a scan with no
+    confident diseased tile falls back to the mean prediction over all tiles.
+    """
+    labels = probabilities.argmax(axis=1)
+    confidences = probabilities.max(axis=1)
+    healthy = np.array(["healthy" in class_name(i).lower() for i in range(probabilities.shape[1])])
+    diseased = ~healthy[labels]
+    confident = confidences >= threshold
+
+    evidence = np.bincount(labels[diseased & confident], weights=confidences[diseased & confident],
+                           minlength=probabilities.shape[1])
+    if evidence.any():
+        predicted_index = int(evidence.argmax())
+        confidence = float(confidences[labels == predicted_index].mean())
+    else:
+        mean = probabilities.mean(axis=0)
+        predicted_index = int(mean.argmax())
+        confidence = float(mean[predicted_index])
+
+    heatmap = [[None] * len(plan.xs) for _ in plan.ys]
+    for (row, col), label, tile_confidence in zip(zip(*np.nonzero(plan.keep)), labels, confidences):
+        heatmap[row][col] = {"disease": class_name(int(label)), "confidence": round(float(tile_confidence) * 100, 2)}
+
+    counts = np.bincount(labels, minlength=probabilities.shape[1])
+    findings = [
+        {
+            "disease": class_name(int(index)),
+            "tiles": int(counts[index]),
+            "meanConfidence": round(float(confidences[labels == index].mean()) * 100, 2),
+        }
+        for index in np.argsort(counts)[::-1] if counts[index]
+    ]
+    return {
+        "predictedIndex": predicted_index,
+        "confidence": round(confidence * 100, 2),
+        "scan": {
+            "width": plan.width,
+            "height": plan.height,
+            "tileSize": plan.tile,
+            "stride": plan.stride,
+            "rows": len(plan.ys),
+            "cols": len(plan.xs),
+            "tilesScanned": int(len(labels)),
+            "tilesSkipped": int(plan.keep.size - len(labels)),
+            "affectedFraction": round(float(diseased.mean()), 4),
+            "findings": findings,
+            "heatmap": heatmap,
+        },
+    }
@@ -0,0 +1,314 @@
+"""
+Train the plant disease model from a directory of class folders.
+
+Usage:
+    python train.py PlantVillage/ [--epochs 20] [--batch-size 32] [--version plant_disease_2]
+                    [--cache-dir .train_cache] [--workers 8] [--mixed-precision auto] [--input-only]
+
+Replaces the cells in training.ipynb, which re-decoded every JPEG on every
+epoch, split the data with hard-coded take(604)/skip(76) batch counts and
+saved the model outside the repo. Here:
+
+  - every image is decoded once, in a process pool, with the same
+    preprocessing.decode_image the API uses, into uint8 memmap files under
+    --cache-dir; later runs reuse them as long as the file list is unchanged
+  - tf.data gathers shuffled batches from the memmap, augments each batch as
+    a whole (the notebook's flips and rotation) and prefetches ahead of the model
+  - each file's split comes from a hash of its path, so an image always lands
+    in the same split and new field data never moves old images into training
+  - on a GPU, layers compute in float16 (or bfloat16 with --mixed-precision
+    bfloat16); the softmax stays float32
+  - the result is saved as a float32 .h5 and added to models.json with its
+    class list, ready to shadow or promote
+
+--input-only times one pass over the training input without the model.
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+from preprocessing import IMAGE_SIZE, decode_path
+
+CHANNELS = 3
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+SPLITS = ("train", "val", "test")
+DEFAULT_SPLIT = (0.8, 0.1, 0.1)
+DEFAULT_CACHE_DIR = ".train_cache"
+MODEL_MANIFEST = os.getenv("MODEL_MANIFEST", "models.json")
+# The notebook's augmentation: any flip plus up to 20% of a full turn
+ROTATION_FACTOR = 0.2
+
+
+def class_display_name(directory: str) -> str:
+    """PlantVillage folder names to serving class names: "Tomato___Early_blight" -> "Tomato Early blight"."""
+    return re.sub(r"_+", " ", directory).strip()
+
+
+def split_of(relative_path: str, ratios=DEFAULT_SPLIT) -> str:
+    """Stable split assignment from a hash of the file's path within the dataset."""
+    position = int(hashlib.md5(relative_path.encode("utf-8")).hexdigest()[:8], 16) / 2**32
+    if position < ratios[0]:
+        return "train"
+    return "val" if position < ratios[0] + ratios[1] else "test"
+
+
+def list_dataset(data_dir: str) -> tuple:
+    """(class folder names, [(relative path, label)]) for every image under data_dir/<class>/."""
+    classes = sorted(
+        name for name in os.listdir(data_dir)
+        if os.path.isdir(os.path.join(data_dir, name)) and not name.startswith(".")
+    )
+    items = []
+    for label, name in enumerate(classes):
+        for root, _, files in os.walk(os.path.join(data_dir, name)):
+            for file in sorted(files):
+                if file.lower().endswith(IMAGE_EXTENSIONS):
+                    items.append((os.path.relpath(os.path.join(root, file), data_dir).replace(os.sep, "/"), label))
+    return classes, sorted(items)
+
+
+def _cache_key(data_dir: str, items: list) -> str:
+    digest = hashlib.sha256(f"{IMAGE_SIZE}".encode())
+    for relative_path, label in items:
+        stat = os.stat(os.path.join(data_dir, relative_path))
+        digest.update(f"{relative_path}\0{label}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()[:16]
+
+
+def load_split(data_dir: str, items: list, cache_dir: str, split: str, workers: int = None) -> tuple:
+    """Decoded (images, labels) for one split: an (N, 256, 256, 3) uint8 memmap and an int32 array.
+
+    Decodes in a process pool on the first run; later runs with the same files
+    open the cached memmap directly.
+    """
+    stem = os.path.join(cache_dir, f"{split}-{_cache_key(data_dir, items)}")
+    if not (os.path.exists(stem + ".u8") and os.path.exists(stem + ".labels.npy")):
+        os.makedirs(cache_dir, exist_ok=True)
+        started = time.perf_counter()
+        labels, failed = [], 0
+        paths = [os.path.join(data_dir, relative_path) for relative_path, _ in items]
+        # spawn: decode workers must not inherit TensorFlow's threads; written sequentially, so nothing is held in memory
+        with open(stem + ".u8.tmp", "wb") as out, multiprocessing.get_context("spawn").Pool(workers) as pool:
+            for (relative_path, label), (image, error) in zip(items, pool.imap(decode_path, paths, chunksize=16)):
+                if image is None:
+                    print(f"⚠️  Skipping {relative_path}: {error}")
+                    failed += 1
+                    continue
+                out.write(image.tobytes())
+                labels.append(label)
+        np.save(stem + ".labels.npy", np.array(labels, dtype=np.int32))
+        os.replace(stem + ".u8.tmp", stem + ".u8")
+        print(f"🗂️  Decoded {len(labels)} {split} images in {time.perf_counter() - started:.1f}s"
+              + (f" ({failed} unreadable)" if failed else ""))
+    labels = np.load(stem + ".labels.npy")
+    images = np.memmap(stem + ".u8", dtype=np.uint8, mode="r", shape=(len(labels), IMAGE_SIZE, IMAGE_SIZE, CHANNELS))
+    return images, labels
+
+
+def make_dataset(images: np.ndarray, labels: np.ndarray, batch_size: int, training: bool, seed: int = 0):
+    """Batches of float32 pixels (0-255, as served) and labels; shuffled and augmented for training.
+
+    labels may be any per-image array, e.g. compress_model.py's teacher probabilities.
+    """
+    import tensorflow as tf
+    from tensorflow.keras import layers
+
+    def gather(indices):
+        indices = np.sort(indices)  # forward reads through the memmap; order within a batch doesn't matter
+        return images[indices], labels[indices]
+
+    def load(indices):
+        batch_images, batch_labels = tf.numpy_function(gather, [indices], (tf.uint8, tf.as_dtype(labels.dtype)))
+        batch_images.set_shape((None, IMAGE_SIZE, IMAGE_SIZE, CHANNELS))
+        batch_labels.set_shape((None,) + labels.shape[1:])
+        return tf.cast(batch_images, tf.float32), batch_labels
+
+    dataset = tf.data.Dataset.range(len(labels))
+    if training:
+        dataset = dataset.shuffle(len(labels), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size).map(load, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not training)
+    if training:
+        augmentation = tf.keras.Sequential([
+            layers.RandomFlip("horizontal_and_vertical", seed=seed),
+            layers.RandomRotation(ROTATION_FACTOR, seed=seed),
+        ], name="augmentation")
+        # One call per batch: each image still gets its own random flip and angle
+        dataset = dataset.map(lambda x, y: (augmentation(x, training=True), y), num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def build_model(num_classes: int):
+    """The notebook's CNN. Augmentation lives in the input pipeline, so the saved model needs no stripping."""
+    import tensorflow as tf
+    from tensorflow.keras import layers, models
+
+    return models.Sequential([
+        tf.keras.Input(shape=(IMAGE_SIZE, IMAGE_SIZE, CHANNELS)),
+        layers.Rescaling(1.0 / 255),
+        layers.Conv2D(32, (3, 3), activation="relu"),
+        layers.MaxPooling2D((2, 2)),
+        layers.Conv2D(64, (3, 3), activation="relu"),
+        layers.MaxPooling2D((2, 2)),
+        layers.Conv2D(128, (3, 3), activation="relu"),
+        layers.MaxPooling2D((2, 2)),
+        layers.Conv2D(64, (3, 3), activation="relu"),
+        layers.MaxPooling2D((2, 2)),
+        layers.Conv2D(32, (3, 3), activation="relu"),
+        layers.MaxPooling2D((2, 2)),
+        layers.Flatten(),
+        layers.Dense(64, activation="relu"),
+        # float32 even under mixed precision, so probabilities sum to 1 as the API expects
+        layers.Dense(num_classes, activation="softmax", dtype="float32"),
+    ], name="plant_disease")
+
+
+def precision_policy(mode: str) -> str:
+    import tensorflow as tf
+    if mode == "auto":
+        # float16 only pays off on GPUs; on most CPUs it is slower than float32
+        return "mixed_float16" if tf.config.list_physical_devices("GPU") else "float32"
+    return {"float16": "mixed_float16", "bfloat16": "mixed_bfloat16"}.get(mode, "float32")
+
+
+def next_version_name(manifest: dict) -> str:
+    numbers = [int(m.group(1)) for name in manifest.get("versions", {}) if (m := re.fullmatch(r"plant_disease_(\d+)", name))]
+    return f"plant_disease_{max(numbers, default=0) + 1}"
+
+
+def register_version(manifest_path: str, name: str, model_path: str, class_names: list):
+    """Add the version to models.json without activating it; written atomically since the API watches the file."""
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    manifest.setdefault("versions", {})[name] = {"path": model_path, "classes": class_names}
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.write("\n")
+    os.replace(tmp_path, manifest_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("data_dir", help="Directory with one sub-directory of images per class")
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--learning-rate", type=float, default=1e-3)
+    parser.add_argument("--split", type=float, nargs=3, default=DEFAULT_SPLIT, metavar=("TRAIN", "VAL", "TEST"))
+    parser.add_argument("--patience", type=int, default=5, help="Stop after this many epochs without val accuracy gains (0: never)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Where decoded images are kept between runs")
+    parser.add_argument("--workers", type=int, default=None, help="Decode processes (default: CPU count)")
+    parser.add_argument("--mixed-precision", choices=("auto", "off", "float16", "bfloat16"), default="auto")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--version", help="Version name in models.json (default: the next plant_disease_N)")
+    parser.add_argument("--output", help="Model file (default: <version>.h5)")
+    parser.add_argument("--manifest", default=MODEL_MANIFEST)
+    parser.add_argument("--no-register", action="store_true", help="Don't add the trained model to the manifest")
+    parser.add_argument("--input-only", action="store_true", help="Time one pass over the training input and exit")
+    args = parser.parse_args(argv)
+
+    if abs(sum(args.split) - 1.0) > 1e-6:
+        parser.error("--split fractions must add up to 1")
+    if not os.path.isdir(args.data_dir):
+        print(f"❌ No dataset directory at {args.data_dir}")
+        return 1
+    classes, items = list_dataset(args.data_dir)
+    if len(classes) < 2:
+        print(f"❌ Need at least two class folders in {args.data_dir}, found {len(classes)}")
+        return 1
+    class_names = [class_display_name(name) for name in classes]
+    print(f"🌱 {len(items)} images in {len(classes)} classes")
+
+    by_split = {split: [] for split in SPLITS}
+    for item in items:
+        by_split[split_of(item[0], args.split)].append(item)
+    data = {split: load_split(args.data_dir, by_split[split], args.cache_dir, split, args.workers)
+            for split in SPLITS if by_split[split]}
+    print("   " + ", ".join(f"{split}: {len(labels)}" for split, (_, labels) in data.items()))
+    if "train" not in data:
+        print("❌ The training split is empty")
+        return 1
+
+    import tensorflow as tf
+    tf.keras.utils.set_random_seed(args.seed)
+    train_images, train_labels = data["train"]
+    train_dataset = make_dataset(train_images, train_labels, args.batch_size, training=True, seed=args.seed)
+    val_dataset = make_dataset(*data["val"], args.batch_size, training=False) if "val" in data else None
+
+    if args.input_only:
+        started = time.perf_counter()
+        for _ in train_dataset:
+            pass
+        elapsed = time.perf_counter() - started
+        print(f"⏱️  One pass over the training input: {elapsed:.2f}s ({len(train_labels) / elapsed:.0f} images/s)")
+        return 0
+
+    policy = precision_policy(args.mixed_precision)
+    tf.keras.mixed_precision.set_global_policy(policy)
+    model = build_model(len(classes))
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(args.learning_rate),
+        loss=tf.keras.losses.SparseCategoricalCrossentropy(),
+        metrics=["accuracy"],
+    )
+    print(f"🏋️  Training for up to {args.epochs} epochs ({policy})")
+
+    class EpochTimer(tf.keras.callbacks.Callback):
+        def on_epoch_begin(self, epoch, logs=None):
+            self.started = time.perf_counter()
+
+        def on_epoch_end(self, epoch, logs=None):
+            elapsed = time.perf_counter() - self.started
+            print(f"   epoch {epoch + 1}: {elapsed:.1f}s, {len(train_labels) / elapsed:.0f} images/s")
+
+    callbacks = [EpochTimer()]
+    if args.patience and val_dataset is not None:
+        callbacks.append(tf.keras.callbacks.EarlyStopping(
+            monitor="val_accuracy", patience=args.patience, restore_best_weights=True))
+    history = model.fit(train_dataset, validation_data=val_dataset, epochs=args.epochs, callbacks=callbacks,
+                        shuffle=False, verbose=2)  # the dataset reshuffles itself each epoch
+
+    results = {"history": {name: [float(v) for v in values] for name, values in history.history.items()}}
+    if "test" in data:
+        loss, accuracy = model.evaluate(make_dataset(*data["test"], args.batch_size, training=False), verbose=0)
+        results["test"] = {"loss": float(loss), "accuracy": float(accuracy)}
+        print(f"🧪 Test accuracy {accuracy * 100:.2f}% over {len(data['test'][1])} images")
+
+    # Serving loads float32 weights: rebuild under the float32 policy and copy the trained weights over
+    tf.keras.mixed_precision.set_global_policy("float32")
+    export = build_model(len(classes))
+    export.set_weights(model.get_weights())
+
+    manifest = {}
+    if os.path.exists(args.manifest):
+        with open(args.manifest) as f:
+            manifest = json.load(f)
+    version = args.version or next_version_name(manifest)
+    output = args.output or f"{version}.h5"
+    export.save(output)
+    with open(os.path.splitext(output)[0] + ".training.json", "w") as f:
+        json.dump({
+            "version": version,
+            "classes": class_names,
+            "split": {split: len(labels) for split, (_, labels) in data.items()},
+            "precision": policy,
+            "args": {k: v for k, v in vars(args).items() if k != "data_dir"},
+            **results,
+        }, f, indent=2)
+    print(f"✅ Saved {output}")
+
+    if not args.no_register and os.path.exists(args.manifest):
+        register_version(args.manifest, version, output, class_names)
+        print(f"📋 Added '{version}' to {args.manifest}; set it as \"shadow\" or \"active\" there to serve it")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
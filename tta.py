@@ -0,0 +1,101 @@
+"""
+Test-time augmentation for the uncertain tail of predictions.
+
+When the top score of a normal forward pass is below TTA_CONFIDENCE_THRESHOLD,
+the image is re-scored over flipped, rotated and cropped views and the
+probabilities are averaged with the original pass. All views of all escalated
+images go through the model as one stacked batch, so the extra cost is a
+single forward pass paid only by requests that would otherwise come back
+uncertain. Off by default; set TTA_VIEWS to enable it.
+"""
+
+import os
+import time
+
+import numpy as np
+
+import metrics
+
+TTA_VIEWS = int(os.getenv("TTA_VIEWS", "0"))  # augmented views per escalated image; 0 disables TTA
+TTA_CONFIDENCE_THRESHOLD = float(os.getenv("TTA_CONFIDENCE_THRESHOLD", "0.70"))  # escalate below this top score
+TTA_CROP_FRACTION = float(os.getenv("TTA_CROP_FRACTION", "0.875"))
+
+# Cheapest, most label-preserving views first; each is a numpy view, copied once into the stacked batch
+GEOMETRIC_VIEWS = (
+    lambda image: image[:, ::-1],  # horizontal flip
+    lambda image: image[::-1],  # vertical flip
+    lambda image: np.rot90(image, 1),
+    lambda image: np.rot90(image, 3),
+    lambda image: np.rot90(image, 2),
+)
+CROP_VIEWS = 5  # center, then the four corners
+MAX_VIEWS = len(GEOMETRIC_VIEWS) + CROP_VIEWS
+
+TTA_ESCALATIONS = metrics.REGISTRY.counter(
+    "plantsense_tta_escalations_total",
+    "Uncertain predictions re-scored with test-time augmentation, by outcome",
+    ["outcome"],
+)
+TTA_SECONDS = metrics.REGISTRY.histogram(
+    "plantsense_tta_seconds",
+    "Extra time spent on augmented views for escalated predictions",
+)
+TTA_FORWARD_IMAGES = metrics.REGISTRY.counter(
+    "plantsense_tta_forward_images_total",
+    "Augmented views sent through the model",
+)
+
+
+def should_escalate(probabilities: np.ndarray, views: int = TTA_VIEWS, threshold: float = TTA_CONFIDENCE_THRESHOLD) -> bool:
+    """True when TTA is enabled and the prediction's top score is below the threshold."""
+    return views > 0 and float(np.max(probabilities)) < threshold
+
+
+def _crop_views(images: np.ndarray, count: int) -> np.ndarray:
+    """Zoomed crops resized back to full size with nearest-neighbour indexing: (N, count, H, W, C)."""
+    height, width = images.shape[1:3]
+    crop_h, crop_w = int(height * TTA_CROP_FRACTION), int(width * TTA_CROP_FRACTION)
+    offsets = [
+        ((height - crop_h) // 2, (width - crop_w) // 2),
+        (0, 0), (0, width - crop_w), (height - crop_h, 0), (height - crop_h, width - crop_w),
+    ][:count]
+    rows = np.stack([np.linspace(top, top + crop_h - 1, height).round().astype(np.intp) for top, _ in offsets])
+    cols = np.stack([np.linspace(left, left + crop_w - 1, width).round().astype(np.intp) for _, left in offsets])
+    return images[:, rows[:, :, None], cols[:, None, :]]
+
+
+def augment_views(images: np.ndarray, count: int = TTA_VIEWS) -> np.ndarray:
+    """Stack `count` augmented views of each (H, W, C) image into one (N * count, H, W, C) batch."""
+    count = max(0, min(int(count), MAX_VIEWS))
+    views = np.empty((len(images), count) + images.shape[1:], dtype=images.dtype)
+    geometric = min(count, len(GEOMETRIC_VIEWS))
+    for position in range(geometric):
+        for index, image in enumerate(images):
+            views[index, position] = GEOMETRIC_VIEWS[position](image)
+    if count > geometric:
+        views[:, geometric:] = _crop_views(images, count - geometric)
+    return views.reshape((-1,) + images.shape[1:])
+
+
+async def refine(images: np.ndarray, probabilities: np.ndarray, predict_fn, runner, views: int = TTA_VIEWS) -> np.ndarray:
+    """Average each image's probabilities with those of its augmented views, in one forward pass.
+
+    `images` is (N, H, W, C) and `probabilities` the (N, classes) output of the normal pass;
+    `runner` is the inference pool's `run`, so the pass shares its executor and admission.
+    """
+    started = time.perf_counter()
+    batch = augment_views(images, views)
+    per_image = len(batch) // len(images)
+    outputs = np.asarray(await runner(predict_fn, batch)).reshape(len(images), per_image, -1)
+    refined = (probabilities + outputs.sum(axis=1)) / (per_image + 1)
+
+    TTA_SECONDS.observe(time.perf_counter() - started)
+    TTA_FORWARD_IMAGES.inc(len(batch))
+    for before, after in zip(probabilities, refined):
+        if np.argmax(before) != np.argmax(after):
+            TTA_ESCALATIONS.inc(outcome="changed_class")
+        elif float(np.max(after)) >= TTA_CONFIDENCE_THRESHOLD:
+            TTA_ESCALATIONS.inc(outcome="resolved")
+        else:
+            TTA_ESCALATIONS.inc(outcome="still_uncertain")
+    return refined
@@ -0,0 +1,157 @@
+"""
+Streaming validation of image uploads.
+
+Starlette spools a whole multipart body before the endpoint runs, and
+/predict used to read the entire file and only then compare its length to
+the cap, trusting the client's content_type. UploadLimitMiddleware now
+refuses an oversized body from its Content-Length header, or as soon as a
+chunked body crosses the cap, before it is spooled. read_upload() then pulls
+the file in chunks and sniffs the image header as the first bytes arrive:
+non-images and decompression-bomb resolutions are rejected before any pixel
+is decoded, and accepted bytes are joined once and handed to the decoder.
+"""
+
+import os
+from io import BytesIO
+
+from PIL import Image, UnidentifiedImageError
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+
+from batch_upload import MAX_IMAGE_BYTES
+
+# Declared width x height above this is refused without decoding (50 MP covers current phone sensors)
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(50_000_000)))
+UPLOAD_CHUNK_SIZE = 256 * 1024
+# Multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+NOT_IMAGE_MESSAGE = "File must be an image"
+# Clients that don't know the type (or lie about it); the bytes decide
+GENERIC_CONTENT_TYPES = ("", "application/octet-stream", "binary/octet-stream")
+
+# Magic numbers of the formats the decoder accepts
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+    (b"BM", "BMP"),
+    (b"II*\x00", "TIFF"),
+    (b"MM\x00*", "TIFF"),
+)
+
+
+def size_message(max_bytes: int) -> str:
+    return f"File size must be less than {max_bytes // (1024 * 1024)}MB"
+
+
+class UploadRejected(ValueError):
+    """Raised when an upload is refused before decoding."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def sniff_format(header: bytes):
+    """Image format from the leading magic number, or None."""
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "WEBP"
+    for signature, name in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return name
+    return None
+
+
+def probe_dimensions(data: bytes):
+    """Declared (width, height) from the image header, or None if it isn't in `data` yet."""
+    try:
+        # Image.open only parses the header; pixels are decoded later, on demand
+        with Image.open(BytesIO(data)) as image:
+            return image.size
+    except Image.DecompressionBombError:
+        raise UploadRejected("Image resolution is too large")
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError):
+        return None
+
+
+def check_header(data: bytes, complete: bool, max_pixels: int = MAX_IMAGE_PIXELS) -> bool:
+    """Validate the magic number and declared resolution; False if more bytes are needed to tell."""
+    if len(data) < 12 and not complete:
+        return False
+    if sniff_format(data) is None:
+        raise UploadRejected(NOT_IMAGE_MESSAGE)
+    size = probe_dimensions(data)
+    if size is None:
+        if complete:
+            raise UploadRejected("Error processing image: unreadable or truncated image header")
+        return False
+    width, height = size
+    if width * height > max_pixels:
+        raise UploadRejected(f"Image resolution {width}x{height} exceeds the {max_pixels / 1e6:g} MP limit")
+    return True
+
+
+def check_content_type(content_type: str):
+    content_type = (content_type or "").lower()
+    if not content_type.startswith("image/") and content_type not in GENERIC_CONTENT_TYPES:
+        raise UploadRejected(NOT_IMAGE_MESSAGE)
+
+
+async def read_upload(upload, max_bytes: int = MAX_IMAGE_BYTES, max_pixels: int = MAX_IMAGE_PIXELS) -> bytes:
+    """Read an UploadFile in chunks, enforcing the size cap and image header checks as bytes arrive."""
+    check_content_type(upload.content_type)
+    if upload.size is not None and upload.size > max_bytes:
+        raise UploadRejected(size_message(max_bytes))
+
+    chunks, total = [], 0
+    header_ok, probe_at = False, 0
+    while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+        total += len(chunk)
+        if total > max_bytes:
+            raise UploadRejected(size_message(max_bytes))
+        chunks.append(chunk)
+        # Re-probe only when the buffer has doubled, so a header behind a large EXIF block stays O(n)
+        if not header_ok and total >= probe_at:
+            header_ok = check_header(b"".join(chunks), complete=False, max_pixels=max_pixels)
+            probe_at = total * 2
+
+    data = chunks[0] if len(chunks) == 1 else b"".join(chunks)
+    if not header_ok:
+        check_header(data, complete=True, max_pixels=max_pixels)
+    return data
+
+
+class UploadLimitMiddleware:
+    """Refuse POST bodies over a per-path byte limit before they are spooled."""
+
+    def __init__(self, app, limits: dict):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" and scope["method"] == "POST" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            response = JSONResponse({"detail": size_message(limit)}, status_code=413, headers={"Connection": "close"})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised inside body parsing, where FastAPI turns it into a 413 response
+                    raise HTTPException(status_code=413, detail=size_message(limit))
+            return message
+
+        await self.app(scope, limited_receive, send)